@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 結構化日誌
+access() 和 event() 只把記錄放入有界隊列，不做格式化和文件操作，不阻塞請求處理；
+後台線程把記錄格式化為 JSON 行，分批寫入 LOG_FILE（超過大小時輪換），
+非訪問記錄同時在控制台顯示。隊列已滿時丟棄記錄並計入 fsd_log_dropped_total（只需Python 3標準庫）
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+# 配置（見 .env.example）
+LOG_FILE = os.environ.get("LOG_FILE", "logs/app.log")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "5"))
+LOG_FLUSH_INTERVAL = float(os.environ.get("LOG_FLUSH_INTERVAL", "1.0"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_CONSOLE = os.environ.get("LOG_CONSOLE", "true").lower() == "true"
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+# 每批最多寫入的記錄數
+MAX_BATCH = 1000
+
+_STOP = object()
+
+
+class _Flush:
+    """隊列中的標記：之前的記錄寫入後通知等待者"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class LogWriter:
+    """有界隊列和後台寫入線程；第一次提交記錄時啟動線程"""
+
+    def __init__(self, path=LOG_FILE, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 flush_interval=LOG_FLUSH_INTERVAL, queue_size=LOG_QUEUE_SIZE, console=LOG_CONSOLE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.console = console
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._file = None
+
+    def submit(self, entry):
+        """放入隊列，不等待；隊列已滿時丟棄"""
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            metrics.LOG_DROPPED.inc()
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def flush(self, timeout=5.0):
+        """等待已提交的記錄寫入；成功返回True"""
+        if self._thread is None:
+            return True
+        marker = _Flush()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """寫入剩餘記錄後停止線程並關閉文件"""
+        thread = self._thread
+        if thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # 收集一批記錄：到達批次上限、等待超過 flush_interval 或遇到標記時寫入
+            while len(batch) < MAX_BATCH and not isinstance(batch[-1], _Flush) and batch[-1] is not _STOP:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            entries = [item for item in batch if isinstance(item, dict)]
+            if entries:
+                self._write(entries)
+            for item in batch:
+                if isinstance(item, _Flush):
+                    item.done.set()
+            if batch[-1] is _STOP:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, entries):
+        lines = []
+        for entry in entries:
+            at = entry.pop("ts")
+            line = {"ts": datetime.fromtimestamp(at).isoformat(timespec="milliseconds")}
+            line.update(entry)
+            lines.append(json.dumps(line, ensure_ascii=False, default=str) + "\n")
+            if self.console and line.get("event") != "access":
+                print(f"[{datetime.fromtimestamp(at).strftime('%H:%M:%S')}] {line.get('message', '')}")
+        if not self.path:
+            return
+        data = "".join(lines).encode("utf-8")
+        try:
+            self._rotate_if_needed(len(data))
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "ab")
+            self._file.write(data)
+            self._file.flush()
+            self.written += len(entries)
+        except OSError as e:
+            self.dropped += len(entries)
+            metrics.LOG_DROPPED.inc(len(entries))
+            if self.console:
+                print(f"[{time.strftime('%H:%M:%S')}] ⚠️ 寫入日誌文件失敗: {e}")
+
+    def _rotate_if_needed(self, incoming):
+        """寫入後超過 max_bytes 時輪換：app.log -> app.log.1 -> app.log.2 ...（最多 backup_count 個）"""
+        if self.max_bytes <= 0:
+            return
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size == 0 or size + incoming <= self.max_bytes:
+            return
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+writer = LogWriter()
+atexit.register(writer.close)
+
+
+def enabled(level):
+    return LEVELS.get(level, 20) >= LEVELS.get(LOG_LEVEL, 20)
+
+
+def access(method, path, route, status, size, seconds, cache=None, client=None):
+    """一次HTTP請求：路由、狀態碼、響應字節數、處理時間和所用數據的緩存狀態"""
+    if enabled("INFO"):
+        writer.submit({"ts": time.time(), "level": "INFO", "event": "access", "method": method, "path": path,
+                       "route": route, "status": status, "bytes": size, "ms": round(seconds * 1000, 3),
+                       "cache": cache, "client": client})
+
+
+def event(level, message, **fields):
+    """應用事件（例如數據層刷新），message 同時顯示在控制台"""
+    if enabled(level):
+        entry = {"ts": time.time(), "level": level, "event": "message", "message": message}
+        entry.update(fields)
+        writer.submit(entry)
+
+
+def flush(timeout=5.0):
+    return writer.flush(timeout)
@@ -6,11 +6,25 @@
 
 import streamlit as st
 import pandas as pd
-import requests
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+import os
 import folium
-from streamlit_folium import folium_static
+import streamlit.components.v1 as components
+
+from incident_pipeline import DEFAULT_OUTPUT as INCIDENT_AGGREGATES_PATH, load_result, result_frames
+from station_distances import build_backup_index, backups_for
+from projection import EASTING_COLUMN, NORTHING_COLUMN, add_grid_columns
+from district_check import load_districts, verify_districts, MISMATCH_COLUMN, COMPUTED_COLUMN
+from colocation import find_sites, site_summary
+from layers import LAYERS
+from refresh import coordinator, describe_freshness, COOLDOWN, FAILED
+import snapshots
+import tracing
+from snapshots import store as snapshot_store, KIND_LABELS
+from resilient_fetch import FetchError
+import cache_backend
+from tile_cache import TileFetcher, TILE_ZOOM, shared_cache as tile_cache, viewport_bbox
 
 # 設置頁面配置
 st.set_page_config(
@@ -20,138 +34,259 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# API端點
-AMBULANCE_API = "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634799003993_7633/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=AmbDepots&outputFormat=geojson"
-FIRE_STATION_API = "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634798867463_89696/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=FireStations&outputFormat=geojson"
-
 # 香港中心坐標
 HK_CENTER = [22.3193, 114.1694]
 
-@st.cache_data(ttl=3600)  # 緩存1小時
-def fetch_ambulance_data():
-    """獲取救護站數據"""
-    try:
-        response = requests.get(AMBULANCE_API, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        records = []
-        for feature in data.get("features", []):
-            props = feature.get("properties", {})
-            records.append({
-                "ID": props.get("OBJECTID"),
-                "消防處編號": props.get("FSDID"),
-                "名稱": props.get("Name_TC"),
-                "英文名稱": props.get("Name_ENG"),
-                "地址": props.get("Address_TC"),
-                "英文地址": props.get("Address_ENG"),
-                "地區": props.get("District_TC"),
-                "英文地區": props.get("District_ENG"),
-                "電話": props.get("Telephone"),
-                "緯度": props.get("Latitude"),
-                "經度": props.get("Longitude"),
-                "類型": "救護站"
-            })
-        
-        df = pd.DataFrame(records)
-        df = df.dropna(subset=['名稱', '地區', '緯度', '經度']).fillna('')
-        return df
-    except Exception as e:
-        st.error(f"獲取救護站數據失敗: {e}")
+# 站點數據緩存時間（秒），取各數據層TTL中最短的
+DATA_TTL_SECONDS = min(layer.ttl for layer in LAYERS.values())
+
+# 數據層記錄字段 -> 表格列名
+COLUMN_NAMES = {
+    "id": "ID",
+    "fsd_id": "消防處編號",
+    "name": "名稱",
+    "name_en": "英文名稱",
+    "address": "地址",
+    "address_en": "英文地址",
+    "district": "地區",
+    "district_en": "英文地區",
+    "phone": "電話",
+    "lat": "緯度",
+    "lng": "經度"
+}
+
+# 地圖大小（像素），用於計算可見範圍
+MAP_WIDTH = 1200
+MAP_HEIGHT = 600
+
+# 每個會話保留最近幾次運行的追蹤，用於導出 Chrome trace
+TRACE_HISTORY = 20
+
+def station_frame(records, label):
+    """把數據層記錄整理為站點DataFrame"""
+    if not records:
         return pd.DataFrame()
+    df = pd.DataFrame(records).rename(columns=COLUMN_NAMES)
+    df["類型"] = label
+    return df.dropna(subset=['名稱', '地區', '緯度', '經度']).fillna('').reset_index(drop=True)
 
-@st.cache_data(ttl=3600)
-def fetch_fire_station_data():
-    """獲取消防局數據"""
-    try:
-        response = requests.get(FIRE_STATION_API, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        records = []
-        for feature in data.get("features", []):
-            props = feature.get("properties", {})
-            records.append({
-                "ID": props.get("OBJECTID"),
-                "消防處編號": props.get("FSDID"),
-                "名稱": props.get("Name_TC"),
-                "英文名稱": props.get("Name_ENG"),
-                "地址": props.get("Address_TC"),
-                "英文地址": props.get("Address_ENG"),
-                "地區": props.get("District_TC"),
-                "英文地區": props.get("District_ENG"),
-                "電話": props.get("Telephone"),
-                "緯度": props.get("Latitude"),
-                "經度": props.get("Longitude"),
-                "類型": "消防局"
-            })
-        
-        df = pd.DataFrame(records)
-        df = df.dropna(subset=['名稱', '地區', '緯度', '經度']).fillna('')
+def load_station_layer(name, force=False):
+    """從上游獲取一個站點數據層（失敗時拋出異常，由刷新協調器保留舊快照）
+
+    經共享數據緩存（cache_backend）獲取：其他副本或入口剛獲取過的記錄直接使用，
+    只有一個進程請求上游；force=True（手動刷新）時忽略緩存。
+    """
+    layer = LAYERS[name]
+    with tracing.span("上游獲取") as span:
+        records = layer.fetch_cached(cache_backend.backend(), 0 if force else None).value
+        span.set(records=len(records))
+    # 內容有變化時保存歷史快照（只寫入差異）
+    with tracing.span("保存歷史快照"):
+        snapshots.record(name, records)
+    with tracing.span("構建DataFrame"):
+        df = station_frame(records, layer.label)
+    if df.empty:
         return df
+    # 投影到HK1980方格網（每次刷新只轉換一次）
+    with tracing.span("投影"):
+        df = add_grid_columns(df)
+    # 用本地地區邊界核對 District_TC（沒有邊界文件時跳過）
+    with tracing.span("地區核對"):
+        districts = load_districts()
+        if districts is not None:
+            df = verify_districts(df, districts)
+    return df
+
+def fetch_station_layer(name):
+    """獲取站點數據層（進程內共享快照，按數據層的TTL緩存）"""
+    try:
+        with tracing.span(f"加載{LAYERS[name].label}"):
+            return coordinator.get(name, lambda: load_station_layer(name), ttl=LAYERS[name].ttl)
     except Exception as e:
-        st.error(f"獲取消防局數據失敗: {e}")
+        st.error(f"獲取{LAYERS[name].label}數據失敗: {e}")
         return pd.DataFrame()
 
-def create_interactive_map(ambulance_df, fire_station_df, zoom=11):
-    """創建交互式Folium地圖"""
-    try:
-        # 創建地圖
-        m = folium.Map(location=HK_CENTER, zoom_start=zoom, tiles='CartoDB positron')
-        
-        # 添加救護站標記
-        if not ambulance_df.empty:
-            for idx, row in ambulance_df.iterrows():
-                popup_html = f"""
-                <div style="font-family: Arial, sans-serif; min-width: 250px;">
-                    <h4 style="color: #1f77b4; margin-bottom: 10px;">🚑 {row['名稱']}</h4>
-                    <p><strong>類型:</strong> 救護站</p>
+@tracing.traced("加載可見範圍瓦片")
+def load_viewport_stations(center, zoom, layers):
+    """地圖可見範圍內的站點，按瓦片獲取並緩存，返回 {數據層: DataFrame}
+
+    移動或縮放地圖時只請求以前沒見過的瓦片。
+    """
+    bbox = viewport_bbox(center, zoom, MAP_WIDTH, MAP_HEIGHT)
+    frames = {}
+    for name in layers:
+        layer = LAYERS[name]
+        fetcher = TileFetcher(name, layer.url, layer.record, key=lambda record: record["id"],
+                              fields=tuple(layer.fields.values()))
+        frames[name] = station_frame(fetcher.records_in_bbox(bbox), layer.label)
+    return frames
+
+@tracing.traced("後備站點排名")
+@st.cache_data(ttl=DATA_TTL_SECONDS)
+def compute_backup_index(fire_station_df, ambulance_df):
+    """每次數據刷新計算一次後備站點排名（行號對應傳入DataFrame的位置）"""
+    return build_backup_index(
+        fire_station_df['緯度'].astype(float), fire_station_df['經度'].astype(float),
+        ambulance_df['緯度'].astype(float) if not ambulance_df.empty else [],
+        ambulance_df['經度'].astype(float) if not ambulance_df.empty else []
+    )
+
+@tracing.traced("後備站點")
+def show_backup_stations(fire_station_df, ambulance_df):
+    """顯示所選消防局的後備消防局和救護站"""
+    fire_station_df = fire_station_df.reset_index(drop=True)
+    ambulance_df = ambulance_df.reset_index(drop=True)
+    index = compute_backup_index(fire_station_df, ambulance_df)
+    
+    row = st.selectbox(
+        "選擇消防局查看後備站點",
+        options=range(len(fire_station_df)),
+        format_func=lambda i: f"{fire_station_df.at[i, '名稱']} ({fire_station_df.at[i, '地區']})",
+        key="backup_station"
+    )
+    ranked = backups_for(index, row, limit=5)
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**🚒 後備消防局**")
+        backup_fire = fire_station_df.iloc[[j for j, _ in ranked['fire_station']]][['名稱', '地區']].copy()
+        backup_fire['距離 (公里)'] = [round(d, 2) for _, d in ranked['fire_station']]
+        st.dataframe(backup_fire.reset_index(drop=True), use_container_width=True)
+    with col2:
+        st.markdown("**🚑 最近救護站**")
+        if ambulance_df.empty:
+            st.info("未加載救護站數據")
+        else:
+            backup_amb = ambulance_df.iloc[[j for j, _ in ranked['ambulance']]][['名稱', '地區']].copy()
+            backup_amb['距離 (公里)'] = [round(d, 2) for _, d in ranked['ambulance']]
+            st.dataframe(backup_amb.reset_index(drop=True), use_container_width=True)
+
+@st.cache_data
+def load_incident_aggregates(path, mtime):
+    """加載歷史事故聚合結果（mtime作為緩存鍵，文件更新後自動重新加載）"""
+    result = load_result(path)
+    if result is None:
+        return None
+    return result, result_frames(result)
+
+@tracing.traced("事故統計")
+def show_incident_aggregates():
+    """顯示歷史事故統計（由 incident_pipeline.py 預先生成）"""
+    if not os.path.exists(INCIDENT_AGGREGATES_PATH):
+        return
+    
+    loaded = load_incident_aggregates(
+        INCIDENT_AGGREGATES_PATH, os.path.getmtime(INCIDENT_AGGREGATES_PATH)
+    )
+    if loaded is None:
+        return
+    result, (by_station, by_district, by_hour) = loaded
+    
+    st.header("🚨 歷史事故統計")
+    st.caption(f"生成時間: {result['generated_at']} • 來源: {', '.join(result['sources'])}")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("事故總數", result['total_incidents'])
+    with col2:
+        st.metric("無法對應事故", result['unmatched'])
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("按地區")
+        st.bar_chart(by_district.set_index('地區'))
+    with col2:
+        st.subheader("按時段")
+        st.bar_chart(by_hour.set_index('時段'))
+    
+    st.subheader("按站點")
+    st.dataframe(by_station, use_container_width=True, height=300)
+
+# 各圖層在地圖上的樣式
+MARKER_STYLES = {
+    'ambulance': {'label': '救護站', 'emoji': '🚑', 'color': '#1f77b4', 'icon_color': 'blue', 'icon': 'plus'},
+    'fire_station': {'label': '消防局', 'emoji': '🚒', 'color': '#d62728', 'icon_color': 'red', 'icon': 'fire'},
+}
+
+@tracing.traced("共用站址")
+@st.cache_data(ttl=DATA_TTL_SECONDS)
+def compute_sites(ambulance_df, fire_station_df):
+    """每次數據刷新計算一次共用站址（行號對應DataFrame的位置）"""
+    points = []
+    for layer, df in (('fire_station', fire_station_df), ('ambulance', ambulance_df)):
+        if df.empty:
+            continue
+        if EASTING_COLUMN not in df.columns:
+            df = add_grid_columns(df.copy())
+        columns = zip(df['緯度'].astype(float), df['經度'].astype(float), df[EASTING_COLUMN], df[NORTHING_COLUMN])
+        for row, (lat, lng, easting, northing) in enumerate(columns):
+            points.append((layer, row, lat, lng, easting, northing))
+    return find_sites(points)
+
+def station_popup_section(row, layer):
+    """單個站點的彈出框內容"""
+    style = MARKER_STYLES[layer]
+    return f"""
+                    <h4 style="color: {style['color']}; margin-bottom: 10px;">{style['emoji']} {row['名稱']}</h4>
+                    <p><strong>類型:</strong> {style['label']}</p>
                     <p><strong>地址:</strong> {row['地址']}</p>
                     <p><strong>地區:</strong> {row['地區']}</p>
                     <p><strong>電話:</strong> {row['電話']}</p>
                     <p><strong>消防處編號:</strong> {row['消防處編號']}</p>
-                    <p><small>坐標: {row['緯度']:.6f}, {row['經度']:.6f}</small></p>
-                </div>
-                """
-                
-                folium.Marker(
-                    location=[row['緯度'], row['經度']],
-                    popup=folium.Popup(popup_html, max_width=300),
-                    tooltip=f"救護站: {row['名稱']}",
-                    icon=folium.Icon(color='blue', icon='plus', prefix='fa')
-                ).add_to(m)
+                    <p><small>坐標: {row['緯度']:.6f}, {row['經度']:.6f}</small></p>"""
+
+@tracing.traced("創建地圖")
+def create_interactive_map(ambulance_df, fire_station_df, zoom=11, sites=None, center=HK_CENTER):
+    """創建交互式Folium地圖
+
+    sites 為 compute_sites 的結果；同一站址的多個站點只畫一個標記。
+    """
+    try:
+        # 創建地圖
+        m = folium.Map(location=center, zoom_start=zoom, tiles='CartoDB positron')
         
-        # 添加消防局標記
-        if not fire_station_df.empty:
-            for idx, row in fire_station_df.iterrows():
-                popup_html = f"""
-                <div style="font-family: Arial, sans-serif; min-width: 250px;">
-                    <h4 style="color: #d62728; margin-bottom: 10px;">🚒 {row['名稱']}</h4>
-                    <p><strong>類型:</strong> 消防局</p>
-                    <p><strong>地址:</strong> {row['地址']}</p>
-                    <p><strong>地區:</strong> {row['地區']}</p>
-                    <p><strong>電話:</strong> {row['電話']}</p>
-                    <p><strong>消防處編號:</strong> {row['消防處編號']}</p>
-                    <p><small>坐標: {row['緯度']:.6f}, {row['經度']:.6f}</small></p>
+        frames = {
+            'ambulance': ambulance_df.reset_index(drop=True),
+            'fire_station': fire_station_df.reset_index(drop=True)
+        }
+        if sites is None:
+            sites = compute_sites(ambulance_df, fire_station_df)
+        
+        for site in sites:
+            members = [(layer, frames[layer].iloc[row]) for layer, row in site['members']]
+            sections = "".join(station_popup_section(row, layer) for layer, row in members)
+            popup_html = f"""
+                <div style="font-family: Arial, sans-serif; min-width: 250px;">{sections}
                 </div>
                 """
-                
-                folium.Marker(
-                    location=[row['緯度'], row['經度']],
-                    popup=folium.Popup(popup_html, max_width=300),
-                    tooltip=f"消防局: {row['名稱']}",
-                    icon=folium.Icon(color='red', icon='fire', prefix='fa')
-                ).add_to(m)
+            
+            if len(members) == 1:
+                layer, row = members[0]
+                style = MARKER_STYLES[layer]
+                tooltip = f"{style['label']}: {row['名稱']}"
+                icon = folium.Icon(color=style['icon_color'], icon=style['icon'], prefix='fa')
+            else:
+                # 共用站址：一個標記列出所有站點
+                tooltip = " / ".join(f"{MARKER_STYLES[layer]['label']}: {row['名稱']}" for layer, row in members)
+                icon = folium.Icon(color='purple', icon='building', prefix='fa')
+            
+            folium.Marker(
+                location=[site['lat'], site['lng']],
+                popup=folium.Popup(popup_html, max_width=300),
+                tooltip=tooltip,
+                icon=icon
+            ).add_to(m)
         
         # 添加圖例
         legend_html = '''
         <div style="position: fixed; 
-                    bottom: 50px; left: 50px; width: 160px; height: 110px; 
+                    bottom: 50px; left: 50px; width: 160px; height: 135px; 
                     background-color: white; border:2px solid grey; z-index:9999; 
                     font-size:14px; padding: 10px; border-radius: 5px;">
             <p style="margin: 0 0 5px 0;"><strong>圖例</strong></p>
             <p style="margin: 5px 0;"><span style="color: blue;">●</span> 救護站</p>
             <p style="margin: 5px 0;"><span style="color: red;">●</span> 消防局</p>
+            <p style="margin: 5px 0;"><span style="color: purple;">●</span> 共用站址</p>
             <p style="margin: 5px 0; font-size: 12px; color: #666;">點擊標記查看詳情</p>
         </div>
         '''
@@ -162,8 +297,145 @@ def create_interactive_map(ambulance_df, fire_station_df, zoom=11):
         st.error(f"創建地圖失敗: {e}")
         return None
 
-def main():
-    """主函數"""
+@tracing.traced("地區核對結果")
+def show_district_mismatches(*dfs):
+    """列出WFS地區字段與坐標實際所在地區不一致的站點"""
+    frames = [df for df in dfs if not df.empty and MISMATCH_COLUMN in df.columns]
+    if not frames:
+        return
+    
+    mismatched = pd.concat([df[df[MISMATCH_COLUMN]] for df in frames])
+    if mismatched.empty:
+        return
+    
+    with st.expander(f"⚠️ 地區核對: {len(mismatched)} 個站點的地區與坐標不符"):
+        table = mismatched[['類型', '名稱', '地區', COMPUTED_COLUMN]].copy()
+        table[COMPUTED_COLUMN] = table[COMPUTED_COLUMN].astype(object).fillna('（不在任何地區內）')
+        st.dataframe(table.reset_index(drop=True), use_container_width=True)
+
+def format_snapshot_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M')
+
+def format_change(value):
+    """變化前後的值：坐標顯示為 緯度, 經度，字段變化顯示為 字段: 值"""
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ', '.join('' if v is None else f"{v:.5f}" for v in value)
+    if isinstance(value, dict):
+        return '; '.join(f"{COLUMN_NAMES.get(field, field)}: {v}" for field, v in value.items())
+    return str(value)
+
+@tracing.traced("變更記錄")
+def show_change_log():
+    """顯示站點變更記錄，並可查看某一快照時的站點（由 snapshots.py 保存）"""
+    timelines = {name: snapshot_store.timeline(name) for name in LAYERS}
+    if not any(timelines.values()):
+        return
+    
+    st.header("📜 變更記錄")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        name = st.selectbox("數據層", [name for name in LAYERS if timelines[name]],
+                            format_func=lambda name: LAYERS[name].label, key="history_layer")
+    with col2:
+        days = st.selectbox("時間範圍", [1, 7, 30, 365], index=2,
+                            format_func=lambda days: f"最近 {days} 天", key="history_days")
+    
+    stats = snapshot_store.stats(name)
+    st.caption(f"{stats['snapshots']} 個快照 • {stats['checkpoints']} 個檢查點 • "
+               f"{stats['bytes'] / 1024:.1f} KB • 首個快照: {format_snapshot_time(timelines[name][0])}")
+    
+    events = snapshot_store.changes(name, since=(datetime.now() - timedelta(days=days)).timestamp())
+    if events:
+        st.dataframe(pd.DataFrame([{
+            '時間': format_snapshot_time(event['t']),
+            '變化': KIND_LABELS[event['kind']],
+            '消防處編號': event['key'],
+            '名稱': event['name'] or '',
+            '變化前': format_change(event['before']),
+            '變化後': format_change(event['after']),
+        } for event in reversed(events)]), use_container_width=True, height=300)
+    else:
+        st.info(f"最近 {days} 天沒有變化")
+    
+    timeline = timelines[name]
+    with st.expander("🕰️ 查看某一快照時的站點"):
+        at = timeline[-1] if len(timeline) == 1 else st.select_slider(
+            "快照時間", options=timeline, value=timeline[-1],
+            format_func=format_snapshot_time, key="history_at")
+        past = station_frame(snapshot_store.state_at(name, at), LAYERS[name].label)
+        st.markdown(f"**{format_snapshot_time(at)}**: {len(past)} 個{LAYERS[name].label}")
+        if not past.empty:
+            st.dataframe(past[['名稱', '地址', '地區', '電話']], use_container_width=True, height=300)
+
+def show_map(map_obj):
+    """在頁面中顯示地圖（與 folium_static 相同），分別記錄序列化和發送的耗時，返回HTML字節數"""
+    with tracing.span("地圖HTML序列化") as span:
+        html = folium.Figure().add_child(map_obj).render()
+        size = len(html.encode('utf-8'))
+        span.set(bytes=size)
+    with tracing.span("發送地圖"):
+        components.html(html, height=MAP_HEIGHT + 10, width=MAP_WIDTH)
+    return size
+
+def show_performance_panel(trace):
+    """側邊欄「性能」面板：本次運行各階段的耗時和地圖HTML大小，可導出最近幾次運行的 Chrome trace"""
+    history = st.session_state.setdefault('traces', [])
+    history.append(trace)
+    del history[:-TRACE_HISTORY]
+    
+    stages = trace.stages()
+    map_bytes = next((stage['args']['bytes'] for stage in stages if 'bytes' in stage['args']), None)
+    with st.sidebar:
+        with st.expander("⏱️ 性能"):
+            st.markdown(f"**本次運行:** {trace.seconds * 1000:.0f} 毫秒")
+            if map_bytes is not None:
+                st.markdown(f"**地圖HTML:** {map_bytes / 1024:.0f} KB")
+            if stages:
+                st.dataframe(pd.DataFrame([{
+                    '階段': '\u3000' * stage['depth'] + stage['name'],
+                    '毫秒': round(stage['ms'], 1),
+                } for stage in stages]), use_container_width=True)
+            st.download_button(
+                "📥 導出 Chrome trace",
+                json.dumps(tracing.chrome_trace(history), ensure_ascii=False),
+                file_name=f"trace-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json",
+                mime="application/json",
+                help=f"最近 {len(history)} 次運行，用 chrome://tracing 或 ui.perfetto.dev 打開"
+            )
+
+def select_map_center(*dfs):
+    """側邊欄選擇地圖中心：全港或某個地區的站點中心"""
+    frames = [df for df in dfs if not df.empty]
+    if not frames:
+        return HK_CENTER
+    stations = pd.concat([df[['地區', '緯度', '經度']] for df in frames])
+    district = st.selectbox("地圖中心", ["全港"] + sorted(stations['地區'].unique()))
+    if district == "全港":
+        return HK_CENTER
+    selected = stations[stations['地區'] == district]
+    return [float(selected['緯度'].astype(float).mean()), float(selected['經度'].astype(float).mean())]
+
+def refresh_station_layers():
+    """手動刷新站點數據
+
+    多個會話同時刷新只會發出一次上游請求；只替換站點數據的快照，
+    新數據準備好之前其他會話繼續顯示舊數據。
+    """
+    statuses = coordinator.refresh_many({
+        name: (lambda name=name: load_station_layer(name, force=True)) for name in LAYERS
+    })
+    if COOLDOWN in statuses.values():
+        st.info("數據剛剛刷新過，請稍後再試")
+    elif FAILED in statuses.values():
+        st.warning("部分數據刷新失敗，繼續顯示上次的數據")
+    else:
+        st.success("數據已刷新")
+
+def show_dashboard():
+    """顯示儀表板"""
     # 頁面標題
     st.title("🚒 香港消防處服務儀表板")
     st.markdown("顯示香港救護站和消防局的實時數據")
@@ -178,17 +450,23 @@ def main():
         map_zoom = st.slider("地圖縮放級別", 9, 15, 11)
         
         if st.button("🔄 刷新數據"):
-            st.cache_data.clear()
-            st.rerun()
+            refresh_station_layers()
         
         st.markdown("---")
         st.markdown("**數據來源:** 香港政府地理數據平台")
-        st.markdown(f"**最後更新:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
-    # 加載數據
+    # 加載數據（只有首次加載需要等待；快照過期時先顯示舊數據，後台刷新）
     with st.spinner("正在加載數據..."):
-        ambulance_df = fetch_ambulance_data() if show_ambulance else pd.DataFrame()
-        fire_station_df = fetch_fire_station_data() if show_fire_stations else pd.DataFrame()
+        ambulance_df = fetch_station_layer('ambulance') if show_ambulance else pd.DataFrame()
+        fire_station_df = fetch_station_layer('fire_station') if show_fire_stations else pd.DataFrame()
+    
+    # 數據新鮮度（數據獲取時間，而非頁面渲染時間）
+    freshness = describe_freshness(
+        coordinator.freshness(list(LAYERS), ttl=DATA_TTL_SECONDS)
+    )
+    with st.sidebar:
+        st.markdown(f"**數據時間:** {freshness}")
+        map_center = select_map_center(ambulance_df, fire_station_df)
     
     # 顯示統計摘要 - 使用Streamlit原生metrics
     st.header("📈 統計摘要")
@@ -203,20 +481,46 @@ def main():
         fire_station_count = len(fire_station_df) if not fire_station_df.empty else 0
         st.metric("消防局總數", fire_station_count)
     
+    # 共用站址只計算一次，避免重複計數
+    sites = compute_sites(ambulance_df, fire_station_df)
+    summary = site_summary(sites)
+    
     with col3:
-        total_count = ambulance_count + fire_station_count
-        st.metric("總服務點數", total_count)
+        st.metric("總服務點數", summary['sites'],
+                  help=f"其中 {summary['shared_sites']} 個站址同時設有消防局和救護站")
+    
+    show_district_mismatches(ambulance_df, fire_station_df)
+    
+    # 歷史事故統計
+    show_incident_aggregates()
     
     # 顯示交互式地圖
     st.header("🗺️ 交互式地圖")
     
     if (not ambulance_df.empty or not fire_station_df.empty):
         with st.spinner("正在生成地圖..."):
-            map_obj = create_interactive_map(ambulance_df, fire_station_df, zoom=map_zoom)
+            map_ambulance_df, map_fire_station_df, map_sites = ambulance_df, fire_station_df, sites
+            # 放大後只按可見範圍的瓦片加載要素很多的數據層；站點數據層總是顯示完整記錄，
+            # 地圖是靜態HTML，拖動到可見範圍以外時仍然能看到所有站點
+            layers = [layer for layer, df in (('ambulance', ambulance_df), ('fire_station', fire_station_df))
+                      if not df.empty and LAYERS[layer].tiled]
+            if map_zoom >= TILE_ZOOM and layers:
+                try:
+                    viewport = load_viewport_stations(map_center, map_zoom, layers)
+                    map_ambulance_df = viewport.get('ambulance', ambulance_df)
+                    map_fire_station_df = viewport.get('fire_station', fire_station_df)
+                    map_sites = compute_sites(map_ambulance_df, map_fire_station_df)
+                except FetchError as e:
+                    st.warning(f"按範圍加載地圖數據失敗，顯示全部站點: {e}")
+                hits = tile_cache.hits
+                st.caption(f"地圖瓦片緩存: 內存命中 {hits['memory']} • 磁盤命中 {hits['disk']} • 上游請求 {hits['miss']}")
+            
+            map_obj = create_interactive_map(map_ambulance_df, map_fire_station_df, zoom=map_zoom,
+                                             sites=map_sites, center=map_center)
             
             if map_obj:
                 # 顯示地圖
-                folium_static(map_obj, width=1200, height=600)
+                show_map(map_obj)
                 
                 st.markdown("""
                 **地圖使用說明:**
@@ -252,11 +556,12 @@ def main():
             st.success(f"找到 {len(filtered_amb)} 個救護站")
         
         # 顯示表格
-        st.dataframe(
-            filtered_amb[['名稱', '地址', '地區', '電話']].reset_index(drop=True),
-            use_container_width=True,
-            height=300
-        )
+        with tracing.span("救護站表格", rows=len(filtered_amb)):
+            st.dataframe(
+                filtered_amb[['名稱', '地址', '地區', '電話']].reset_index(drop=True),
+                use_container_width=True,
+                height=300
+            )
     
     # 消防局數據
     if not fire_station_df.empty:
@@ -277,19 +582,33 @@ def main():
             st.success(f"找到 {len(filtered_fire)} 個消防局")
         
         # 顯示表格
-        st.dataframe(
-            filtered_fire[['名稱', '地址', '地區', '電話']].reset_index(drop=True),
-            use_container_width=True,
-            height=300
-        )
+        with tracing.span("消防局表格", rows=len(filtered_fire)):
+            st.dataframe(
+                filtered_fire[['名稱', '地址', '地區', '電話']].reset_index(drop=True),
+                use_container_width=True,
+                height=300
+            )
+        
+        # 後備站點
+        st.subheader("🛟 後備站點")
+        show_backup_stations(fire_station_df, ambulance_df)
+    
+    # 站點變更記錄
+    show_change_log()
     
     # 頁腳
     st.markdown("---")
     st.markdown(f"""
     <div style="text-align: center; color: gray;">
-        <p>香港消防處服務儀表板 • 最後更新: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
+        <p>香港消防處服務儀表板 • 數據時間: {freshness}</p>
     </div>
     """, unsafe_allow_html=True)
 
+def main():
+    """主函數（每次運行記錄一個追蹤，顯示在側邊欄的「性能」面板）"""
+    with tracing.trace("app.py") as trace:
+        show_dashboard()
+        show_performance_panel(trace)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務查看器 - asyncio 服務器
+與 start_server.py 的路由和查詢參數相同（共用 start_server.handle_request），但每個連接是一個協程
+而不是一個線程：非阻塞解析請求、HTTP/1.1 保持連接、空閒超時，收到 SIGINT/SIGTERM 時停止接受新連接，
+關閉空閒連接並等待進行中的請求完成。數據層按TTL刷新的調度在事件循環中作為異步任務運行，
+獲取本身仍在調度器的工作線程中進行（上游獲取是同步代碼）。適合大量輪詢的牆上顯示屏和手機
+（只需Python 3標準庫）
+
+用法:
+    python async_server.py [端口]
+"""
+
+import asyncio
+import email.utils
+import http
+import os
+import signal
+import sys
+import time
+import weakref
+
+import access_log
+import cache_backend
+import metrics
+import start_server
+
+try:
+    import resource
+except ImportError:
+    # Windows 沒有 resource 模塊，使用系統默認的文件描述符上限
+    resource = None
+
+# 配置（見 .env.example）
+ASYNC_KEEPALIVE_SECONDS = float(os.environ.get("ASYNC_KEEPALIVE_SECONDS", "75"))
+ASYNC_SHUTDOWN_SECONDS = float(os.environ.get("ASYNC_SHUTDOWN_SECONDS", "10"))
+ASYNC_BACKLOG = int(os.environ.get("ASYNC_BACKLOG", "2048"))
+
+# 請求行和頭部的最大字節數
+MAX_HEADER_BYTES = 64 * 1024
+# GET 請求帶有的內容最多讀取並丟棄的字節數
+MAX_BODY_BYTES = 1024 * 1024
+
+_servers = weakref.WeakSet()
+
+
+def open_connections():
+    """{(狀態,): 連接數}（/metrics）"""
+    busy = idle = 0
+    for server in list(_servers):
+        for active in list(server.connections.values()):
+            if active:
+                busy += 1
+            else:
+                idle += 1
+    return {('busy',): busy, ('idle',): idle}
+
+
+OPEN_CONNECTIONS = metrics.Gauge("fsd_open_connections", "async_server.py 打開的連接數", ("state",),
+                                 callback=open_connections)
+
+
+class Headers(dict):
+    """請求頭（名稱不區分大小寫）"""
+
+    def get(self, name, default=None):
+        return super().get(name.lower(), default)
+
+
+def parse_request(head):
+    """解析請求行和頭部，返回 (方法, 路徑, 版本, Headers)；格式錯誤時拋出 ValueError"""
+    lines = head.decode('latin-1').split('\r\n')
+    parts = lines[0].split()
+    if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+        raise ValueError(f"無效的請求行: {lines[0][:100]!r}")
+    headers = Headers()
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, sep, value = line.partition(':')
+        if not sep or not name.strip():
+            raise ValueError(f"無效的請求頭: {line[:100]!r}")
+        headers[name.strip().lower()] = value.strip()
+    return parts[0], parts[1], parts[2], headers
+
+
+def wants_keep_alive(version, headers):
+    """HTTP/1.1 默認保持連接，HTTP/1.0 需要 Connection: keep-alive"""
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        return connection == 'keep-alive'
+    return connection != 'close'
+
+
+_date_cache = [0, ""]
+
+
+def http_date():
+    """Date 頭（每秒格式化一次）"""
+    now = int(time.time())
+    if _date_cache[0] != now:
+        _date_cache[:] = [now, email.utils.formatdate(now, usegmt=True)]
+    return _date_cache[1]
+
+
+def response_head(status, content_type, length, keep_alive):
+    try:
+        reason = http.HTTPStatus(status).phrase
+    except ValueError:
+        reason = ""
+    return (f"HTTP/1.1 {status} {reason}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {length}\r\n"
+            f"Date: {http_date()}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n").encode('latin-1')
+
+
+def error_body(status, message):
+    return f"<h1>{status} - {message}</h1>".encode('utf-8')
+
+
+def raise_file_limit():
+    """把打開文件數的軟上限提高到硬上限，以容納大量連接；返回新的軟上限"""
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY and soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            return hard
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+class AsyncFireServer:
+    """asyncio 服務器：connections 為 {StreamWriter: 是否正在處理請求}"""
+
+    def __init__(self, host="", port=8000, scheduler=None, keepalive=ASYNC_KEEPALIVE_SECONDS,
+                 shutdown_timeout=ASYNC_SHUTDOWN_SECONDS, refresh=True):
+        self.host = host
+        self.requested_port = port
+        self.scheduler = scheduler or start_server.scheduler
+        self.keepalive = keepalive
+        self.shutdown_timeout = shutdown_timeout
+        self.refresh = refresh
+        self.connections = {}
+        self.requests = 0
+        self._server = None
+        self._stopping = None
+        self._loop = None
+        self._refresh_task = None
+        _servers.add(self)
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1] if self._server else None
+
+    async def start(self):
+        """開始監聽，並（refresh=True 時）啟動數據層刷新任務"""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._server = await asyncio.start_server(self._handle, self.host or None, self.requested_port,
+                                                  backlog=ASYNC_BACKLOG, limit=MAX_HEADER_BYTES)
+        if self.refresh:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+        return self
+
+    async def _refresh_loop(self):
+        """按數據層TTL提交刷新；刷新完成時喚醒，重新計算下次到期時間"""
+        wakeup = asyncio.Event()
+
+        def done(_future):
+            try:
+                self._loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass   # 事件循環已關閉
+
+        while not self._stopping.is_set():
+            for future in self.scheduler.run_pending().values():
+                future.add_done_callback(done)
+            try:
+                await asyncio.wait_for(wakeup.wait(), self.scheduler.seconds_until_next())
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+
+    async def _respond(self, path, headers):
+        # 採樣分析會持續數秒，在線程中運行，不阻塞其他連接
+        if path.startswith('/debug/'):
+            return await asyncio.to_thread(start_server.handle_request, path, headers)
+        return start_server.handle_request(path, headers)
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        client = peer[0] if peer else None
+        self.connections[writer] = False
+        try:
+            while not self._stopping.is_set():
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.keepalive)
+                except asyncio.LimitOverrunError:
+                    await self._send(writer, 431, 'text/html; charset=utf-8',
+                                     error_body(431, "Request Header Fields Too Large"), False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                self.connections[writer] = True
+                start = time.perf_counter()
+                try:
+                    method, path, version, headers = parse_request(head)
+                    length = int(headers.get('content-length') or 0)
+                    if not 0 <= length <= MAX_BODY_BYTES:
+                        raise ValueError(f"無效的 Content-Length: {length}")
+                except ValueError as e:
+                    access_log.event('WARNING', f"{client} - {e}", client=client)
+                    await self._send(writer, 400, 'text/html; charset=utf-8', error_body(400, "Bad Request"), False)
+                    break
+                if length:
+                    await reader.readexactly(length)
+
+                keep_alive = wants_keep_alive(version, headers)
+                if method != 'GET':
+                    # 其他方法可能帶有未讀取的內容（例如分塊傳輸），響應後關閉連接
+                    status, content_type, body, cache = (501, 'text/html; charset=utf-8',
+                                                         error_body(501, "Not Implemented"), None)
+                    keep_alive = False
+                else:
+                    status, content_type, body, cache = await self._respond(path, headers)
+                keep_alive = keep_alive and not self._stopping.is_set()
+                await self._send(writer, status, content_type, body, keep_alive)
+                start_server.record_request(path, status, len(body), time.perf_counter() - start, cache, client)
+                self.requests += 1
+                self.connections[writer] = False
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def _send(self, writer, status, content_type, body, keep_alive):
+        writer.write(response_head(status, content_type, len(body), keep_alive) + body)
+        await writer.drain()
+
+    def stop(self):
+        """請求停止（可以從其他線程或信號處理器調用）"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    async def serve_forever(self):
+        """運行直到 stop()，然後優雅關閉"""
+        if self._server is None:
+            await self.start()
+        await self._stopping.wait()
+        await self.shutdown()
+
+    async def shutdown(self):
+        """停止接受新連接，關閉空閒連接，等待進行中的請求完成（最多 shutdown_timeout 秒）"""
+        self._stopping.set()
+        self._server.close()
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        for writer, active in list(self.connections.items()):
+            if not active:
+                writer.close()
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self.connections and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for writer in list(self.connections):
+            writer.transport.abort()
+        await self._server.wait_closed()
+
+
+def main():
+    """主函數"""
+    print("=" * 60)
+    print("  香港消防處服務查看器 - asyncio 服務器")
+    print("=" * 60)
+
+    # 端口: python3 async_server.py [端口]
+    port = 8000
+    if len(sys.argv) > 1:
+        try:
+            port = int(sys.argv[-1])
+        except ValueError:
+            print(f"⚠️  無效端口: {sys.argv[-1]}，使用默認端口 {port}")
+
+    limit = raise_file_limit()
+    # 經共享數據緩存獲取，與其他入口共用
+    start_server.scheduler.cache = cache_backend.backend()
+
+    async def run():
+        server = await AsyncFireServer(port=port).start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, server.stop)
+            except (NotImplementedError, RuntimeError):
+                pass   # Windows 上由 KeyboardInterrupt 停止
+        print(f"🌐 服務器已啟動: http://localhost:{server.port}")
+        print(f"📊 運行指標: http://localhost:{server.port}/metrics")
+        if limit:
+            print(f"🔌 最多約 {limit:,} 個同時連接（打開文件數上限），空閒 {server.keepalive:g} 秒後關閉")
+        print("   按 Ctrl+C 停止")
+        await server.serve_forever()
+        print(f"\n🛑 服務器已停止（共處理 {server.requests:,} 個請求）")
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("\n🛑 服務器已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+GeoJSON解析峰值內存對比（tracemalloc）
+生成一個合成的FeatureCollection（默認100 MB），比較：
+  - 整體解析: read() + decode() + json.loads()，再提取記錄（原來的做法）
+  - 增量解析: geojson_stream.iter_features 按塊讀取並只保留需要的字段
+
+用法: python bench_geojson_memory.py [--size-mb 100] [--keep]
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import geojson_stream
+from layers import STATION_FIELDS
+
+DISTRICTS = ["中西區", "灣仔區", "東區", "南區", "油尖旺區", "深水埗區", "九龍城區", "沙田區"]
+
+
+def synthetic_feature(i):
+    """一個與消防處WFS要素結構相同的合成要素"""
+    lat = 22.2 + random.random() * 0.3
+    lng = 113.9 + random.random() * 0.4
+    district = random.choice(DISTRICTS)
+    return {
+        "type": "Feature",
+        "id": f"FireStations.{i}",
+        "geometry": {"type": "Point", "coordinates": [lng, lat]},
+        "properties": {
+            "OBJECTID": i,
+            "FSDID": f"FS{i:06d}",
+            "Name_TC": f"合成消防局{i}",
+            "Name_ENG": f"Synthetic Fire Station {i}",
+            "Address_TC": f"香港{district}測試道{i % 500}號",
+            "Address_ENG": f"{i % 500} Test Road, Hong Kong",
+            "District_TC": district,
+            "District_ENG": "Test District",
+            "Telephone": f"2{i % 10000000:07d}",
+            "Latitude": lat,
+            "Longitude": lng,
+            "Remarks_TC": "合成數據，用於內存基準測試" * 3,
+            "Remarks_ENG": "Synthetic data for the memory benchmark " * 2,
+        },
+    }
+
+
+def write_collection(path, size_mb):
+    """寫入約 size_mb 大小的FeatureCollection，返回要素數"""
+    target = size_mb * 1024 * 1024
+    written = count = 0
+    with open(path, "wb") as f:
+        head = b'{"type":"FeatureCollection","crs":{"type":"name","properties":{"name":"EPSG:4326"}},"features":['
+        f.write(head)
+        written += len(head)
+        while written < target:
+            chunk = (b"," if count else b"") + json.dumps(synthetic_feature(count), ensure_ascii=False).encode("utf-8")
+            f.write(chunk)
+            written += len(chunk)
+            count += 1
+        f.write(b'],"numberMatched":%d}' % count)
+    return count
+
+
+def station_record(feature):
+    props = feature.get("properties", {})
+    return (props.get("FSDID"), props.get("Name_TC"), props.get("District_TC"),
+            props.get("Latitude"), props.get("Longitude"))
+
+
+def parse_whole(path):
+    """原來的做法：完整讀取、解碼、json.loads，再提取記錄"""
+    with open(path, "rb") as f:
+        body = f.read()
+    data = json.loads(body.decode("utf-8"))
+    return [station_record(feature) for feature in data.get("features", [])]
+
+
+def parse_streaming(path):
+    """增量解析：按塊讀取，只保留需要的字段"""
+    with open(path, "rb") as f:
+        return [station_record(feature) for feature in geojson_stream.iter_features(f, tuple(STATION_FIELDS.values()))]
+
+
+def measure(func, path):
+    """返回 (記錄數, 峰值內存MB, 耗時秒)"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    records = func(path)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(records), peak / 1024 / 1024, elapsed
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="GeoJSON解析峰值內存對比")
+    parser.add_argument("--size-mb", type=int, default=100, help="合成文件大小（MB）")
+    parser.add_argument("--keep", action="store_true", help="保留生成的合成文件")
+    args = parser.parse_args()
+
+    random.seed(42)
+    fd, path = tempfile.mkstemp(suffix=".geojson")
+    os.close(fd)
+    try:
+        print(f"📝 生成合成FeatureCollection（約 {args.size_mb} MB）...")
+        count = write_collection(path, args.size_mb)
+        print(f"   {count:,} 個要素，{os.path.getsize(path) / 1024 / 1024:.1f} MB: {path}")
+        print()
+
+        results = {}
+        for name, func in (("整體解析", parse_whole), ("增量解析", parse_streaming)):
+            print(f"⏱️ {name}...")
+            results[name] = measure(func, path)
+
+        print()
+        print(f"{'方法':<8} {'記錄數':>10} {'峰值內存(MB)':>14} {'耗時(秒)':>10}")
+        for name, (records, peak, elapsed) in results.items():
+            print(f"{name:<8} {records:>10,} {peak:>14.1f} {elapsed:>10.2f}")
+
+        whole, streaming = results["整體解析"][1], results["增量解析"][1]
+        print()
+        print(f"📉 峰值內存降低 {whole / streaming:.1f} 倍")
+    finally:
+        if args.keep:
+            print(f"📁 合成文件保留在 {path}")
+        else:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
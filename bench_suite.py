@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+基準測試套件
+用與消防處WFS結構相同的合成夾具（wfs_replay.py），在實際站點數的 1×、10×、100×、1000× 下測量：
+  - parse:       GeoJSON增量解析並轉換為記錄（geojson_stream + Layer.record）
+  - dataframe:   構建站點DataFrame並投影、核對地區（app.py load_station_layer 的處理部分）
+  - search:      名稱或地址 str.contains 搜索
+  - districts:   按地區和類型統計
+  - backups:     後備站點排名（start_server.py compute_backups）
+  - server_html: start_server.py generate_html
+  - map_build:   app.py create_interactive_map
+  - map_html:    地圖序列化為HTML
+結果寫入JSON文件，可以用 --compare 與以前的結果比較
+
+用法:
+    python bench_suite.py [--scales 1 10 100 1000] [--repeats 5] [--max-seconds 30]
+                          [--only parse search] [--output data/bench/xxx.json] [--compare 舊結果.json]
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime
+
+import geojson_stream
+import wfs_replay
+from layers import LAYERS
+
+# 實際站點數（約數，與上游數據同一數量級即可）
+REAL_COUNTS = {'ambulance': 39, 'fire_station': 82}
+
+DEFAULT_SCALES = (1, 10, 100, 1000)
+DEFAULT_OUTPUT_DIR = os.path.join("data", "bench")
+
+
+def layer_bodies(scale, seed=0):
+    """{數據層: GeoJSON響應內容}"""
+    bodies = {}
+    for name, count in REAL_COUNTS.items():
+        features = wfs_replay.scale_features(wfs_replay.synthetic_features(LAYERS[name], count), scale, seed)
+        bodies[name] = json.dumps({"type": "FeatureCollection", "features": features},
+                                  ensure_ascii=False).encode('utf-8')
+    return bodies
+
+
+def parse_layer(name, body):
+    layer = LAYERS[name]
+    return [layer.record(feature) for feature in
+            geojson_stream.iter_features(io.BytesIO(body), tuple(layer.fields.values()))]
+
+
+class Fixture:
+    """一個倍數下的數據，各階段按需構建並緩存（構建時間不計入其他基準）"""
+
+    def __init__(self, scale):
+        self.scale = scale
+        self._cache = {}
+
+    def _get(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    @property
+    def bodies(self):
+        return self._get('bodies', lambda: layer_bodies(self.scale))
+
+    @property
+    def records(self):
+        return self._get('records', lambda: {name: parse_layer(name, body) for name, body in self.bodies.items()})
+
+    @property
+    def frames(self):
+        return self._get('frames', lambda: {name: build_frame(name, records)
+                                            for name, records in self.records.items()})
+
+    @property
+    def stations(self):
+        return sum(len(records) for records in self.records.values())
+
+
+def build_frame(name, records):
+    """與 app.load_station_layer 相同的處理（不包括上游獲取）"""
+    import app
+    from district_check import load_districts, verify_districts
+    from projection import add_grid_columns
+
+    df = app.station_frame(records, LAYERS[name].label)
+    df = add_grid_columns(df)
+    districts = load_districts()
+    if districts is not None:
+        df = verify_districts(df, districts)
+    return df
+
+
+def bench_parse(fixture):
+    records = {name: parse_layer(name, body) for name, body in fixture.bodies.items()}
+    return {'bytes': sum(len(body) for body in fixture.bodies.values()),
+            'records': sum(len(r) for r in records.values())}
+
+
+def bench_dataframe(fixture):
+    frames = {name: build_frame(name, records) for name, records in fixture.records.items()}
+    return {'rows': sum(len(df) for df in frames.values())}
+
+
+def bench_search(fixture):
+    matches = 0
+    for df in fixture.frames.values():
+        for term in ("沙田", "測試道1", "不存在"):
+            mask = (df['名稱'].str.contains(term, case=False, na=False) |
+                    df['地址'].str.contains(term, case=False, na=False))
+            matches += int(mask.sum())
+    return {'matches': matches}
+
+
+def bench_districts(fixture):
+    import pandas as pd
+
+    stations = pd.concat([df[['地區', '類型']] for df in fixture.frames.values()])
+    table = stations.groupby(['地區', '類型']).size().unstack(fill_value=0)
+    return {'districts': len(table)}
+
+
+def _server_cache(fixture):
+    import start_server
+
+    return start_server.station_data(fixture.records['ambulance'], fixture.records['fire_station'], None), start_server
+
+
+def bench_backups(fixture):
+    cache, start_server = _server_cache(fixture)
+    if start_server.station_distances is None:
+        return {'skipped': '需要numpy'}
+    start_server.compute_backups(cache.fire_station, cache.ambulance)
+    return {}
+
+
+def bench_server_html(fixture):
+    cache, start_server = fixture._get('server_cache', lambda: _server_cache(fixture))
+    start_server.publish(cache)
+    html = start_server.generate_html()
+    return {'bytes': len(html.encode('utf-8'))}
+
+
+def bench_map_build(fixture):
+    import app
+
+    # compute_sites 帶 st.cache_data，不清除時第二次起只測到緩存命中
+    app.compute_sites.__wrapped__.clear()
+    frames = fixture.frames
+    fixture._cache['map'] = app.create_interactive_map(frames['ambulance'], frames['fire_station'], zoom=11)
+    return {}
+
+
+def bench_map_html(fixture):
+    import folium
+
+    if 'map' not in fixture._cache:
+        bench_map_build(fixture)
+    html = folium.Figure().add_child(fixture._cache.pop('map')).render()
+    return {'bytes': len(html.encode('utf-8'))}
+
+
+# 名稱 -> 函數（按此順序運行；map_html 每次重新構建地圖，只計算序列化時間）
+BENCHMARKS = {
+    'parse': bench_parse,
+    'dataframe': bench_dataframe,
+    'search': bench_search,
+    'districts': bench_districts,
+    'backups': bench_backups,
+    'server_html': bench_server_html,
+    'map_build': bench_map_build,
+    'map_html': bench_map_html,
+}
+
+
+def run_benchmark(name, func, fixture, repeats, max_seconds):
+    """重複運行一個基準，總時間超過 max_seconds 後提前停止；返回結果字典"""
+    timings, extra = [], {}
+    for _ in range(repeats):
+        if name == 'map_html' and 'map' not in fixture._cache:
+            bench_map_build(fixture)   # 準備要序列化的地圖（不計時）
+        start = time.perf_counter()
+        extra = func(fixture) or {}
+        timings.append(time.perf_counter() - start)
+        if extra.get('skipped') or sum(timings) > max_seconds:
+            break
+    return {
+        'benchmark': name,
+        'scale': fixture.scale,
+        'stations': fixture.stations,
+        'repeats': len(timings),
+        'min_seconds': min(timings),
+        'median_seconds': statistics.median(timings),
+        'max_seconds': max(timings),
+        'extra': extra,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=10, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def warm_up():
+    """預先導入 app.py、start_server.py 等模塊並運行一次處理流程，導入和初始化時間不計入第一個基準"""
+    import app  # noqa: F401
+    import folium  # noqa: F401
+    import start_server  # noqa: F401
+
+    Fixture(1).frames
+
+
+def estimate_seconds(history, scale):
+    """按之前倍數的結果估算在 scale 倍時單次運行的秒數
+
+    有兩個以上的結果時，用最近兩個倍數之間的增長率推算複雜度指數
+    （例如倍數乘10時耗時乘100，指數為2），不低於線性；只有一個結果時按線性估算。
+    """
+    if not history:
+        return 0
+    last = history[-1]
+    exponent = 1.0
+    if len(history) > 1:
+        before = history[-2]
+        if before['min_seconds'] > 0 and last['min_seconds'] > 0 and last['scale'] > before['scale']:
+            exponent = max(exponent, math.log(last['min_seconds'] / before['min_seconds'])
+                           / math.log(last['scale'] / before['scale']))
+    return last['min_seconds'] * (scale / last['scale']) ** exponent
+
+
+def run_suite(scales=DEFAULT_SCALES, names=None, repeats=5, max_seconds=30.0, log=print):
+    """運行基準測試，返回可寫入JSON的結果
+
+    按之前倍數的增長率估算（見 estimate_seconds），單次運行預計超過 max_seconds 的基準記為跳過。
+    """
+    names = list(names or BENCHMARKS)
+    results, previous = [], {}   # 基準 -> 最近完成的結果（按倍數遞增）
+    warm_up()
+    for scale in sorted(scales):
+        fixture = Fixture(scale)
+        log(f"📏 {scale}×: {fixture.stations:,} 個站點")
+        for name in names:
+            estimate = estimate_seconds(previous.get(name, []), scale)
+            if estimate > max_seconds:
+                results.append({'benchmark': name, 'scale': scale, 'stations': fixture.stations,
+                                'skipped': f"預計單次運行 {estimate:.0f} 秒，超過 {max_seconds:.0f} 秒"})
+                log(f"   {name:<12} 跳過（預計 {estimate:.0f} 秒）")
+                continue
+            result = run_benchmark(name, BENCHMARKS[name], fixture, repeats, max_seconds)
+            previous.setdefault(name, []).append(result)
+            results.append(result)
+            log(f"   {name:<12} {result['median_seconds'] * 1000:>10.2f} 毫秒（{result['repeats']} 次）")
+    return {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'real_counts': REAL_COUNTS,
+        'scales': list(scales),
+        'results': results,
+    }
+
+
+def compare(current, previous, log=print):
+    """按 (基準, 倍數) 比較中位數"""
+    old = {(r['benchmark'], r['scale']): r for r in previous['results'] if 'median_seconds' in r}
+    log(f"\n📊 與 {previous.get('generated_at')}（{previous.get('git_commit') or '未知版本'}）比較:")
+    log(f"{'基準':<12} {'倍數':>6} {'之前(毫秒)':>12} {'現在(毫秒)':>12} {'變化':>8}")
+    for result in current['results']:
+        before = old.get((result['benchmark'], result['scale']))
+        if before is None or 'median_seconds' not in result:
+            continue
+        ratio = result['median_seconds'] / before['median_seconds'] if before['median_seconds'] else float('inf')
+        marker = "🔺" if ratio > 1.1 else "🔻" if ratio < 0.9 else "  "
+        log(f"{result['benchmark']:<12} {result['scale']:>6} {before['median_seconds'] * 1000:>12.2f} "
+            f"{result['median_seconds'] * 1000:>12.2f} {marker}{ratio:>6.2f}×")
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="解析、過濾、頁面生成和地圖構建的基準測試")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES), help="站點數倍數")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="只運行這些基準")
+    parser.add_argument("--repeats", type=int, default=5, help="每個基準最多重複次數")
+    parser.add_argument("--max-seconds", type=float, default=30.0,
+                        help="每個基準的時間預算（秒）；單次超過時跳過更大的倍數")
+    parser.add_argument("--output", help="結果JSON路徑（默認 data/bench/bench-時間.json）")
+    parser.add_argument("--compare", help="與以前的結果JSON比較")
+    args = parser.parse_args()
+
+    # folium 對離線底圖的提示與基準無關
+    warnings.filterwarnings("ignore", category=UserWarning, module="folium")
+
+    print("=" * 50)
+    print("  基準測試套件")
+    print("=" * 50)
+    result = run_suite(args.scales, args.only, args.repeats, args.max_seconds)
+
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 結果已保存: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
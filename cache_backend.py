@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 可替換的共享數據緩存
+所有入口（app.py、simple_app.py、start_server.py、run_simple.py 等）通過同一個接口讀寫數據層記錄：
+
+    get(鍵, max_age)        -> Entry(值, 寫入時間戳, 版本) 或 None
+    put(鍵, 值)             -> 新版本號
+    version(鍵)             -> 當前版本號（只讀取版本，用於發現其他進程的刷新）
+    get_or_load(鍵, 加載函數, ttl)  緩存過期時持鎖加載，同一時間只有一個進程請求上游
+
+後端由 CACHE_BACKEND 選擇：
+    disk    CACHE_DIR 目錄中每個鍵一個JSON文件，用文件鎖協調同一台機器上的多個進程（默認）
+    memory  進程內LRU（只在一個進程內共享）
+    redis   CACHE_URL 指向的Redis（或 cache_server.py 本地替代服務器），多台機器也可共用
+值必須可JSON序列化（只需Python 3標準庫）
+"""
+
+import collections
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from contextlib import contextmanager
+
+import access_log
+import metrics
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 沒有 fcntl：不加鎖，各進程可能同時請求上游，但結果仍然正確
+    fcntl = None
+
+# 配置（見 .env.example）
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "disk")
+CACHE_DIR = os.environ.get("CACHE_DIR", os.path.join("data", "cache"))
+CACHE_URL = os.environ.get("CACHE_URL", "redis://127.0.0.1:6379/0")
+CACHE_MAX_ITEMS = int(os.environ.get("CACHE_MAX_ITEMS", "256"))
+CACHE_LOCK_SECONDS = float(os.environ.get("CACHE_LOCK_SECONDS", "120"))
+
+# 緩存條目：值、寫入時間戳 (time.time())、版本（每次 put 加一）
+Entry = collections.namedtuple("Entry", "value stored_at version")
+
+
+class CacheUnavailable(Exception):
+    """緩存後端無法使用（例如Redis無法連接），調用者可以改為直接獲取"""
+
+
+class CacheBackend:
+    """後端的公共部分：子類實現 get/put/version/lock"""
+
+    name = "cache"
+
+    def get(self, key, max_age=None):
+        raise NotImplementedError
+
+    def put(self, key, value):
+        raise NotImplementedError
+
+    def version(self, key):
+        raise NotImplementedError
+
+    def lock(self, key):
+        """鍵的排他鎖（上下文管理器）"""
+        raise NotImplementedError
+
+    def _store(self, key, value):
+        """持有 lock(key) 時保存值，返回 Entry"""
+        raise NotImplementedError
+
+    def get_or_load(self, key, loader, ttl):
+        """返回不超過 ttl 秒的緩存條目；過期時持鎖調用 loader() 並保存結果
+
+        等待鎖的進程拿到鎖後先重新檢查緩存，通常直接讀到持鎖進程剛寫入的值。
+        loader 拋出異常時不寫入緩存，異常傳給調用者。
+        """
+        entry = self.get(key, ttl)
+        if entry is None:
+            with self.lock(key):
+                entry = self.get(key, ttl)
+                if entry is None:
+                    metrics.CACHE_REQUESTS.inc(cache='data', result='miss')
+                    return self._store(key, loader())
+        metrics.CACHE_REQUESTS.inc(cache='data', result=self.name)
+        return entry
+
+
+def _fresh(entry, max_age):
+    return max_age is None or time.time() - entry.stored_at < max_age
+
+
+class MemoryCache(CacheBackend):
+    """進程內LRU，最多 maxsize 個鍵"""
+
+    name = "memory"
+
+    def __init__(self, maxsize=CACHE_MAX_ITEMS):
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        # 淘汰的條目中最大的版本號：淘汰後重新寫入的鍵從這裡繼續遞增，不必為每個淘汰的鍵保留版本號
+        self._evicted_version = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, max_age=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not _fresh(entry, max_age):
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, value):
+        return self._store(key, value).version
+
+    def _store(self, key, value):
+        with self._lock:
+            previous = self._entries.get(key)
+            version = (previous.version if previous else self._evicted_version) + 1
+            entry = self._entries[key] = Entry(value, time.time(), version)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                _, evicted = self._entries.popitem(last=False)
+                self._evicted_version = max(self._evicted_version, evicted.version)
+            return entry
+
+    def version(self, key):
+        """當前版本號；已淘汰的鍵返回None（重新寫入時版本號仍大於淘汰前）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.version if entry else None
+
+    @contextmanager
+    def lock(self, key):
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            yield
+
+
+class DiskCache(CacheBackend):
+    """磁盤緩存：每個鍵一個JSON文件（先寫臨時文件再替換），用文件鎖協調多個進程"""
+
+    name = "disk"
+
+    def __init__(self, directory=None):
+        self.directory = directory or CACHE_DIR
+
+    def _path(self, key, suffix=".json"):
+        return os.path.join(self.directory, urllib.parse.quote(key, safe="") + suffix)
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                data = json.load(f)
+            return Entry(data['value'], data['stored_at'], data.get('version', 1))
+        except (OSError, ValueError, KeyError):
+            # 沒有緩存，或文件損壞（下次寫入時覆蓋）
+            return None
+
+    def get(self, key, max_age=None):
+        entry = self._read(key)
+        return entry if entry is not None and _fresh(entry, max_age) else None
+
+    def put(self, key, value):
+        with self.lock(key):
+            return self._store(key, value).version
+
+    def _store(self, key, value):
+        previous = self._read(key)
+        entry = Entry(value, time.time(), (previous.version if previous else 0) + 1)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'version': entry.version, 'stored_at': entry.stored_at, 'value': value},
+                              f, ensure_ascii=False)
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            # 緩存只是加速，寫入失敗不影響結果
+            access_log.event('WARNING', f"⚠️ 無法寫入數據緩存 {self._path(key)}: {e}", key=key)
+        return entry
+
+    def version(self, key):
+        entry = self._read(key)
+        return entry.version if entry else None
+
+    @contextmanager
+    def lock(self, key):
+        """鍵的排他文件鎖（阻塞直到其他進程釋放）"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            f = open(self._path(key, ".lock"), 'a')
+        except OSError as e:
+            raise CacheUnavailable(f"無法打開緩存鎖 {self._path(key, '.lock')}: {e}") from e
+        with f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class RespError(Exception):
+    """Redis協議的錯誤回覆"""
+
+
+class RespClient:
+    """最小的Redis協議（RESP）客戶端：一個連接，多線程共用時串行發送命令"""
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, timeout=5.0):
+        self.address = (host, port)
+        self.db = db
+        self.timeout = timeout
+        self._sock = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._sock = socket.create_connection(self.address, timeout=self.timeout)
+        self._file = self._sock.makefile('rb')
+        if self.db:
+            self._send(("SELECT", self.db))
+
+    def _send(self, args):
+        encoded = [arg if isinstance(arg, bytes) else str(arg).encode('utf-8') for arg in args]
+        self._sock.sendall(b"*%d\r\n" % len(encoded)
+                           + b"".join(b"$%d\r\n%s\r\n" % (len(arg), arg) for arg in encoded))
+        return self._reply()
+
+    def _reply(self):
+        line = self._file.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("連接已關閉")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode('utf-8')
+        if kind == b"-":
+            raise RespError(rest.decode('utf-8', 'replace'))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("連接已關閉")
+            return data[:-2]
+        if kind == b"*":
+            count = int(rest)
+            return None if count < 0 else [self._reply() for _ in range(count)]
+        raise RespError(f"無法解析的回覆: {line[:50]!r}")
+
+    def command(self, *args):
+        """發送一個命令並返回回覆；連接斷開時重新連接一次"""
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._send(args)
+                except (OSError, ConnectionError) as e:
+                    self.close()
+                    if attempt == 2:
+                        raise CacheUnavailable(f"無法連接緩存服務器 {self.address[0]}:{self.address[1]}: {e}") from e
+
+    def close(self):
+        if self._sock is not None:
+            try:
+                self._file.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._file = None
+
+
+# 鎖的值等於自己的令牌時才刪除（cache_server.py 也支持這個腳本）
+RELEASE_LOCK_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+)
+
+
+class RedisCache(CacheBackend):
+    """Redis 後端：值和版本號分別保存在 {prefix}{鍵} 和 {prefix}{鍵}:version，鎖用 SET NX PX"""
+
+    name = "redis"
+
+    def __init__(self, url=CACHE_URL, prefix="fsd:", lock_seconds=CACHE_LOCK_SECONDS):
+        parts = urllib.parse.urlsplit(url)
+        db = int(parts.path.strip("/") or 0)
+        self.client = RespClient(parts.hostname or "127.0.0.1", parts.port or 6379, db)
+        self.prefix = prefix
+        self.lock_seconds = lock_seconds
+
+    def get(self, key, max_age=None):
+        raw = self.client.command("GET", self.prefix + key)
+        if raw is None:
+            return None
+        try:
+            data = json.loads(raw)
+            entry = Entry(data['value'], data['stored_at'], data['version'])
+        except (ValueError, KeyError):
+            return None
+        return entry if _fresh(entry, max_age) else None
+
+    def put(self, key, value):
+        return self._store(key, value).version
+
+    def _store(self, key, value):
+        version = self.client.command("INCR", f"{self.prefix}{key}:version")
+        entry = Entry(value, time.time(), version)
+        self.client.command("SET", self.prefix + key, json.dumps(
+            {'version': version, 'stored_at': entry.stored_at, 'value': value}, ensure_ascii=False))
+        return entry
+
+    def version(self, key):
+        raw = self.client.command("GET", f"{self.prefix}{key}:version")
+        return int(raw) if raw is not None else None
+
+    @contextmanager
+    def lock(self, key):
+        """分佈式鎖：持有者崩潰時 lock_seconds 秒後自動釋放
+
+        釋放時用腳本原子地比較並刪除，只刪除自己的鎖（加載超過 lock_seconds 時鎖可能已經被其他進程取得）；
+        釋放失敗不影響已經完成的加載，鎖在 lock_seconds 後自動過期。
+        """
+        name, token = f"{self.prefix}{key}:lock", uuid.uuid4().hex
+        while self.client.command("SET", name, token, "NX", "PX", int(self.lock_seconds * 1000)) is None:
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            try:
+                self.client.command("EVAL", RELEASE_LOCK_SCRIPT, 1, name, token)
+            except (CacheUnavailable, RespError) as e:
+                access_log.event('WARNING', f"⚠️ 無法釋放緩存鎖 {name}，{self.lock_seconds:.0f} 秒後自動過期: {e}",
+                                 key=key)
+
+
+def create(kind=None, directory=None, url=None):
+    """按名稱創建後端：disk、memory 或 redis（默認 CACHE_BACKEND）"""
+    kind = (kind or CACHE_BACKEND or "disk").lower()
+    if kind == "memory":
+        return MemoryCache()
+    if kind == "disk":
+        return DiskCache(directory)
+    if kind == "redis":
+        return RedisCache(url or CACHE_URL)
+    raise ValueError(f"未知的緩存後端: {kind}（可選 memory、disk、redis）")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def backend():
+    """進程內共用的後端（第一次調用時按配置創建）"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create()
+        return _backend
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 本地Redis協議緩存服務器
+沒有安裝Redis時的替代品：實現 cache_backend.RedisCache 用到的命令子集
+（PING ECHO SELECT GET SET[EX/PX/NX/XX] DEL EXISTS INCR EXPIRE PEXPIRE TTL DBSIZE FLUSHDB QUIT，
+以及只支持 cache_backend.RELEASE_LOCK_SCRIPT 的 EVAL），
+數據只保存在內存中，重啟後清空；默認只監聽127.0.0.1（只需Python 3標準庫）
+
+用法:
+    python cache_server.py [端口]        # 默認使用 CACHE_URL 的端口（6379）
+    CACHE_BACKEND=redis python start_server.py
+"""
+
+import asyncio
+import signal
+import sys
+import time
+import urllib.parse
+
+import cache_backend
+
+# 請求中一個參數的最大字節數
+MAX_ARGUMENT_BYTES = 64 * 1024 * 1024
+
+
+class CommandError(Exception):
+    """命令錯誤，回覆 -ERR"""
+
+
+class Database:
+    """一個編號的數據庫：{鍵: 值} 和 {鍵: 過期的 monotonic 時間}"""
+
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+
+    def _alive(self, key):
+        deadline = self.expires.get(key)
+        if deadline is not None and time.monotonic() >= deadline:
+            self.values.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.values
+
+    def get(self, key):
+        return self.values[key] if self._alive(key) else None
+
+    def set(self, key, value, ttl=None):
+        self.values[key] = value
+        if ttl is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = time.monotonic() + ttl
+
+    def delete(self, key):
+        self.expires.pop(key, None)
+        return self.values.pop(key, None) is not None
+
+    def size(self):
+        for key in list(self.expires):
+            self._alive(key)
+        return len(self.values)
+
+
+def _integer(value):
+    try:
+        return int(value)
+    except ValueError:
+        raise CommandError("value is not an integer or out of range") from None
+
+
+class CacheServer:
+    """asyncio RESP服務器；每個連接有自己選擇的數據庫"""
+
+    def __init__(self, host="127.0.0.1", port=6379, databases=16):
+        self.host = host
+        self.requested_port = port
+        self.databases = [Database() for _ in range(databases)]
+        self.commands = 0
+        self.connections = set()
+        self._server = None
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1] if self._server else None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.requested_port)
+        return self
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        """停止接受新連接並關閉已有連接（可以從信號處理器調用）"""
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self.connections):
+            writer.close()
+
+    async def shutdown(self):
+        """close() 並等待所有連接處理完畢"""
+        self.close()
+        while self.connections:
+            await asyncio.sleep(0.01)
+
+    async def _read_command(self, reader):
+        """讀取一個命令（數組或內聯格式），連接關閉時返回None"""
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        args = []
+        for _ in range(_integer(line[1:].strip())):
+            header = await reader.readline()
+            if not header.startswith(b"$"):
+                raise CommandError("Protocol error: expected '$'")
+            length = _integer(header[1:].strip())
+            if not 0 <= length <= MAX_ARGUMENT_BYTES:
+                raise CommandError("Protocol error: invalid bulk length")
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def _handle(self, reader, writer):
+        db = self.databases[0]
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    args = await self._read_command(reader)
+                except CommandError as e:
+                    writer.write(b"-ERR %s\r\n" % str(e).encode())
+                    break
+                if args is None:
+                    break
+                if not args:
+                    continue
+                name = args[0].upper()
+                self.commands += 1
+                if name == b"QUIT":
+                    writer.write(b"+OK\r\n")
+                    break
+                if name == b"SELECT":
+                    index = _integer(args[1]) if len(args) > 1 and args[1].isdigit() else -1
+                    if 0 <= index < len(self.databases):
+                        db = self.databases[index]
+                        writer.write(b"+OK\r\n")
+                    else:
+                        writer.write(b"-ERR DB index is out of range\r\n")
+                    continue
+                try:
+                    writer.write(self.execute(db, name, args[1:]))
+                except CommandError as e:
+                    writer.write(b"-ERR %s\r\n" % str(e).encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    def execute(self, db, name, args):
+        """執行一個命令，返回編碼後的回覆"""
+        def arity(count):
+            if len(args) < count:
+                raise CommandError(f"wrong number of arguments for '{name.decode().lower()}' command")
+
+        if name == b"PING":
+            return bulk(args[0]) if args else b"+PONG\r\n"
+        if name == b"ECHO":
+            arity(1)
+            return bulk(args[0])
+        if name == b"GET":
+            arity(1)
+            return bulk(db.get(args[0]))
+        if name == b"SET":
+            arity(2)
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            ttl = None
+            if b"EX" in options or b"PX" in options:
+                index = options.index(b"EX") if b"EX" in options else options.index(b"PX")
+                if index + 1 >= len(options):
+                    raise CommandError("syntax error")
+                ttl = _integer(args[2 + index + 1]) / (1 if options[index] == b"EX" else 1000)
+                if ttl <= 0:
+                    raise CommandError("invalid expire time in 'set' command")
+            exists = db.get(key) is not None
+            if (b"NX" in options and exists) or (b"XX" in options and not exists):
+                return b"$-1\r\n"
+            db.set(key, value, ttl)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            arity(1)
+            return b":%d\r\n" % sum(db.delete(key) for key in args)
+        if name == b"EXISTS":
+            arity(1)
+            return b":%d\r\n" % sum(db.get(key) is not None for key in args)
+        if name == b"INCR":
+            arity(1)
+            value = _integer(db.get(args[0]) or b"0") + 1
+            ttl = db.expires.get(args[0])
+            db.set(args[0], str(value).encode(), None if ttl is None else ttl - time.monotonic())
+            return b":%d\r\n" % value
+        if name in (b"EXPIRE", b"PEXPIRE"):
+            arity(2)
+            value = db.get(args[0])
+            if value is None:
+                return b":0\r\n"
+            db.set(args[0], value, _integer(args[1]) / (1 if name == b"EXPIRE" else 1000))
+            return b":1\r\n"
+        if name == b"TTL":
+            arity(1)
+            if db.get(args[0]) is None:
+                return b":-2\r\n"
+            deadline = db.expires.get(args[0])
+            return b":%d\r\n" % (-1 if deadline is None else round(deadline - time.monotonic()))
+        if name == b"EVAL":
+            # 不執行Lua：只識別釋放鎖的腳本（比較並刪除），命令串行執行所以是原子的
+            arity(4)
+            if args[0] != cache_backend.RELEASE_LOCK_SCRIPT.encode() or args[1] != b"1":
+                raise CommandError("only cache_backend.RELEASE_LOCK_SCRIPT is supported")
+            return b":%d\r\n" % (db.delete(args[2]) if db.get(args[2]) == args[3] else 0)
+        if name == b"DBSIZE":
+            return b":%d\r\n" % db.size()
+        if name == b"FLUSHDB":
+            db.values.clear()
+            db.expires.clear()
+            return b"+OK\r\n"
+        raise CommandError(f"unknown command '{name.decode(errors='replace')}'")
+
+
+def bulk(value):
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+def main():
+    """主函數"""
+    port = urllib.parse.urlsplit(cache_backend.CACHE_URL).port or 6379
+    if len(sys.argv) > 1:
+        try:
+            port = int(sys.argv[-1])
+        except ValueError:
+            print(f"⚠️  無效端口: {sys.argv[-1]}，使用默認端口 {port}")
+
+    async def run():
+        server = await CacheServer(port=port).start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, server.close)
+            except (NotImplementedError, RuntimeError):
+                pass   # Windows 上由 KeyboardInterrupt 停止
+        print(f"💾 緩存服務器已啟動: redis://127.0.0.1:{server.port}/0")
+        print("   其他入口設置 CACHE_BACKEND=redis 後共用這裡的數據，按 Ctrl+C 停止")
+        try:
+            await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        print(f"\n🛑 緩存服務器已停止（共處理 {server.commands:,} 個命令）")
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("\n🛑 緩存服務器已停止")
+
+
+if __name__ == "__main__":
+    main()
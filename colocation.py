@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 共用站址檢測
+每個救護站連接到半徑範圍內最近的一個消防局，合併為同一站址；
+同一圖層的站點之間不合併，也不會經由中間站點串連成鏈。
+距離直接使用 projection.add_grid_columns 加入的東距/北距（HK1980方格網，米），
+用網格哈希查找附近的消防局（只需Python 3標準庫）
+"""
+
+import math
+import os
+
+# 救護站與消防局相距不超過此距離（米）視為同一站址
+COLOCATION_RADIUS_M = float(os.environ.get("COLOCATION_RADIUS_M", "60"))
+
+# 站址以消防局為錨點，救護站連接到最近的消防局
+ANCHOR_LAYER = 'fire_station'
+JOINED_LAYER = 'ambulance'
+
+
+def _valid(point):
+    return all(v is not None and math.isfinite(v) for v in point[2:6])
+
+
+def find_sites(points, radius_m=COLOCATION_RADIUS_M):
+    """將每個救護站併入 radius_m 以內最近的消防局所在站址
+
+    points: [(圖層, 記錄行號, 緯度, 經度, 東距, 北距), ...]
+    返回站址列表，每個站址為 {'lat', 'lng', 'members': [(圖層, 記錄行號), ...]}，
+    共用站址的坐標取消防局的坐標；順序與輸入中各站址第一個成員出現的順序一致。
+    坐標無效的點不屬於任何站址。
+    """
+    valid = [p for p in points if _valid(p)]
+    if not valid:
+        return []
+
+    # 網格邊長等於半徑，只需檢查相鄰9格
+    grid = {}
+    for i, p in enumerate(valid):
+        if p[0] == ANCHOR_LAYER:
+            grid.setdefault((int(p[4] // radius_m), int(p[5] // radius_m)), []).append(i)
+
+    # 每個點所屬站址的錨點（消防局或獨立的點自身）
+    anchor = list(range(len(valid)))
+    radius_sq = radius_m * radius_m
+    for i, p in enumerate(valid):
+        if p[0] != JOINED_LAYER:
+            continue
+        cx, cy = int(p[4] // radius_m), int(p[5] // radius_m)
+        best, best_sq = None, radius_sq
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in grid.get((cx + dx, cy + dy), ()):
+                    d_sq = (p[4] - valid[j][4]) ** 2 + (p[5] - valid[j][5]) ** 2
+                    # 距離相同時取輸入中較前的消防局
+                    if d_sq < best_sq or (d_sq == best_sq and (best is None or j < best)):
+                        best, best_sq = j, d_sq
+        if best is not None:
+            anchor[i] = best
+
+    groups = {}
+    for i in range(len(valid)):
+        groups.setdefault(anchor[i], []).append(i)
+
+    sites = []
+    for root, members in sorted(groups.items(), key=lambda item: min(item[1])):
+        sites.append({
+            'lat': valid[root][2],
+            'lng': valid[root][3],
+            'members': [(valid[i][0], valid[i][1]) for i in members],
+        })
+    return sites
+
+
+def site_summary(sites):
+    """站址統計：總站址數、共用站址數（同時有多於一種圖層）"""
+    shared = sum(1 for site in sites if len({layer for layer, _ in site['members']}) > 1)
+    return {'sites': len(sites), 'shared_sites': shared}
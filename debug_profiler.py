@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 按需採樣分析和內存快照
+/debug/profile?seconds=N  在N秒內定時採樣所有線程的調用棧，返回 collapsed stack 格式
+                          （每行 "線程;函數;函數... 次數"，可直接交給 flamegraph.pl 或 speedscope）
+/debug/memory             tracemalloc 佔用最多的分配位置，以及與上一次快照相比的增長；
+                          第一次請求時才開始跟踪，?stop=1 停止跟踪
+空閒時沒有採樣線程、不跟踪內存分配，沒有額外開銷。
+只有設置了 DEBUG_TOKEN 時才啟用，請求需帶 ?token= 或 X-Debug-Token 頭（只需Python 3標準庫）
+"""
+
+import collections
+import hmac
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.parse
+
+# 配置（見 .env.example）
+DEBUG_TOKEN = os.environ.get("DEBUG_TOKEN", "")
+PROFILE_INTERVAL_SECONDS = float(os.environ.get("DEBUG_PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_SECONDS = 60.0
+TRACEMALLOC_FRAMES = int(os.environ.get("DEBUG_TRACEMALLOC_FRAMES", "1"))
+
+_profile_lock = threading.Lock()
+
+
+class ProfileBusy(Exception):
+    """已有採樣在進行中"""
+
+
+def frame_label(frame):
+    """棧幀的名稱：函數 (文件:定義行)；用定義行而不是當前行，同一函數的樣本合併在一起"""
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+def sample_stacks(seconds, interval=PROFILE_INTERVAL_SECONDS, exclude=()):
+    """在 seconds 秒內每隔 interval 秒採樣所有線程，返回 Counter({collapsed棧: 次數}) 和採樣次數"""
+    exclude = set(exclude) | {threading.get_ident()}
+    counts = collections.Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident in exclude:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}").replace(';', ','))
+            counts[";".join(reversed(stack))] += 1
+        samples += 1
+        time.sleep(interval)
+    return counts, samples
+
+
+def profile(seconds, interval=PROFILE_INTERVAL_SECONDS, exclude=()):
+    """採樣 seconds 秒（最多 PROFILE_MAX_SECONDS），返回 collapsed stack 文本；同一時間只允許一個採樣"""
+    seconds = max(0.01, min(float(seconds), PROFILE_MAX_SECONDS))
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfileBusy("已有採樣在進行中")
+    try:
+        counts, samples = sample_stacks(seconds, interval, exclude)
+    finally:
+        _profile_lock.release()
+    header = f"# {samples} 次採樣，{seconds:g} 秒，間隔 {interval * 1000:g} 毫秒\n"
+    return header + "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
+
+
+class MemoryTracker:
+    """tracemalloc 快照：第一次調用時開始跟踪，之後返回佔用最多的位置和相對上一次快照的增長"""
+
+    def __init__(self, frames=TRACEMALLOC_FRAMES):
+        self.frames = frames
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def _filtered(self, snapshot):
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def report(self, limit=20, group="lineno"):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self._previous = None
+                return ("已開始跟踪內存分配（tracemalloc）；之前的分配不會被記錄。\n"
+                        "稍後再次請求 /debug/memory 查看佔用和增長，?stop=1 停止跟踪。\n")
+
+            snapshot = self._filtered(tracemalloc.take_snapshot())
+            current, peak = tracemalloc.get_traced_memory()
+            lines = [f"# 跟踪中的內存: 當前 {current / 1024 / 1024:.1f} MB，峰值 {peak / 1024 / 1024:.1f} MB",
+                     f"# 佔用最多的 {limit} 個位置（按 {group}）"]
+            for stat in snapshot.statistics(group)[:limit]:
+                lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} 個  {stat.traceback}")
+            if self._previous is not None:
+                lines.append(f"# 相對上一次快照增長最多的 {limit} 個位置")
+                for stat in snapshot.compare_to(self._previous, group)[:limit]:
+                    lines.append(f"{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} 個  {stat.traceback}")
+            self._previous = snapshot
+            return "\n".join(lines) + "\n"
+
+    def stop(self):
+        with self._lock:
+            was_tracing = tracemalloc.is_tracing()
+            tracemalloc.stop()
+            self._previous = None
+        return "已停止跟踪內存分配\n" if was_tracing else "沒有在跟踪內存分配\n"
+
+
+memory = MemoryTracker()
+
+
+def authorized(query, headers, token=None):
+    """DEBUG_TOKEN 為空時停用；否則要求 ?token= 或 X-Debug-Token 頭與之相同"""
+    token = DEBUG_TOKEN if token is None else token
+    if not token:
+        return False
+    provided = query.get('token', [''])[0] or (headers.get('X-Debug-Token') or '')
+    return hmac.compare_digest(provided.encode('utf-8'), token.encode('utf-8'))
+
+
+def handle(path, headers, token=None):
+    """處理 /debug/ 請求，返回 (狀態碼, 內容類型, 內容文本)
+
+    未啟用或令牌不正確時返回404，不暴露端點是否存在。
+    """
+    parts = urllib.parse.urlsplit(path)
+    query = urllib.parse.parse_qs(parts.query)
+    if not authorized(query, headers, token):
+        return 404, 'text/html; charset=utf-8', '<h1>404 - Page Not Found</h1>'
+
+    try:
+        if parts.path == '/debug/profile':
+            seconds = float(query.get('seconds', ['5'])[0])
+            interval = float(query.get('interval', [str(PROFILE_INTERVAL_SECONDS)])[0])
+            return 200, 'text/plain; charset=utf-8', profile(seconds, max(0.001, interval))
+        if parts.path == '/debug/memory':
+            if query.get('stop', [''])[0]:
+                return 200, 'text/plain; charset=utf-8', memory.stop()
+            limit = int(query.get('limit', ['20'])[0])
+            group = query.get('group', ['lineno'])[0]
+            if group not in ('lineno', 'filename', 'traceback'):
+                return 400, 'text/plain; charset=utf-8', f"無效的 group: {group}\n"
+            return 200, 'text/plain; charset=utf-8', memory.report(limit, group)
+    except ProfileBusy as e:
+        return 409, 'text/plain; charset=utf-8', f"{e}\n"
+    except ValueError as e:
+        return 400, 'text/plain; charset=utf-8', f"無效的參數: {e}\n"
+    return 404, 'text/html; charset=utf-8', '<h1>404 - Page Not Found</h1>'
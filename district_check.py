@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 地區核對
+用本地地區邊界文件對站點坐標做點在多邊形內判斷 (shapely 2 + STRtree)，
+標記與WFS的 District_TC 不一致的記錄
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import shapely
+
+# 本地地區邊界文件（GeoJSON，WGS84經緯度）
+DEFAULT_BOUNDARY_FILE = os.environ.get(
+    "DISTRICT_BOUNDARY_FILE", os.path.join("data", "districts.geojson")
+)
+
+# 邊界文件中可能的地區名稱字段
+NAME_FIELDS = ("District_TC", "NAME_TC", "DISTRICT_TC", "CNAME", "name_tc", "name")
+
+# DataFrame中的計算結果列名
+COMPUTED_COLUMN = "計算地區"
+MISMATCH_COLUMN = "地區不符"
+
+_index_cache = {}
+_index_lock = threading.Lock()
+
+
+def _district_name(props):
+    """從邊界要素屬性中取出地區名稱"""
+    for field in NAME_FIELDS:
+        value = props.get(field)
+        if value:
+            return str(value).strip()
+    return None
+
+
+def load_districts(path=DEFAULT_BOUNDARY_FILE):
+    """加載地區邊界並建立STRtree，文件不存在時返回None
+
+    結果按 (路徑, 修改時間) 緩存，邊界文件更新後自動重新加載。
+    返回字典 {'names': 地區名稱數組, 'geoms': 多邊形數組, 'tree': STRtree}
+    """
+    if not os.path.exists(path):
+        return None
+
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    with _index_lock:
+        if key in _index_cache:
+            return _index_cache[key]
+
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        names, geoms = [], []
+        for feature in data.get("features", []):
+            name = _district_name(feature.get("properties") or {})
+            geometry = feature.get("geometry")
+            if not name or not geometry:
+                continue
+            names.append(name)
+            geoms.append(shapely.from_geojson(json.dumps(geometry)))
+
+        geoms = np.array(geoms, dtype=object)
+        shapely.prepare(geoms)
+        index = {
+            "names": np.array(names, dtype=object),
+            "geoms": geoms,
+            "tree": shapely.STRtree(geoms),
+        }
+        _index_cache.clear()
+        _index_cache[key] = index
+        return index
+
+
+def locate_codes(index, lats, lngs):
+    """批量判斷點所在地區，返回地區序號數組（不在任何地區內為 -1）"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    codes = np.full(len(lats), -1, dtype=np.int32)
+
+    valid = np.isfinite(lats) & np.isfinite(lngs)
+    if not valid.any():
+        return codes
+
+    points = shapely.points(lngs[valid], lats[valid])
+    point_idx, district_idx = index["tree"].query(points, predicate="covered_by")
+
+    # 落在邊界上的點可能命中兩個地區，保留第一個
+    located = np.full(len(points), -1, dtype=np.int32)
+    located[point_idx[::-1]] = district_idx[::-1]
+    codes[valid] = located
+    return codes
+
+
+def locate_districts(index, lats, lngs):
+    """批量判斷點所在地區，返回地區名稱數組（不在任何地區內為None）"""
+    codes = locate_codes(index, lats, lngs)
+    names = np.append(index["names"], None)
+    return names[codes]
+
+
+def verify_districts(df, index, lat_col="緯度", lng_col="經度", district_col="地區"):
+    """核對DataFrame中的地區字段
+
+    加入兩列：計算地區（分類類型，可作為索引快速分組/過濾）和地區不符（布爾）。
+    """
+    if df.empty:
+        df[COMPUTED_COLUMN] = pd.Categorical([])
+        df[MISMATCH_COLUMN] = pd.Series(dtype=bool)
+        return df
+
+    computed = locate_districts(index, df[lat_col].astype(float), df[lng_col].astype(float))
+    categories = sorted(set(index["names"]))
+    df[COMPUTED_COLUMN] = pd.Categorical(computed, categories=categories)
+
+    reported = df[district_col].astype(str).str.strip()
+    df[MISMATCH_COLUMN] = df[COMPUTED_COLUMN].isna().to_numpy() | (
+        reported.to_numpy() != df[COMPUTED_COLUMN].astype(object).to_numpy()
+    )
+    return df
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 增量GeoJSON解析
+從響應流（socket或文件）按塊讀取，逐個解析 features 數組中的要素，
+只保留需要的屬性字段；內存中最多只有一個讀取塊和一個要素（只需Python 3標準庫）
+"""
+
+import codecs
+import json
+
+# 每次從流讀取的字節數
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+
+class _Reader:
+    """按塊讀取並增量解碼UTF-8的文本緩衝區"""
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """讀取下一塊；丟棄已解析的部分，返回是否讀到新內容"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        if not chunk:
+            self.eof = True
+            self.buf += self.decoder.decode(b"", final=True)
+            return False
+        self.buf += self.decoder.decode(chunk)
+        return True
+
+    def peek(self):
+        """跳過空白並返回下一個字符，流結束時返回空字符串"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars):
+        """讀取下一個非空白字符，必須是 chars 之一"""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"GeoJSON格式錯誤: 位置 {self.pos} 應為 {chars!r}，實際為 {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self, decoder):
+        """解析下一個完整的JSON值；內容不夠時繼續讀取
+
+        值必須在緩衝區結束之前結束（數字可能被截斷在塊邊界上），
+        除非流已經結束。
+        """
+        self.peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_features(stream, fields=None, chunk_size=CHUNK_SIZE):
+    """逐個產出FeatureCollection中的要素
+
+    stream 是任何有 read(n) 方法的二進制流（HTTP響應、文件）。
+    fields 不為None時只保留這些屬性字段（和要素id），丟棄幾何和其他屬性。
+    格式錯誤或內容被截斷時拋出 ValueError。
+    """
+    reader = _Reader(stream, chunk_size)
+    decoder = json.JSONDecoder()
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value(decoder)
+        reader.expect(":")
+        if key == "features":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+            else:
+                while True:
+                    feature = reader.value(decoder)
+                    if fields is not None:
+                        feature = project(feature, fields)
+                    yield feature
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            # 其他頂層成員（type、crs、numberMatched...）解析後丟棄
+            reader.value(decoder)
+        if reader.expect(",}") == "}":
+            return
+
+
+def project(feature, fields):
+    """只保留要素的id和指定的屬性字段"""
+    props = feature.get("properties") or {}
+    projected = {"properties": {field: props.get(field) for field in fields if field in props}}
+    if "id" in feature:
+        projected["id"] = feature["id"]
+    return projected
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - HTTP連接池
+按主機保持長連接 (keep-alive)，所有數據層和每次刷新共用同一批連接，
+避免每次請求都重新進行TCP+TLS握手（只需Python 3標準庫）
+"""
+
+import atexit
+import contextlib
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+from collections import deque
+
+# 每個主機最多同時打開的連接數
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+
+DEFAULT_TIMEOUT = float(os.environ.get("TIMEOUT_SECONDS", "10"))
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Connection': 'keep-alive',
+}
+
+# 重用的空閒連接可能已被服務器關閉，遇到這些錯誤時換新連接重試一次
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+    ConnectionAbortedError,
+)
+
+
+class PoolTimeout(TimeoutError):
+    """連接池已滿，在超時時間內沒有連接被歸還"""
+
+
+class Response:
+    """完整讀取的HTTP響應"""
+
+    def __init__(self, status, reason, headers, body, elapsed):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.elapsed = elapsed
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+
+class ConnectionPool:
+    """單個主機的連接池"""
+
+    def __init__(self, scheme, host, port, maxsize=HTTP_POOL_SIZE):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.maxsize = maxsize
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxsize)
+        self.created = 0
+        self.reused = 0
+
+    def _new_connection(self, timeout):
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        with self._lock:
+            self.created += 1
+        return cls(self.host, self.port, timeout=timeout)
+
+    def acquire(self, timeout):
+        """取得一個連接：優先重用空閒連接；返回 (連接, 是否重用)
+
+        連接池已滿時最多等待 timeout 秒，超時拋出 PoolTimeout（上游掛起時不會阻塞所有線程）。
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeout(f"{self.host}:{self.port} 的 {self.maxsize} 個連接都在使用中，等待 {timeout} 秒後超時")
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                self.reused += 1
+        if conn is None:
+            return self._new_connection(timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def release(self, conn, reusable=True):
+        """歸還連接；不可重用時直接關閉"""
+        try:
+            if reusable:
+                with self._lock:
+                    self._idle.append(conn)
+            else:
+                conn.close()
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """關閉所有空閒連接"""
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(scheme, host, port):
+    """返回主機對應的共享連接池"""
+    key = (scheme, host, port)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(scheme, host, port)
+        return pool
+
+
+def _split_url(url):
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme or 'http'
+    port = parts.port or (443 if scheme == 'https' else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return scheme, parts.hostname, port, path
+
+
+def request(method, url, headers=None, timeout=DEFAULT_TIMEOUT):
+    """經連接池發出請求並讀取完整響應"""
+    scheme, host, port, path = _split_url(url)
+    pool = get_pool(scheme, host, port)
+    request_headers = dict(DEFAULT_HEADERS)
+    request_headers.update(headers or {})
+
+    for attempt in range(2):
+        conn, reused = pool.acquire(timeout)
+        start = time.monotonic()
+        try:
+            conn.request(method, path, headers=request_headers)
+            response = conn.getresponse()
+            body = response.read()
+        except _STALE_CONNECTION_ERRORS:
+            pool.release(conn, reusable=False)
+            if reused and attempt == 0:
+                continue
+            raise
+        except BaseException:
+            pool.release(conn, reusable=False)
+            raise
+
+        pool.release(conn, reusable=not response.will_close)
+        return Response(response.status, response.reason, dict(response.getheaders()),
+                        body, time.monotonic() - start)
+
+
+@contextlib.contextmanager
+def stream(url, headers=None, timeout=DEFAULT_TIMEOUT):
+    """經連接池發出GET請求，返回尚未讀取的響應，調用方可按塊 read(n)
+
+    響應讀完後連接歸還連接池；提前退出時關閉連接（剩餘內容無法重用）。
+    """
+    scheme, host, port, path = _split_url(url)
+    pool = get_pool(scheme, host, port)
+    request_headers = dict(DEFAULT_HEADERS)
+    request_headers.update(headers or {})
+
+    for attempt in range(2):
+        conn, reused = pool.acquire(timeout)
+        try:
+            conn.request('GET', path, headers=request_headers)
+            response = conn.getresponse()
+            break
+        except _STALE_CONNECTION_ERRORS:
+            pool.release(conn, reusable=False)
+            if reused and attempt == 0:
+                continue
+            raise
+        except BaseException:
+            pool.release(conn, reusable=False)
+            raise
+
+    reusable = False
+    try:
+        yield response
+        # http.client 讀到響應末尾時會把響應標記為已關閉
+        reusable = response.isclosed() and not response.will_close
+    finally:
+        pool.release(conn, reusable=reusable)
+
+
+def get(url, headers=None, timeout=DEFAULT_TIMEOUT):
+    """經連接池發出GET請求"""
+    return request('GET', url, headers=headers, timeout=timeout)
+
+
+def stats():
+    """各主機連接池的統計：新建連接數、重用次數、空閒連接數"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {
+        f"{pool.scheme}://{pool.host}:{pool.port}": {
+            'created': pool.created,
+            'reused': pool.reused,
+            'idle': len(pool._idle),
+        }
+        for pool in pools
+    }
+
+
+def close_all():
+    """關閉所有空閒連接"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+
+# 退出時主動關閉空閒連接，服務器不必等待超時
+atexit.register(close_all)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 歷史事故串流聚合
+分塊讀取大型事故CSV，將每宗事故對應到最近的站點，
+並輸出按站點/地區/時段的聚合結果，供Streamlit前端即時加載
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from layers import LAYERS
+
+# 投影和空間索引相關模塊在聚合時才導入，
+# 簡化版前端只讀取結果文件，不需要安裝 shapely/pyproj
+
+# 默認輸出位置（兩個Streamlit前端都從這裡讀取）
+DEFAULT_OUTPUT = os.path.join("data", "incident_aggregates.json.gz")
+
+# 工作進程內的全局狀態（由initializer設置）
+_worker_tree = None
+_worker_station_count = 0
+_worker_districts = None
+
+
+def load_stations(layer="fire_station", geojson_path=None):
+    """從WFS（或本地GeoJSON文件）加載站點，返回DataFrame"""
+    station_layer = LAYERS[layer]
+    if geojson_path:
+        with open(geojson_path, encoding='utf-8') as f:
+            records = [station_layer.record(feature) for feature in json.load(f).get("features", [])]
+    else:
+        records = station_layer.fetch()
+
+    df = pd.DataFrame(records, columns=["fsd_id", "name", "district", "lat", "lng"])
+    df[["name", "district"]] = df[["name", "district"]].fillna("")
+    df = df.dropna(subset=["lat", "lng"]).reset_index(drop=True)
+    return df
+
+
+def _init_worker(station_eastings, station_northings, district_path=None):
+    """工作進程初始化：每個進程只建立一次空間索引（HK1980方格網，米）"""
+    global _worker_tree, _worker_station_count, _worker_districts
+    import shapely
+    import district_check
+
+    points = shapely.points(station_eastings, station_northings)
+    _worker_tree = shapely.STRtree(points)
+    _worker_station_count = len(station_eastings)
+    if district_path:
+        _worker_districts = district_check.load_districts(district_path)
+
+
+def _aggregate_chunk(lats, lngs, timestamps):
+    """聚合一個數據塊，返回(站點x小時計數, 地區計數, 未匹配數)
+
+    指定了地區邊界文件時，地區計數按事故坐標所在的地區統計，
+    最後一格為不在任何地區內的事故；否則為None。
+    """
+    import shapely
+    import district_check
+    from projection import to_hk1980
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    valid = np.isfinite(lats) & np.isfinite(lngs)
+
+    times = pd.to_datetime(pd.Series(timestamps), errors='coerce')
+    valid &= times.notna().to_numpy()
+    hours = times.dt.hour.fillna(0).astype(np.int64).to_numpy()
+
+    counts = np.zeros(_worker_station_count * 24, dtype=np.int64)
+    if valid.any():
+        easting, northing = to_hk1980(lats[valid], lngs[valid])
+        points = shapely.points(easting, northing)
+        _, nearest = _worker_tree.query_nearest(points, all_matches=False)
+        cells = nearest * 24 + hours[valid]
+        counts += np.bincount(cells, minlength=counts.size)
+
+    district_counts = None
+    if _worker_districts is not None:
+        codes = district_check.locate_codes(_worker_districts, lats[valid], lngs[valid])
+        # -1（不在任何地區內）放到最後一格
+        codes[codes < 0] = len(_worker_districts["names"])
+        district_counts = np.bincount(codes, minlength=len(_worker_districts["names"]) + 1)
+
+    return counts, district_counts, int((~valid).sum())
+
+
+def iter_chunks(paths, chunksize, lat_col, lng_col, time_col):
+    """逐塊讀取多個CSV文件，只保留需要的三列"""
+    for path in paths:
+        for chunk in pd.read_csv(path, usecols=[lat_col, lng_col, time_col], chunksize=chunksize):
+            yield (
+                pd.to_numeric(chunk[lat_col], errors='coerce').to_numpy(),
+                pd.to_numeric(chunk[lng_col], errors='coerce').to_numpy(),
+                chunk[time_col].to_numpy(),
+            )
+
+
+def run_pipeline(paths, stations, chunksize=200_000, workers=None,
+                 lat_col="latitude", lng_col="longitude", time_col="timestamp",
+                 district_path=None):
+    """並行聚合事故數據
+
+    同時在途的數據塊不超過 workers*2 個，因此內存佔用與文件大小無關。
+    """
+    import district_check
+    from projection import to_hk1980
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 2
+    station_count = len(stations)
+
+    districts = district_check.load_districts(district_path) if district_path else None
+    totals = {
+        'station_hour': np.zeros(station_count * 24, dtype=np.int64),
+        'districts': np.zeros(len(districts["names"]) + 1, dtype=np.int64) if districts else None,
+        'unmatched': 0,
+        'chunks': 0,
+    }
+
+    def merge(future):
+        counts, district_counts, missing = future.result()
+        totals['station_hour'] += counts
+        if district_counts is not None:
+            totals['districts'] += district_counts
+        totals['unmatched'] += missing
+        totals['chunks'] += 1
+
+    easting, northing = to_hk1980(stations["lat"].to_numpy(), stations["lng"].to_numpy())
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(easting, northing, district_path),
+    ) as executor:
+        pending = set()
+        for chunk in iter_chunks(paths, chunksize, lat_col, lng_col, time_col):
+            pending.add(executor.submit(_aggregate_chunk, *chunk))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge(future)
+        for future in pending:
+            merge(future)
+
+    station_hour = totals['station_hour'].reshape(station_count, 24)
+    district_totals = None
+    if districts is not None:
+        district_totals = pd.Series(totals['districts'][:-1], index=districts["names"])
+        district_totals = district_totals.groupby(level=0).sum()
+    return build_result(stations, station_hour, totals['unmatched'], totals['chunks'], paths,
+                        district_totals)
+
+
+def build_result(stations, station_hour, unmatched, chunks_done, paths, district_totals=None):
+    """將站點x小時矩陣整理為緊湊的結果字典
+
+    district_totals 為按事故坐標核對的地區計數；未提供時按最近站點的地區統計。
+    """
+    station_totals = station_hour.sum(axis=1)
+
+    by_station = []
+    for i, row in enumerate(stations.to_dict("records")):
+        by_station.append({
+            "fsd_id": row["fsd_id"],
+            "name": row["name"],
+            "district": row["district"],
+            "count": int(station_totals[i]),
+            "hours": station_hour[i].tolist(),
+        })
+
+    if district_totals is None:
+        district_totals = pd.Series(station_totals, index=stations["district"]).groupby(level=0).sum()
+
+    return {
+        "generated_at": datetime.now().isoformat(timespec='seconds'),
+        "sources": [os.path.basename(p) for p in paths],
+        "chunks": chunks_done,
+        "total_incidents": int(station_totals.sum()),
+        "unmatched": unmatched,
+        "by_station": by_station,
+        "by_district": {k: int(v) for k, v in district_totals.items()},
+        "by_hour": station_hour.sum(axis=0).tolist(),
+    }
+
+
+def write_result(result, output_path=DEFAULT_OUTPUT):
+    """寫入gzip壓縮的JSON結果（先寫臨時文件再替換，避免前端讀到半個文件）"""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, output_path)
+
+
+def load_result(path=DEFAULT_OUTPUT):
+    """讀取聚合結果，文件不存在時返回None"""
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def result_frames(result):
+    """將聚合結果轉為(站點, 地區, 時段)三個DataFrame，供前端直接顯示"""
+    by_station = pd.DataFrame(
+        [{k: v for k, v in item.items() if k != "hours"} for item in result["by_station"]],
+        columns=["fsd_id", "name", "district", "count"],
+    ).sort_values("count", ascending=False).reset_index(drop=True)
+    by_station.columns = ["消防處編號", "名稱", "地區", "事故數"]
+
+    by_district = pd.DataFrame(
+        sorted(result["by_district"].items(), key=lambda kv: kv[1], reverse=True),
+        columns=["地區", "事故數"],
+    )
+
+    by_hour = pd.DataFrame({"時段": list(range(24)), "事故數": result["by_hour"]})
+    return by_station, by_district, by_hour
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="歷史事故CSV串流聚合")
+    parser.add_argument("csv", nargs="+", help="事故CSV文件")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="輸出文件")
+    parser.add_argument("--layer", choices=sorted(LAYERS), default="fire_station",
+                        help="對應到哪一類站點")
+    parser.add_argument("--stations", help="使用本地GeoJSON站點文件代替WFS")
+    parser.add_argument("--districts", help="地區邊界GeoJSON，按事故坐標核對地區")
+    parser.add_argument("--chunksize", type=int, default=200_000, help="每塊行數")
+    parser.add_argument("--workers", type=int, default=None, help="工作進程數")
+    parser.add_argument("--lat-col", default="latitude")
+    parser.add_argument("--lng-col", default="longitude")
+    parser.add_argument("--time-col", default="timestamp")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("  歷史事故串流聚合")
+    print("=" * 60)
+
+    stations = load_stations(args.layer, args.stations)
+    if stations.empty:
+        print("❌ 無法加載站點數據")
+        return False
+    print(f"📍 站點數量: {len(stations)}")
+
+    start = time.perf_counter()
+    result = run_pipeline(
+        args.csv, stations,
+        chunksize=args.chunksize, workers=args.workers,
+        lat_col=args.lat_col, lng_col=args.lng_col, time_col=args.time_col,
+        district_path=args.districts,
+    )
+    write_result(result, args.output)
+
+    print(f"✅ 完成: {result['total_incidents']} 宗事故, {result['unmatched']} 宗無法對應")
+    print(f"   耗時: {time.perf_counter() - start:.1f}秒")
+    print(f"   輸出: {args.output}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
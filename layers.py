@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 數據層註冊表和刷新調度器
+每個WFS數據層只需聲明URL、字段映射、TTL和優先級；調度器在有界線程池上
+按各自的TTL（加隨機抖動）刷新到期的數據層，內容哈希沒有變化時不通知下游
+（只需Python 3標準庫）
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import access_log
+import cache_backend
+import wfs_paging
+
+# 配置（見 .env.example）
+LAYER_TTL_SECONDS = float(os.environ.get("LAYER_TTL_SECONDS", "3600"))
+REFRESH_WORKERS = int(os.environ.get("REFRESH_WORKERS", "2"))
+REFRESH_JITTER = float(os.environ.get("REFRESH_JITTER", "0.1"))
+REFRESH_RETRY_SECONDS = float(os.environ.get("REFRESH_RETRY_SECONDS", "300"))
+# 使用共享數據緩存時，每隔多少秒檢查其他進程是否已刷新
+CACHE_POLL_SECONDS = float(os.environ.get("CACHE_POLL_SECONDS", "5"))
+
+# 把所有數據層指向另一個WFS服務器（例如 wfs_replay.py 的本地回放服務器），
+# 只替換協議和主機，保留路徑和查詢參數
+WFS_UPSTREAM = os.environ.get("WFS_UPSTREAM", "")
+
+# 刷新結果
+UPDATED = "updated"        # 內容有變化，已通知下游
+UNCHANGED = "unchanged"    # 內容哈希相同，跳過下游處理
+FAILED = "failed"          # 上游獲取失敗，保留舊數據
+
+# 消防處站點數據層的字段映射：記錄字段 -> WFS屬性
+STATION_FIELDS = {
+    "id": "OBJECTID",
+    "fsd_id": "FSDID",
+    "name": "Name_TC",
+    "name_en": "Name_ENG",
+    "address": "Address_TC",
+    "address_en": "Address_ENG",
+    "district": "District_TC",
+    "district_en": "District_ENG",
+    "phone": "Telephone",
+    "lat": "Latitude",
+    "lng": "Longitude",
+}
+
+
+class Layer:
+    """一個WFS數據層的聲明
+
+    fields 把WFS屬性映射為記錄字段，解析時只保留這些屬性；
+    priority 越大，同時到期時越先刷新；
+    tiled=True 的數據層要素很多，地圖放大後按可見範圍的瓦片獲取（tile_cache），
+    站點數據層只有一百多個要素，總是顯示完整記錄。
+    """
+
+    def __init__(self, name, label, url, fields, ttl=LAYER_TTL_SECONDS, priority=0, tiled=False):
+        self.name = name
+        self.label = label
+        self.source_url = url
+        self.fields = dict(fields)
+        self.ttl = ttl
+        self.priority = priority
+        self.tiled = tiled
+
+    @property
+    def url(self):
+        """實際請求的URL（設置了 WFS_UPSTREAM 時指向該服務器）"""
+        return upstream_url(self.source_url)
+
+    @property
+    def typename(self):
+        """GetFeature 的 typenames 參數"""
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.source_url).query)
+        query = {key.lower(): values for key, values in query.items()}
+        return (query.get('typenames') or query.get('typename') or [''])[0]
+
+    def record(self, feature):
+        """把一個要素轉換為記錄"""
+        props = feature.get("properties", {})
+        return {key: props.get(prop) for key, prop in self.fields.items()}
+
+    def fetch(self):
+        """分頁獲取整個數據層的記錄（帶重試、對沖和熔斷）"""
+        return wfs_paging.fetch_all(self.url, self.name, self.record, fields=tuple(self.fields.values()))
+
+    @property
+    def cache_key(self):
+        """在共享數據緩存（cache_backend）中的鍵：包含URL和字段映射的哈希，
+        指向回放服務器（WFS_UPSTREAM）的進程不會和讀取正式數據的進程共用條目"""
+        source = json.dumps([self.url, self.fields], sort_keys=True)
+        return f"layer:{self.name}:{hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]}"
+
+    def fetch_cached(self, cache, max_age=None):
+        """經共享數據緩存獲取記錄，返回 cache_backend.Entry
+
+        緩存中有不超過 max_age（默認為TTL）秒的記錄時直接使用，否則請求上游並寫入緩存，
+        其他進程和入口下次直接讀取；cache 為None或緩存不可用時直接請求上游。
+        """
+        if cache is not None:
+            try:
+                return cache.get_or_load(self.cache_key, self.fetch, self.ttl if max_age is None else max_age)
+            except cache_backend.CacheUnavailable as e:
+                access_log.event("WARNING", f"⚠️ 數據緩存不可用，直接請求上游: {e}", layer=self.name)
+        return cache_backend.Entry(self.fetch(), time.time(), None)
+
+
+def upstream_url(url, upstream=None):
+    """把URL的協議和主機替換為 upstream（默認 WFS_UPSTREAM，為空時原樣返回）"""
+    upstream = WFS_UPSTREAM if upstream is None else upstream
+    if not upstream:
+        return url
+    base = urllib.parse.urlsplit(upstream)
+    return urllib.parse.urlunsplit(urllib.parse.urlsplit(url)._replace(scheme=base.scheme, netloc=base.netloc))
+
+
+# 數據層註冊表（按註冊順序）
+LAYERS = {}
+
+
+def register(layer):
+    """註冊數據層，返回該數據層"""
+    LAYERS[layer.name] = layer
+    return layer
+
+
+register(Layer(
+    'ambulance', '救護站',
+    "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634799003993_7633/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=AmbDepots&outputFormat=geojson",
+    STATION_FIELDS, priority=10,
+))
+register(Layer(
+    'fire_station', '消防局',
+    "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634798867463_89696/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=FireStations&outputFormat=geojson",
+    STATION_FIELDS, priority=10,
+))
+
+
+def content_hash(records):
+    """記錄列表的內容哈希"""
+    payload = json.dumps(records, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _LayerState:
+    """調度器中單個數據層的狀態"""
+
+    def __init__(self):
+        self.records = None
+        self.content_hash = None
+        self.updated_at = None    # 內容最後一次變化的時間 (time.time())
+        self.checked_at = None    # 最後一次成功獲取的時間
+        self.error = None
+        self.next_due = 0.0       # 下次刷新的 monotonic 時間
+        self.running = False
+        self.version = None       # 上次讀到的共享緩存版本
+
+
+class LayerScheduler:
+    """按數據層TTL刷新的調度器
+
+    on_update(layer, records) 在內容有變化時調用，on_error(layer, error) 在獲取失敗或 on_update
+    拋出異常時調用，兩者都在工作線程中執行。失敗的數據層在 retry_seconds（不超過TTL）後重試，
+    on_update 失敗時重試會再次通知。
+
+    設置了 cache（cache_backend 的後端）時經緩存獲取：其他進程剛刷新過的數據層直接讀取緩存，
+    下次到期時間按緩存數據的年齡計算；其他進程寫入新版本時，下一輪調度即讀入。
+    """
+
+    def __init__(self, layers=None, workers=REFRESH_WORKERS, jitter=REFRESH_JITTER,
+                 retry_seconds=REFRESH_RETRY_SECONDS, on_update=None, on_error=None, cache=None):
+        self.layers = dict(layers if layers is not None else LAYERS)
+        self.cache = cache
+        self.jitter = jitter
+        self.retry_seconds = retry_seconds
+        self.on_update = on_update
+        self.on_error = on_error
+        self._states = {name: _LayerState() for name in self.layers}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="layer-refresh")
+        self._stopped = threading.Event()
+        self._wakeup = threading.Event()   # 刷新完成時喚醒調度線程，重新計算下次到期時間
+        self._thread = None
+
+    def _delay(self, seconds):
+        """加入隨機抖動，避免所有數據層（和所有進程）同時請求上游"""
+        return seconds * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _refresh(self, name, force=False):
+        layer = self.layers[name]
+        state = self._states[name]
+        try:
+            # 抖動可能使本進程比TTL早到期，早於最短到期時間寫入的緩存才視為過期
+            entry = layer.fetch_cached(self.cache, 0 if force else layer.ttl * (1 - self.jitter))
+        except Exception as e:
+            with self._lock:
+                state.error = str(e)
+                state.next_due = time.monotonic() + self._delay(min(layer.ttl, self.retry_seconds))
+                state.running = False
+            self._wakeup.set()
+            access_log.event("WARNING", f"⚠️ {layer.label}數據更新失敗，繼續使用舊數據: {e}",
+                             layer=name, error=str(e))
+            if self.on_error:
+                self.on_error(layer, e)
+            return FAILED
+
+        records = entry.value
+        age = max(0.0, time.time() - entry.stored_at)
+        digest = content_hash(records)
+        with self._lock:
+            changed = digest != state.content_hash
+            if changed:
+                state.records = records
+                state.content_hash = digest
+                state.updated_at = time.time()
+            state.checked_at = entry.stored_at
+            state.error = None
+            state.version = entry.version
+            state.next_due = time.monotonic() + max(0.0, self._delay(layer.ttl) - age)
+            state.running = False
+        self._wakeup.set()
+
+        if changed:
+            access_log.event("INFO", f"✅ {layer.label}: {len(records)} 個", layer=name, records=len(records))
+            if self.on_update:
+                try:
+                    self.on_update(layer, records)
+                except Exception as e:
+                    # 派生數據（後備站點排名、歷史快照等）沒有更新：清除內容哈希，重試時重新通知
+                    with self._lock:
+                        state.content_hash = None
+                        state.error = f"更新失敗: {e}"
+                        state.next_due = time.monotonic() + self._delay(min(layer.ttl, self.retry_seconds))
+                    self._wakeup.set()
+                    access_log.event("ERROR", f"❌ {layer.label}數據已獲取，但更新失敗: {e}",
+                                     layer=name, error=str(e))
+                    if self.on_error:
+                        self.on_error(layer, e)
+                    return FAILED
+        return UPDATED if changed else UNCHANGED
+
+    def _submit(self, name, force=False):
+        """提交一個數據層的刷新；已在刷新中時返回None"""
+        with self._lock:
+            state = self._states[name]
+            if state.running:
+                return None
+            state.running = True
+        return self._executor.submit(self._refresh, name, force)
+
+    def _refreshed_elsewhere(self):
+        """共享緩存中版本號與本進程上次讀到的不同的數據層（其他進程已刷新）"""
+        with self._lock:
+            seen = {name: state.version for name, state in self._states.items()
+                    if state.version is not None and not state.running}
+        changed = []
+        for name, version in seen.items():
+            try:
+                if self.cache.version(self.layers[name].cache_key) != version:
+                    changed.append(name)
+            except cache_backend.CacheUnavailable:
+                break
+        return changed
+
+    def _by_priority(self, names):
+        return sorted(names, key=lambda name: -self.layers[name].priority)
+
+    def run_pending(self):
+        """提交所有到期的數據層，返回 {數據層: Future}"""
+        now = time.monotonic()
+        with self._lock:
+            due = [name for name, state in self._states.items()
+                   if not state.running and state.next_due <= now]
+        if self.cache is not None:
+            due += [name for name in self._refreshed_elsewhere() if name not in due]
+        futures = {name: self._submit(name) for name in self._by_priority(due)}
+        return {name: future for name, future in futures.items() if future is not None}
+
+    def refresh_all(self, force=True):
+        """立即刷新所有數據層並等待完成，返回 {數據層: 狀態}
+
+        force=False 時（例如啟動時）使用共享緩存中未過期的數據，不請求上游。
+        """
+        futures = {name: self._submit(name, force) for name in self._by_priority(self.layers)}
+        return {name: future.result() for name, future in futures.items() if future is not None}
+
+    def seconds_until_next(self):
+        """距下一個數據層到期的秒數（0.05到60秒之間；使用共享緩存時不超過 CACHE_POLL_SECONDS）"""
+        longest = 60.0 if self.cache is None else min(60.0, CACHE_POLL_SECONDS)
+        with self._lock:
+            pending = [state.next_due for state in self._states.values() if not state.running]
+        if not pending:
+            return longest
+        return min(longest, max(0.05, min(pending) - time.monotonic()))
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            self.run_pending()
+            self._wakeup.wait(self.seconds_until_next())
+            self._wakeup.clear()
+
+    def start(self):
+        """啟動後台調度線程（啟動後立即刷新所有數據層）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True, name="layer-scheduler")
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止調度（進行中的刷新會完成）"""
+        self._stopped.set()
+        self._wakeup.set()
+        self._executor.shutdown(wait=False)
+
+    def records(self, name):
+        """數據層的最新記錄，尚未加載時返回空列表"""
+        with self._lock:
+            return self._states[name].records or []
+
+    def status(self):
+        """各數據層的狀態：記錄數、更新時間、最近錯誤、距下次刷新秒數"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    'label': self.layers[name].label,
+                    'records': len(state.records or []),
+                    'updated_at': state.updated_at,
+                    'checked_at': state.checked_at,
+                    'error': state.error,
+                    'next_refresh_seconds': None if state.running else max(0.0, state.next_due - now),
+                }
+                for name, state in self._states.items()
+            }
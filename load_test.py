@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+HTTP壓力測試
+啟動本地回放WFS服務器（wfs_replay.py，合成夾具）作為上游，再以子進程啟動要測試的服務器，
+用多個保持連接的客戶端按查詢組合（類型、搜索、地區）持續請求，報告吞吐量、延遲百分位、
+錯誤和服務器RSS隨時間的變化（只需Python 3標準庫）
+
+用法:
+    python load_test.py --server start_server --concurrency 32 --duration 30
+    python load_test.py --server run_simple --concurrency 8 --duration 10
+    python load_test.py --server async_server --idle 5000 --concurrency 32   # 同時保持5000個空閒連接
+    PREFORK_WORKERS=4 python load_test.py --server prefork_server --concurrency 32
+    python load_test.py --url http://127.0.0.1:8000 --pid 12345     # 測試已在運行的服務器
+    python load_test.py --mix type=3,search=2,district=2,home=1 --scale 10 --output data/load/result.json
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+
+import wfs_replay
+from layers import LAYERS
+
+# 可測試的服務器：腳本、端口參數、支持的查詢類型、就緒檢查路徑（返回200且內容包含 ready_marker 時就緒）
+SERVERS = {
+    'start_server': {
+        'script': 'start_server.py',
+        'kinds': ('home', 'type', 'search', 'district', 'backup'),
+        'ready_path': '/metrics',
+        'ready_marker': 'fsd_data_age_seconds{layer="fire_station"}',
+    },
+    'async_server': {
+        'script': 'async_server.py',
+        'kinds': ('home', 'type', 'search', 'district', 'backup'),
+        'ready_path': '/metrics',
+        'ready_marker': 'fsd_data_age_seconds{layer="fire_station"}',
+    },
+    'prefork_server': {
+        'script': 'prefork_server.py',
+        'kinds': ('home', 'type', 'search', 'district', 'backup'),
+        'ready_path': '/metrics',
+        'ready_marker': 'fsd_data_age_seconds{layer="fire_station"}',
+    },
+    'run_simple': {
+        'script': 'run_simple.py',
+        'kinds': ('home',),
+        'ready_path': '/',
+        'ready_marker': '',
+    },
+}
+
+DEFAULT_MIX = "home=1,type=3,search=2,district=2,backup=1"
+SEARCH_TERMS = ["消防", "救護", "測試道1", "沙田", "不存在的站點"]
+DISTRICTS = ["中西區", "灣仔區", "沙田區", "元朗區", "離島區"]
+# start_server.generate_html 支持的 type 參數值
+DATA_TYPES = ["fire", "ambulance", "all"]
+
+# 延遲百分位
+PERCENTILES = (50, 90, 95, 99)
+
+
+def parse_mix(text, kinds):
+    """"type=3,search=2" -> [(類型, 權重)]，忽略服務器不支持的類型"""
+    mix = []
+    for item in text.split(','):
+        if not item.strip():
+            continue
+        kind, _, weight = item.partition('=')
+        kind = kind.strip()
+        if kind in kinds and float(weight or 1) > 0:
+            mix.append((kind, float(weight or 1)))
+    if not mix:
+        raise ValueError(f"查詢組合中沒有該服務器支持的類型: {', '.join(kinds)}")
+    return mix
+
+
+def request_path(kind, rng, fsd_ids=()):
+    """按查詢類型生成請求路徑"""
+    if kind == 'type':
+        return "/?" + urllib.parse.urlencode({'type': rng.choice(DATA_TYPES)})
+    if kind == 'search':
+        return "/?" + urllib.parse.urlencode({'search': rng.choice(SEARCH_TERMS)})
+    if kind == 'district':
+        return "/?" + urllib.parse.urlencode({'district': rng.choice(DISTRICTS)})
+    if kind == 'backup':
+        return "/api/backup?" + urllib.parse.urlencode({'id': rng.choice(fsd_ids or ['F001'])})
+    return "/"
+
+
+def percentile(sorted_values, pct):
+    """最近秩百分位"""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))]
+
+
+def rss_bytes(pid, include_children=True):
+    """進程（及其子進程）的常駐內存；讀取失敗時返回None"""
+    pids = {pid}
+    if include_children and os.path.isdir('/proc'):
+        parents = {}
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    with open(f'/proc/{entry}/stat') as f:
+                        parents[int(entry)] = int(f.read().rsplit(')', 1)[1].split()[1])
+                except (OSError, ValueError, IndexError):
+                    continue
+        changed = True
+        while changed:
+            children = {child for child, parent in parents.items() if parent in pids} - pids
+            changed = bool(children)
+            pids |= children
+
+    total = 0
+    for item in pids:
+        try:
+            with open(f'/proc/{item}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            if item == pid:
+                # 沒有 /proc（例如macOS）時用 ps
+                try:
+                    output = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True,
+                                            text=True, timeout=5).stdout.strip()
+                    return int(output) * 1024 if output else None
+                except (OSError, ValueError, subprocess.SubprocessError):
+                    return None
+    return total
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def http_get(host, port, path, timeout=10):
+    """單次請求（用於就緒檢查），返回 (狀態碼, 內容)"""
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+class ServerProcess:
+    """以子進程運行要測試的服務器，上游指向回放服務器"""
+
+    def __init__(self, name, upstream, port=None, env=None):
+        self.name = name
+        self.spec = SERVERS[name]
+        self.port = port or free_port()
+        self.upstream = upstream
+        self.workdir = tempfile.mkdtemp(prefix="load-test-")
+        self.log_path = os.path.join(self.workdir, "server.log")
+        self.env = dict(os.environ, WFS_UPSTREAM=upstream, PYTHONUNBUFFERED="1",
+                        SNAPSHOT_DIR=os.path.join(self.workdir, "snapshots"),
+                        TILE_CACHE_DIR=os.path.join(self.workdir, "tiles"), **(env or {}))
+        self.process = None
+
+    def start(self, timeout=60):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), self.spec['script'])
+        self._log = open(self.log_path, 'wb')
+        # 控制台輸出寫入文件而不是管道（管道寫滿會阻塞服務器）；訪問日誌在工作目錄的 logs/app.log
+        self.process = subprocess.Popen([sys.executable, script, str(self.port)], env=self.env,
+                                        stdout=self._log, stderr=subprocess.STDOUT, cwd=self.workdir)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.name} 已退出（{self.process.returncode}）:\n{self.log_tail()}")
+            try:
+                status, body = http_get("127.0.0.1", self.port, self.spec['ready_path'], timeout=2)
+                if status == 200 and self.spec['ready_marker'].encode('utf-8') in body:
+                    return self
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"{self.name} 在 {timeout} 秒內沒有就緒:\n{self.log_tail()}")
+
+    def log_tail(self, lines=20):
+        try:
+            with open(self.log_path, encoding='utf-8', errors='replace') as f:
+                return "".join(f.readlines()[-lines:])
+        except OSError:
+            return ""
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        if getattr(self, '_log', None):
+            self._log.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class StubUpstream:
+    """合成夾具 + 本地回放WFS服務器"""
+
+    def __init__(self, scale=1, latency=0.0, stations=80):
+        self.directory = tempfile.mkdtemp(prefix="load-test-fixtures-")
+        self.fsd_ids = []
+        for layer in LAYERS.values():
+            features = wfs_replay.synthetic_features(layer, stations)
+            wfs_replay.save_fixture(self.directory, layer, features, source_url="synthetic")
+            if layer.name == 'fire_station':
+                self.fsd_ids = [f["properties"]["FSDID"] for f in features]
+        self.server = wfs_replay.start_replay_server(self.directory, scale=scale, latency=latency)
+        self.base_url = self.server.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def raise_file_limit(needed):
+    """需要打開大量連接時提高本進程的打開文件數上限，返回可用的上限"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        target = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+def open_idle_connections(host, port, count, log=print):
+    """打開 count 個不發送請求的連接（模擬大量保持連接、暫時不輪詢的客戶端），返回套接字列表"""
+    limit = raise_file_limit(count + 256)
+    if limit is not None and limit < count + 64:
+        log(f"⚠️ 打開文件數上限 {limit}，只打開 {max(0, limit - 64)} 個空閒連接")
+        count = max(0, limit - 64)
+    sockets = []
+    for _ in range(count):
+        try:
+            sockets.append(socket.create_connection((host, port), timeout=10))
+        except OSError as e:
+            log(f"⚠️ 打開第 {len(sockets) + 1} 個空閒連接失敗: {e}")
+            break
+    for sock in sockets:
+        sock.setblocking(False)
+    return sockets
+
+
+def count_alive(sockets):
+    """仍然打開（服務器沒有關閉）的連接數"""
+    alive = 0
+    for sock in sockets:
+        try:
+            alive += sock.recv(1) != b''
+        except BlockingIOError:
+            alive += 1
+        except OSError:
+            pass
+    return alive
+
+
+class LoadResult:
+    """所有客戶端的請求記錄（每個客戶端寫自己的列表，結束後合併，避免鎖競爭）"""
+
+    def __init__(self):
+        self.samples = []     # (完成時間, 查詢類型, 狀態碼或錯誤, 延遲秒, 字節數)
+        self.rss = []         # (時間, 字節)
+
+
+def client(host, port, mix, deadline, started, samples, seed, fsd_ids, timeout):
+    """一個保持連接的客戶端：按權重選擇查詢，直到 deadline"""
+    rng = random.Random(seed)
+    kinds, weights = zip(*mix)
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    while time.monotonic() < deadline:
+        kind = rng.choices(kinds, weights)[0]
+        path = request_path(kind, rng, fsd_ids)
+        start = time.monotonic()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            size = len(response.read())
+            outcome = response.status
+            if response.will_close:
+                conn.close()
+        except (OSError, http.client.HTTPException) as e:
+            outcome, size = type(e).__name__, 0
+            conn.close()
+        now = time.monotonic()
+        samples.append((now - started, kind, outcome, now - start, size))
+    conn.close()
+
+
+def run_load(host, port, mix, duration, concurrency, pid=None, fsd_ids=(), timeout=10, log=print):
+    """運行壓力測試，返回 LoadResult"""
+    result = LoadResult()
+    started = time.monotonic()
+    deadline = started + duration
+    per_client = [[] for _ in range(concurrency)]
+    threads = [threading.Thread(target=client, daemon=True,
+                                args=(host, port, mix, deadline, started, per_client[i], i, fsd_ids, timeout))
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    # 每秒採樣服務器RSS並打印進度
+    next_tick = started + 1
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(max(0.0, min(next_tick, deadline + timeout) - time.monotonic()))
+        if time.monotonic() >= next_tick:
+            elapsed = time.monotonic() - started
+            rss = rss_bytes(pid) if pid else None
+            result.rss.append((elapsed, rss))
+            done = sum(len(samples) for samples in per_client)
+            log(f"   {elapsed:5.1f}s  {done:>8,} 個請求" + (f"  RSS {rss / 1024 / 1024:7.1f} MB" if rss else ""))
+            next_tick += 1
+        if time.monotonic() > deadline + timeout:
+            break
+
+    for samples in per_client:
+        result.samples.extend(samples)
+    result.samples.sort(key=lambda sample: sample[0])
+    return result
+
+
+def summarize(result, duration):
+    """吞吐量、延遲百分位、錯誤、RSS和每秒吞吐量"""
+    ok = [s for s in result.samples if isinstance(s[2], int) and s[2] < 400]
+    latencies = sorted(s[3] for s in ok)
+    outcomes = {}
+    for sample in result.samples:
+        outcomes[str(sample[2])] = outcomes.get(str(sample[2]), 0) + 1
+    by_kind = {}
+    for _, kind, outcome, latency, _ in result.samples:
+        by_kind.setdefault(kind, []).append(latency)
+    per_second = [0] * max(1, int(duration + 0.999))
+    for sample in result.samples:
+        per_second[min(len(per_second) - 1, int(sample[0]))] += 1
+    rss = [value for _, value in result.rss if value]
+    return {
+        'requests': len(result.samples),
+        'errors': len(result.samples) - len(ok),
+        'throughput_rps': len(ok) / duration,
+        'bytes': sum(s[4] for s in ok),
+        'latency_ms': dict({f"p{p}": percentile(latencies, p) * 1000 if latencies else None for p in PERCENTILES},
+                           mean=sum(latencies) / len(latencies) * 1000 if latencies else None,
+                           max=latencies[-1] * 1000 if latencies else None),
+        'latency_p95_ms_by_kind': {kind: percentile(sorted(values), 95) * 1000 for kind, values in by_kind.items()},
+        'outcomes': outcomes,
+        'throughput_per_second': per_second,
+        'rss_mb': {'start': rss[0] / 1024 / 1024, 'max': max(rss) / 1024 / 1024,
+                   'end': rss[-1] / 1024 / 1024} if rss else None,
+        'rss_timeline': [(round(t, 1), value) for t, value in result.rss],
+    }
+
+
+def print_summary(summary, log=print):
+    latency = summary['latency_ms']
+    log("")
+    log(f"📊 {summary['requests']:,} 個請求，{summary['errors']:,} 個錯誤，吞吐量 {summary['throughput_rps']:.1f} 請求/秒")
+    if latency['p50'] is not None:
+        log("⏱️ 延遲(毫秒): " + "  ".join(f"{key} {latency[key]:.1f}" for key in
+                                          [f"p{p}" for p in PERCENTILES] + ['mean', 'max']))
+    log("   各查詢類型p95: " + "  ".join(f"{kind} {value:.1f}" for kind, value in
+                                     sorted(summary['latency_p95_ms_by_kind'].items())))
+    log("   結果: " + "  ".join(f"{outcome}×{count}" for outcome, count in sorted(summary['outcomes'].items())))
+    if summary['rss_mb']:
+        rss = summary['rss_mb']
+        log(f"💾 服務器RSS(MB): 開始 {rss['start']:.1f}  最高 {rss['max']:.1f}  結束 {rss['end']:.1f}")
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="標準庫服務器的HTTP壓力測試")
+    parser.add_argument("--server", choices=sorted(SERVERS), default="start_server", help="要啟動和測試的服務器")
+    parser.add_argument("--url", help="測試已在運行的服務器（不啟動子進程和回放服務器）")
+    parser.add_argument("--pid", type=int, help="與 --url 一起使用時採樣該進程的RSS")
+    parser.add_argument("--concurrency", type=int, default=16, help="並發客戶端數")
+    parser.add_argument("--duration", type=float, default=15.0, help="持續時間（秒）")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"查詢組合及權重（默認 {DEFAULT_MIX}）")
+    parser.add_argument("--scale", type=int, default=1, help="上游站點數倍數")
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="上游每個請求的延遲（秒）")
+    parser.add_argument("--timeout", type=float, default=10.0, help="單個請求超時（秒）")
+    parser.add_argument("--idle", type=int, default=0, help="壓力測試期間同時保持的空閒連接數")
+    parser.add_argument("--output", help="把結果寫入JSON文件")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("  HTTP壓力測試")
+    print("=" * 50)
+
+    upstream = server = None
+    fsd_ids = []
+    try:
+        if args.url:
+            parts = urllib.parse.urlsplit(args.url)
+            host, port, pid = parts.hostname, parts.port or 80, args.pid
+            kinds = tuple(kind for kind, _ in (item.split('=', 1) for item in args.mix.split(',')))
+            target = args.url
+        else:
+            upstream = StubUpstream(args.scale, args.upstream_latency)
+            fsd_ids = upstream.fsd_ids
+            print(f"📼 回放上游: {upstream.base_url}（{args.scale}×）")
+            print(f"🚀 啟動 {args.server}...")
+            server = ServerProcess(args.server, upstream.base_url).start()
+            host, port, pid = "127.0.0.1", server.port, server.process.pid
+            kinds = SERVERS[args.server]['kinds']
+            target = f"{args.server} (http://127.0.0.1:{port})"
+
+        mix = parse_mix(args.mix, kinds)
+        idle, idle_summary = [], None
+        if args.idle:
+            rss_before = rss_bytes(pid) if pid else None
+            start = time.monotonic()
+            idle = open_idle_connections(host, port, args.idle)
+            time.sleep(1)
+            rss_after = rss_bytes(pid) if pid else None
+            idle_summary = {'requested': args.idle, 'opened': len(idle), 'open_seconds': time.monotonic() - start - 1,
+                            'rss_before_mb': rss_before / 1024 / 1024 if rss_before else None,
+                            'rss_after_mb': rss_after / 1024 / 1024 if rss_after else None}
+            print(f"🔌 打開 {len(idle):,} 個空閒連接，用時 {idle_summary['open_seconds']:.1f} 秒" +
+                  (f"，服務器RSS {idle_summary['rss_before_mb']:.1f} → {idle_summary['rss_after_mb']:.1f} MB"
+                   f"（每個連接約 {(rss_after - rss_before) / max(1, len(idle)) / 1024:.1f} KB）"
+                   if rss_before and rss_after else ""))
+        print(f"🎯 {target}: {args.concurrency} 個客戶端，{args.duration:.0f} 秒，"
+              f"組合 {', '.join(f'{kind}={weight:g}' for kind, weight in mix)}")
+        result = run_load(host, port, mix, args.duration, args.concurrency, pid, fsd_ids, args.timeout)
+        summary = summarize(result, args.duration)
+        print_summary(summary)
+        if idle:
+            idle_summary['alive_after_load'] = count_alive(idle)
+            summary['idle_connections'] = idle_summary
+            print(f"🔌 壓力測試結束時仍打開的空閒連接: {idle_summary['alive_after_load']:,} / {len(idle):,}")
+            for sock in idle:
+                sock.close()
+
+        if args.output:
+            os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(dict(summary, target=target, concurrency=args.concurrency, duration=args.duration,
+                               mix=dict(mix), scale=args.scale,
+                               generated_at=datetime.now().isoformat(timespec='seconds')),
+                          f, ensure_ascii=False, indent=2)
+            print(f"💾 結果已保存: {args.output}")
+    finally:
+        if server:
+            server.stop()
+        if upstream:
+            upstream.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 運行指標
+計數器、直方圖和儀表，按 Prometheus 文本格式輸出（/metrics）；
+每個指標分成多個分片，每個線程固定寫入其中一個分片，只在讀取時匯總，
+記錄指標時線程之間幾乎沒有鎖競爭（只需Python 3標準庫）
+"""
+
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 每個指標的分片數（見 .env.example）
+METRICS_SHARDS = int(os.environ.get("METRICS_SHARDS", "16"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 默認直方圖桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_thread_shard = threading.local()
+_next_shard = itertools.count()
+
+
+def _shard_index():
+    """當前線程的分片序號（線程第一次記錄時輪流分配）"""
+    index = getattr(_thread_shard, 'index', None)
+    if index is None:
+        index = _thread_shard.index = next(_next_shard)
+    return index
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """指標基類：labelnames 是標籤名，記錄時按關鍵字參數傳入標籤值"""
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: 標籤應為 {self.labelnames}，實際為 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """[(後綴, 標籤值, 額外標籤, 值)]"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return lines
+
+
+class _Sharded(_Metric):
+    """值分散保存在 METRICS_SHARDS 個分片中，每個分片有自己的鎖"""
+
+    def __init__(self, *args, shards=METRICS_SHARDS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shards = [({}, threading.Lock()) for _ in range(max(1, shards))]
+
+    def _shard(self):
+        return self._shards[_shard_index() % len(self._shards)]
+
+    def _collect(self, merge, initial):
+        """匯總所有分片：{標籤值: merge(...)}"""
+        totals = {}
+        for values, lock in self._shards:
+            with lock:
+                items = [(key, list(value) if isinstance(value, list) else value) for key, value in values.items()]
+            for key, value in items:
+                totals[key] = merge(totals.get(key, initial()), value)
+        return totals
+
+
+class Counter(_Sharded):
+    """只增不減的計數器；名稱必須以 _total 結尾（HELP/TYPE 和樣本使用同一個名稱）"""
+
+    type = "counter"
+
+    def __init__(self, name, *args, **kwargs):
+        if not name.endswith("_total"):
+            raise ValueError(f"{name}: 計數器名稱應以 _total 結尾")
+        super().__init__(name, *args, **kwargs)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        values, lock = self._shard()
+        with lock:
+            values[key] = values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._collect(lambda total, value: total + value, int).get(self._key(labels), 0)
+
+    def samples(self):
+        totals = self._collect(lambda total, value: total + value, int)
+        return [("", key, (), value) for key, value in sorted(totals.items())]
+
+
+class Histogram(_Sharded):
+    """直方圖：每個標籤組合保存各桶計數、總和和次數"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(name, documentation, labelnames, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        values, lock = self._shard()
+        with lock:
+            state = values.get(key)
+            if state is None:
+                # 各桶（非累計）計數 + [總和, 次數]
+                state = values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            # 落在第一個上界不小於 value 的桶，超過所有上界時落在 +Inf 桶
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """記錄 with 區塊的耗時（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _totals(self):
+        size = len(self.buckets) + 3
+        return self._collect(lambda total, value: [a + b for a, b in zip(total, value)], lambda: [0] * size)
+
+    def count(self, **labels):
+        state = self._totals().get(self._key(labels))
+        return state[-1] if state else 0
+
+    def samples(self):
+        samples = []
+        for key, state in sorted(self._totals().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), state[:-2]):
+                cumulative += count
+                samples.append(("_bucket", key, (("le", _format_value(float(bound))),), cumulative))
+            samples.append(("_sum", key, (), state[-2]))
+            samples.append(("_count", key, (), state[-1]))
+        return samples
+
+
+class Gauge(_Metric):
+    """儀表：讀取時調用 callback，返回 {標籤值元組: 值}（沒有標籤時可直接返回數值）"""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None, registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self._callbacks = [callback] if callback else []
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def add_callback(self, callback):
+        """增加一個讀取時調用的數據源（例如服務器在啟動時註冊自己的數據時間）"""
+        self._callbacks.append(callback)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for callback in self._callbacks:
+            result = callback()
+            if isinstance(result, dict):
+                values.update({tuple(str(v) for v in key): value for key, value in result.items()})
+            elif result is not None:
+                values[()] = result
+        return [("", key, (), value) for key, value in sorted(values.items()) if value is not None]
+
+
+class Registry:
+    """指標註冊表"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指標已存在: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class MeteredReader:
+    """包裝響應流，統計讀取的字節數和等待網絡的時間（用於把解析時間與下載時間分開）"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self._stream.read(size)
+        self.seconds += time.perf_counter() - start
+        self.bytes += len(data)
+        return data
+
+
+# 共用指標（各模塊記錄，服務器在 /metrics 輸出）
+REQUEST_SECONDS = Histogram("fsd_http_request_duration_seconds", "HTTP請求處理時間",
+                            ("route", "method", "status"))
+RENDER_SECONDS = Histogram("fsd_render_duration_seconds", "頁面生成時間", ("page",))
+UPSTREAM_FETCH_SECONDS = Histogram("fsd_upstream_fetch_duration_seconds", "上游WFS請求時間（每次嘗試）",
+                                   ("layer",))
+UPSTREAM_ERRORS = Counter("fsd_upstream_fetch_errors_total", "重試後仍失敗的上游獲取次數", ("layer",))
+UPSTREAM_BYTES = Counter("fsd_upstream_response_bytes_total", "上游響應字節數", ("layer",))
+PARSE_SECONDS = Histogram("fsd_parse_duration_seconds", "GeoJSON解析時間（不含等待網絡）", ("layer",))
+CACHE_REQUESTS = Counter("fsd_cache_requests_total", "緩存查詢次數", ("cache", "result"))
+DATA_AGE_SECONDS = Gauge("fsd_data_age_seconds", "距數據層最後一次成功獲取的秒數", ("layer",))
+LOG_DROPPED = Counter("fsd_log_dropped_total", "日誌隊列已滿或寫入失敗而丟棄的記錄數")
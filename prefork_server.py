@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務查看器 - 多進程服務器
+監督進程按數據層TTL獲取上游數據，把站點記錄和後備站點排名序列化為快照文件，
+N 個工作進程共用同一個監聽套接字，以 mmap 映射快照（後備站點數組直接引用映射的內存，不複製），
+用 start_server.py 的路由生成頁面。工作進程不請求上游：每個請求前讀取共享控制塊中的序號，
+監督進程發布新快照或狀態時序號改變，工作進程才重新加載。頁面生成不再受單個進程的GIL限制
+（需要POSIX系統；numpy可選，用於後備站點）
+
+工作進程用 subprocess 啟動並繼承監聽套接字，而不是在已有線程的監督進程中直接 fork，
+因此監督進程可以在工作進程退出時安全地重新啟動它。
+
+用法:
+    python prefork_server.py [端口]
+"""
+
+import http.server
+import json
+import mmap
+import os
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import access_log
+import cache_backend
+import layers
+import snapshots
+import start_server
+
+try:
+    import numpy as np
+except ImportError:
+    # 未安裝numpy時快照不包含後備站點排名
+    np = None
+
+# 配置（見 .env.example）
+PREFORK_WORKERS = int(os.environ.get("PREFORK_WORKERS", "0")) or os.cpu_count() or 2
+PREFORK_DIR = os.environ.get("PREFORK_DIR", "")
+PREFORK_BACKLOG = int(os.environ.get("PREFORK_BACKLOG", "1024"))
+
+# 控制塊：魔數、序號（寫入時為奇數）、快照代數、狀態JSON長度，之後是狀態JSON
+CONTROL_NAME = "control"
+CONTROL_SIZE = 64 * 1024
+CONTROL_MAGIC = b"FSDCTRL1"
+CONTROL = struct.Struct("<8sQQI")
+SEQ = struct.Struct("<Q")
+SEQ_OFFSET = 8
+
+# 快照文件：魔數、代數、元數據JSON長度，之後是元數據JSON（記錄和數組位置），再之後是按64字節對齊的數組
+SNAPSHOT_MAGIC = b"FSDSNAP1"
+SNAPSHOT_HEADER = struct.Struct("<8sQI")
+ALIGN = 64
+KEEP_SNAPSHOTS = 3
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def snapshot_path(directory, generation):
+    return os.path.join(directory, f"snapshot-{generation:08d}.bin")
+
+
+def write_snapshot(directory, generation, layer_records, backups=None):
+    """把 {數據層: 記錄} 和後備站點排名寫入快照文件（先寫臨時文件再改名），返回路徑"""
+    meta = {'layers': layer_records, 'arrays': {}}
+    arrays, offset = [], 0
+    if backups is not None and np is not None:
+        for layer, pair in backups.items():
+            for kind, array in zip(('indices', 'distances'), pair):
+                array = np.ascontiguousarray(array)
+                offset = _aligned(offset)
+                meta['arrays'][f"{layer}.{kind}"] = {'dtype': array.dtype.str, 'shape': list(array.shape),
+                                                     'offset': offset}
+                arrays.append((offset, array))
+                offset += array.nbytes
+    meta_bytes = json.dumps(meta, ensure_ascii=False, default=str).encode('utf-8')
+    data_start = _aligned(SNAPSHOT_HEADER.size + len(meta_bytes))
+
+    path = snapshot_path(directory, generation)
+    with open(path + ".tmp", 'wb') as f:
+        f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(meta_bytes)))
+        f.write(meta_bytes)
+        for relative, array in arrays:
+            f.write(b"\0" * (data_start + relative - f.tell()))
+            f.write(array.tobytes())
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def read_snapshot(path):
+    """映射快照文件，返回 (代數, {數據層: 記錄}, 後備站點排名或None)；數組引用映射的內存"""
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, generation, meta_length = SNAPSHOT_HEADER.unpack_from(mapped)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"不是快照文件: {path}")
+    start = SNAPSHOT_HEADER.size
+    meta = json.loads(mapped[start:start + meta_length])
+    data_start = _aligned(start + meta_length)
+
+    backups = None
+    if meta['arrays'] and np is not None:
+        loaded = {}
+        for name, spec in meta['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'])) if spec['shape'] else 1
+            loaded[name] = np.frombuffer(mapped, dtype, count, data_start + spec['offset']).reshape(spec['shape'])
+        backups = {layer: (loaded[f"{layer}.indices"], loaded[f"{layer}.distances"])
+                   for layer in {name.split('.')[0] for name in loaded}}
+    return generation, meta['layers'], backups
+
+
+class ControlBlock:
+    """共享的控制塊（mmap）：監督進程寫入，工作進程讀取
+
+    用序號實現無鎖讀取：寫入前把序號加1（奇數表示正在寫入），寫入後再加1；
+    讀取前後的序號相同且為偶數時，讀到的內容是完整的。
+    """
+
+    def __init__(self, path, writable=False):
+        self.path = path
+        if writable:
+            with open(path, 'wb') as f:
+                f.write(CONTROL.pack(CONTROL_MAGIC, 0, 0, 0).ljust(CONTROL_SIZE, b"\0"))
+        with open(path, 'r+b' if writable else 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), CONTROL_SIZE,
+                                  access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        if CONTROL.unpack_from(self._map)[0] != CONTROL_MAGIC:
+            raise ValueError(f"不是控制塊文件: {path}")
+
+    def seq(self):
+        return SEQ.unpack_from(self._map, SEQ_OFFSET)[0]
+
+    def publish(self, generation, statuses):
+        payload = json.dumps(statuses, ensure_ascii=False, default=str).encode('utf-8')
+        if CONTROL.size + len(payload) > CONTROL_SIZE:
+            raise ValueError("狀態太大，無法寫入控制塊")
+        seq = self.seq()
+        SEQ.pack_into(self._map, SEQ_OFFSET, seq + 1)
+        CONTROL.pack_into(self._map, 0, CONTROL_MAGIC, seq + 1, generation, len(payload))
+        self._map[CONTROL.size:CONTROL.size + len(payload)] = payload
+        SEQ.pack_into(self._map, SEQ_OFFSET, seq + 2)
+
+    def read(self):
+        """返回 (序號, 快照代數, 狀態)"""
+        while True:
+            before = self.seq()
+            if before % 2 == 0:
+                _, _, generation, length = CONTROL.unpack_from(self._map)
+                payload = self._map[CONTROL.size:CONTROL.size + length]
+                if self.seq() == before:
+                    return before, generation, json.loads(payload) if payload else {}
+            time.sleep(0.0001)
+
+    def close(self):
+        self._map.close()
+
+
+class Publisher:
+    """監督進程：寫入新快照並更新控制塊，刪除較舊的快照文件"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.generation = 0
+        self.control = ControlBlock(os.path.join(directory, CONTROL_NAME), writable=True)
+        self._lock = threading.Lock()
+
+    def publish_data(self, layer_records, backups, statuses):
+        with self._lock:
+            self.generation += 1
+            write_snapshot(self.directory, self.generation, layer_records, backups)
+            self.control.publish(self.generation, statuses)
+            # 已刪除的文件在仍映射它的工作進程中繼續有效
+            stale = self.generation - KEEP_SNAPSHOTS
+            if stale > 0 and os.path.exists(snapshot_path(self.directory, stale)):
+                os.remove(snapshot_path(self.directory, stale))
+
+    def publish_status(self, statuses):
+        with self._lock:
+            self.control.publish(self.generation, statuses)
+
+
+class SnapshotView:
+    """工作進程中代替 start_server.scheduler：狀態和數據來自監督進程發布的快照"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.control = ControlBlock(os.path.join(directory, CONTROL_NAME))
+        self.generation = 0
+        self._seq = None
+        self._statuses = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """控制塊序號改變時重新讀取狀態，代數改變時加載新快照；有變化時返回True"""
+        if self.control.seq() == self._seq:
+            return False
+        with self._lock:
+            while True:
+                seq, generation, statuses = self.control.read()
+                if seq == self._seq:
+                    return False
+                if generation == self.generation or generation == 0:
+                    break
+                try:
+                    _, records, backups = read_snapshot(snapshot_path(self.directory, generation))
+                except FileNotFoundError:
+                    continue   # 落後太多，快照已被刪除：控制塊中已有更新的代數
+                start_server.publish(start_server.station_data(
+                    records.get('ambulance', []), records.get('fire_station', []), backups))
+                self.generation = generation
+                break
+            self._statuses = statuses
+            self._seq = seq
+            return True
+
+    def status(self):
+        now = time.time()
+        return {name: dict({key: value for key, value in status.items() if key != 'next_refresh_at'},
+                           next_refresh_seconds=None if status.get('next_refresh_at') is None
+                           else max(0.0, status['next_refresh_at'] - now))
+                for name, status in self._statuses.items()}
+
+
+class WorkerHandler(start_server.FireServiceHandler):
+    """處理請求前檢查是否有新快照"""
+
+    view = None
+
+    def do_GET(self):
+        self.view.refresh()
+        super().do_GET()
+
+
+class WorkerServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """在繼承的監聽套接字上接受連接（套接字為非阻塞，其他工作進程先接受時直接返回）"""
+
+    daemon_threads = True
+
+    def __init__(self, sock, handler):
+        super().__init__(sock.getsockname()[:2], handler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+
+    def get_request(self):
+        conn, address = self.socket.accept()
+        conn.setblocking(True)
+        return conn, address
+
+
+def worker_main(fd, directory, index):
+    """工作進程：映射快照，在繼承的套接字上服務，直到收到 SIGTERM 或監督進程退出"""
+    parent = os.getppid()
+    sock = socket.socket(fileno=fd)
+    sock.setblocking(False)
+    base, ext = os.path.splitext(access_log.LOG_FILE)
+    if access_log.LOG_FILE:
+        # 每個工作進程寫自己的日誌文件，避免多個進程同時輪換同一個文件
+        access_log.writer.path = f"{base}.worker{index}{ext}"
+
+    view = SnapshotView(directory)
+    view.refresh()
+    start_server.scheduler = view
+    WorkerHandler.view = view
+    server = WorkerServer(sock, WorkerHandler)
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    threading.Thread(target=server.serve_forever, daemon=True, name="worker-serve").start()
+    while not stopped.wait(1.0):
+        if os.getppid() != parent:
+            break
+    server.shutdown()
+    access_log.writer.close()
+
+
+class Supervisor:
+    """監督進程：獲取上游數據、發布快照、啟動並看護工作進程"""
+
+    def __init__(self, port=8000, workers=PREFORK_WORKERS, host="", directory=PREFORK_DIR):
+        self.workers = workers
+        self.own_directory = not directory
+        self.directory = directory or tempfile.mkdtemp(prefix="prefork-")
+        os.makedirs(self.directory, exist_ok=True)
+        self.publisher = Publisher(self.directory)
+        self.records = {name: [] for name in layers.LAYERS}
+        self.scheduler = layers.LayerScheduler(on_update=self._on_update, cache=cache_backend.backend())
+        self.socket = socket.create_server((host, port), backlog=PREFORK_BACKLOG)
+        self.socket.setblocking(False)
+        self.port = self.socket.getsockname()[1]
+        self.processes = {}
+        self.restarts = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def statuses(self):
+        """可寫入JSON的數據層狀態（下次刷新改為絕對時間，工作進程讀取時再換算）"""
+        now = time.time()
+        return {name: dict({key: value for key, value in status.items() if key != 'next_refresh_seconds'},
+                           next_refresh_at=None if status['next_refresh_seconds'] is None
+                           else now + status['next_refresh_seconds'])
+                for name, status in self.scheduler.status().items()}
+
+    def _on_update(self, layer, records):
+        snapshots.record(layer.name, records)
+        with self._lock:
+            self.records[layer.name] = records
+            backups = start_server.compute_backups(self.records['fire_station'], self.records['ambulance'])
+            self.publisher.publish_data(dict(self.records), backups, self.statuses())
+
+    def _on_refreshed(self, _future):
+        # 內容沒有變化或獲取失敗時也更新狀態（最後成功時間、錯誤）
+        self.publisher.publish_status(self.statuses())
+
+    def spawn(self, index):
+        fd = self.socket.fileno()
+        process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", str(fd),
+                                    self.directory, str(index)], pass_fds=(fd,))
+        self.processes[index] = process
+        return process
+
+    def start(self):
+        """首次刷新所有數據層並發布快照，然後啟動工作進程"""
+        self.scheduler.refresh_all(force=False)
+        self.publisher.publish_status(self.statuses())
+        for index in range(self.workers):
+            self.spawn(index)
+        return self
+
+    def run(self):
+        """按TTL提交刷新並重新啟動退出的工作進程，直到 stop()"""
+        while not self._stopped.is_set():
+            for future in self.scheduler.run_pending().values():
+                future.add_done_callback(self._on_refreshed)
+            self._stopped.wait(min(1.0, self.scheduler.seconds_until_next()))
+            for index, process in list(self.processes.items()):
+                if process.poll() is not None and not self._stopped.is_set():
+                    access_log.event('WARNING', f"⚠️ 工作進程 {index}（PID {process.pid}）已退出"
+                                                f"（{process.returncode}），重新啟動", worker=index)
+                    self.restarts += 1
+                    self.spawn(index)
+
+    def stop(self):
+        self._stopped.set()
+
+    def close(self, timeout=10):
+        """停止工作進程並清理"""
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.terminate()
+        for process in self.processes.values():
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self.scheduler.stop()
+        self.socket.close()
+        self.publisher.control.close()
+        if self.own_directory:
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+            os.rmdir(self.directory)
+
+
+def main():
+    """主函數"""
+    if len(sys.argv) == 5 and sys.argv[1] == "--worker":
+        worker_main(int(sys.argv[2]), sys.argv[3], int(sys.argv[4]))
+        return
+
+    print("=" * 60)
+    print("  香港消防處服務查看器 - 多進程服務器")
+    print("=" * 60)
+    if os.name != 'posix':
+        print("❌ 多進程模式需要POSIX系統（工作進程繼承監聽套接字），請使用 start_server.py")
+        sys.exit(1)
+
+    # 端口: python3 prefork_server.py [端口]
+    port = 8000
+    if len(sys.argv) > 1:
+        try:
+            port = int(sys.argv[-1])
+        except ValueError:
+            print(f"⚠️  無效端口: {sys.argv[-1]}，使用默認端口 {port}")
+
+    supervisor = Supervisor(port)
+    signal.signal(signal.SIGTERM, lambda *_: supervisor.stop())
+    try:
+        supervisor.start()
+        print(f"🌐 服務器已啟動: http://localhost:{supervisor.port}（{supervisor.workers} 個工作進程）")
+        print(f"🗂️ 快照目錄: {supervisor.directory}")
+        print("   按 Ctrl+C 停止")
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.close()
+        print("\n🛑 服務器已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 坐標投影
+將WFS提供的WGS84經緯度一次性批量轉換為香港1980方格網 (EPSG:2326)，
+之後所有以米為單位的空間計算直接使用東距/北距，無需重複轉換
+"""
+
+import threading
+
+import numpy as np
+from pyproj import Transformer
+
+# 源坐標系和目標坐標系
+WGS84 = "EPSG:4326"
+HK1980_GRID = "EPSG:2326"
+
+# DataFrame中的投影坐標列名
+EASTING_COLUMN = "東距"
+NORTHING_COLUMN = "北距"
+
+_transformer = None
+_transformer_lock = threading.Lock()
+
+
+def get_transformer():
+    """返回共享的 WGS84 -> HK1980 轉換器（整個進程只創建一次）"""
+    global _transformer
+    if _transformer is None:
+        with _transformer_lock:
+            if _transformer is None:
+                _transformer = Transformer.from_crs(WGS84, HK1980_GRID, always_xy=True)
+    return _transformer
+
+
+def to_hk1980(lats, lngs):
+    """批量轉換經緯度，返回 (東距, 北距) 兩個float64數組（米）
+
+    缺失或無效的坐標返回NaN。
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    transformer = get_transformer()
+    with _transformer_lock:
+        easting, northing = transformer.transform(lngs, lats)
+    easting = np.asarray(easting, dtype=np.float64)
+    northing = np.asarray(northing, dtype=np.float64)
+    invalid = ~(np.isfinite(lats) & np.isfinite(lngs))
+    easting[invalid] = np.nan
+    northing[invalid] = np.nan
+    return easting, northing
+
+
+def add_grid_columns(df, lat_col="緯度", lng_col="經度"):
+    """在DataFrame的經緯度旁邊加入東距/北距列（一次矢量化轉換）"""
+    if df.empty:
+        df[EASTING_COLUMN] = []
+        df[NORTHING_COLUMN] = []
+        return df
+
+    easting, northing = to_hk1980(
+        df[lat_col].astype(float).to_numpy(), df[lng_col].astype(float).to_numpy()
+    )
+    position = df.columns.get_loc(lng_col) + 1
+    df.insert(position, EASTING_COLUMN, easting)
+    df.insert(position + 1, NORTHING_COLUMN, northing)
+    return df
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 刷新協調器
+進程內共享的數據快照：同一時間每個數據層只有一個上游請求（single-flight），
+手動刷新有冷卻時間，新數據準備好之前所有會話繼續使用舊快照；
+快照過期時先返回舊數據，再在後台線程刷新 (stale-while-revalidate)
+"""
+
+import os
+import threading
+import time
+
+import metrics
+
+# 兩次手動刷新之間的最短間隔（秒），保護上游服務
+REFRESH_COOLDOWN_SECONDS = float(os.environ.get("REFRESH_COOLDOWN_SECONDS", "60"))
+
+# 刷新結果
+REFRESHED = "refreshed"   # 本次請求觸發了上游獲取
+JOINED = "joined"         # 已有刷新進行中，等待其結果
+COOLDOWN = "cooldown"     # 冷卻中，沒有發出請求
+FAILED = "failed"         # 上游獲取失敗，保留舊快照
+
+
+class _Flight:
+    """一次進行中的上游獲取"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class RefreshCoordinator:
+    """按數據層保存快照，合併並發刷新請求"""
+
+    def __init__(self, cooldown_seconds=REFRESH_COOLDOWN_SECONDS):
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._snapshots = {}      # key -> (value, fetched_at 時間戳)
+        self._flights = {}        # key -> _Flight
+        self._last_fetch = {}     # key -> 上次發出上游請求的 monotonic 時間
+
+    def _run(self, key, loader):
+        """single-flight 執行 loader，返回 (結果狀態, flight)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                leader = False
+            else:
+                flight = self._flights[key] = _Flight()
+                self._last_fetch[key] = time.monotonic()
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            return JOINED, flight
+
+        try:
+            flight.value = loader()
+            with self._lock:
+                # 新快照準備好後才替換，讀取方不會看到空數據
+                self._snapshots[key] = (flight.value, time.time())
+        except Exception as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return (FAILED if flight.error else REFRESHED), flight
+
+    def _revalidate(self, key, loader):
+        """在後台線程刷新數據層
+
+        已有刷新進行中，或上次嘗試（可能失敗）還在冷卻時間內時不重複發起。
+        """
+        with self._lock:
+            last = self._last_fetch.get(key)
+            if key in self._flights or (last is not None and time.monotonic() - last < self.cooldown_seconds):
+                return
+        threading.Thread(target=self._run, args=(key, loader), daemon=True,
+                         name=f"revalidate-{key}").start()
+
+    def get(self, key, loader, ttl=None, stale_while_revalidate=True):
+        """返回數據層的當前快照
+
+        沒有快照時同步獲取（並發調用只發一次請求）。快照超過 ttl 秒時，
+        stale_while_revalidate=True 會立即返回舊快照並在後台刷新，
+        下一次調用即可拿到新數據；否則同步等待新數據。
+        獲取失敗時如果有舊快照則返回舊快照，否則拋出異常。
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+        if snapshot is not None:
+            if ttl is None or time.time() - snapshot[1] < ttl:
+                metrics.CACHE_REQUESTS.inc(cache='snapshot', result='hit')
+                return snapshot[0]
+            if stale_while_revalidate:
+                metrics.CACHE_REQUESTS.inc(cache='snapshot', result='stale')
+                self._revalidate(key, loader)
+                return snapshot[0]
+
+        metrics.CACHE_REQUESTS.inc(cache='snapshot', result='miss')
+
+        _, flight = self._run(key, loader)
+        if flight.error is None:
+            return flight.value
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            raise flight.error
+        return snapshot[0]
+
+    def refresh(self, key, loader):
+        """手動刷新一個數據層，返回 REFRESHED / JOINED / COOLDOWN / FAILED"""
+        with self._lock:
+            in_flight = key in self._flights
+            last = self._last_fetch.get(key)
+            if not in_flight and last is not None and time.monotonic() - last < self.cooldown_seconds:
+                return COOLDOWN
+
+        status, flight = self._run(key, loader)
+        if flight.error is not None:
+            return FAILED
+        return status
+
+    def refresh_many(self, loaders):
+        """並行刷新多個數據層，返回 {key: 狀態}"""
+        results = {}
+
+        def worker(key, loader):
+            results[key] = self.refresh(key, loader)
+
+        threads = [threading.Thread(target=worker, args=item, daemon=True) for item in loaders.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def fetched_at(self, key):
+        """數據層快照的獲取時間（time.time()），沒有快照時返回None"""
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+        return snapshot[1] if snapshot else None
+
+    def is_refreshing(self, key):
+        """數據層是否有刷新進行中"""
+        with self._lock:
+            return key in self._flights
+
+    def freshness(self, keys, ttl=None):
+        """多個數據層的新鮮度：最舊的獲取時間、是否過期、是否正在刷新"""
+        with self._lock:
+            times = [self._snapshots[key][1] for key in keys if key in self._snapshots]
+            refreshing = any(key in self._flights for key in keys)
+        oldest = min(times) if times else None
+        stale = oldest is not None and ttl is not None and time.time() - oldest >= ttl
+        return {'fetched_at': oldest, 'stale': stale, 'refreshing': refreshing}
+
+    def invalidate(self, key):
+        """丟棄數據層的快照（下次 get 時重新獲取）"""
+        with self._lock:
+            self._snapshots.pop(key, None)
+
+
+def format_age(seconds):
+    """將數據年齡格式化為中文描述"""
+    if seconds < 60:
+        return "剛剛"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}分鐘前"
+    return f"{int(seconds // 3600)}小時{int(seconds % 3600 // 60)}分鐘前"
+
+
+def describe_freshness(info):
+    """新鮮度指示文字（數據時間而非頁面渲染時間）"""
+    if info['fetched_at'] is None:
+        return "⏳ 尚未加載"
+    fetched = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['fetched_at']))
+    text = f"{fetched}（{format_age(time.time() - info['fetched_at'])}）"
+    if info['refreshing']:
+        text += " • 🔄 後台更新中"
+    elif info['stale']:
+        text += " • ⚠️ 數據已過期"
+    return text
+
+
+# 進程內共享的協調器（Streamlit每次重新運行腳本時模塊不會重新導入）
+coordinator = RefreshCoordinator()
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 多副本反向代理
+把瀏覽器連接轉發到多個Streamlit副本之一：按 Cookie 保持會話（同一瀏覽器總是連到同一個副本，
+Streamlit的會話狀態保存在副本進程中），新會話分配給活動連接最少的副本。
+每個連接在讀取第一個請求頭並選定副本後成為雙向隧道，WebSocket（/_stcore/stream）
+和保持連接的後續請求原樣轉發；只在副本的第一個響應頭中加入 Set-Cookie。
+無法連接的副本暫時停用，會話轉到其他副本（只需Python 3標準庫）
+
+用法（通常由 run_full_network.py --replicas N 啟動）:
+    python replica_proxy.py 監聽端口 副本端口1 副本端口2 ...
+"""
+
+import asyncio
+import os
+import re
+import signal
+import sys
+import time
+
+import access_log
+
+# 配置（見 .env.example）
+REPLICA_COOKIE = os.environ.get("REPLICA_COOKIE", "fsd_replica")
+REPLICA_RETRY_SECONDS = float(os.environ.get("REPLICA_RETRY_SECONDS", "5"))
+REPLICA_CONNECT_TIMEOUT = float(os.environ.get("REPLICA_CONNECT_TIMEOUT", "3"))
+
+# 請求頭和響應頭的最大字節數
+MAX_HEADER_BYTES = 64 * 1024
+# 隧道每次讀取的字節數
+CHUNK_BYTES = 64 * 1024
+
+
+class Replica:
+    """一個副本：地址、活動連接數和停用截止時間"""
+
+    def __init__(self, index, host, port):
+        self.index = index
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self.sessions = 0
+        self.down_until = 0.0
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.down_until
+
+    def __repr__(self):
+        return f"Replica({self.index}, {self.host}:{self.port})"
+
+
+def sticky_index(head, cookie=REPLICA_COOKIE):
+    """請求頭 Cookie 中記錄的副本序號，沒有時返回None"""
+    match = re.search(rb"(?im)^cookie:[^\r\n]*?\b" + re.escape(cookie.encode()) + rb"=(\d+)", head)
+    return int(match.group(1)) if match else None
+
+
+def add_header(head, line):
+    """在響應頭末尾（空行之前）加入一行"""
+    return head[:-2] + line.encode('latin-1') + b"\r\n\r\n"
+
+
+class ReplicaProxy:
+    """asyncio 反向代理：replicas 為 [(主機, 端口)]"""
+
+    def __init__(self, replicas, host="", port=8501, cookie=REPLICA_COOKIE,
+                 retry_seconds=REPLICA_RETRY_SECONDS, connect_timeout=REPLICA_CONNECT_TIMEOUT):
+        self.replicas = [Replica(i, h, p) for i, (h, p) in enumerate(replicas)]
+        self.host = host
+        self.requested_port = port
+        self.cookie = cookie
+        self.retry_seconds = retry_seconds
+        self.connect_timeout = connect_timeout
+        self.tunnels = {}       # 瀏覽器連接的 StreamWriter -> 副本連接的 StreamWriter（未連接時為None）
+        self._server = None
+        self._stopping = None
+        self._loop = None
+        self._next = 0
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1] if self._server else None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._server = await asyncio.start_server(self._handle, self.host or None, self.requested_port,
+                                                  limit=MAX_HEADER_BYTES)
+        return self
+
+    def choose(self, sticky=None, exclude=()):
+        """Cookie 指定的副本可用時使用它，否則選活動連接最少的可用副本（相同時輪流）"""
+        candidates = [r for r in self.replicas if r.available and r.index not in exclude]
+        if not candidates:
+            # 全部停用時仍然嘗試（也許已經恢復）
+            candidates = [r for r in self.replicas if r.index not in exclude]
+        if not candidates:
+            return None
+        for replica in candidates:
+            if replica.index == sticky:
+                return replica
+        self._next += 1
+        return min(candidates, key=lambda r: (r.connections, (r.index - self._next) % len(self.replicas)))
+
+    async def _connect(self, sticky):
+        """連接選定的副本，失敗時停用它並嘗試下一個；返回 (副本, reader, writer) 或None"""
+        tried = set()
+        while True:
+            replica = self.choose(sticky, exclude=tried)
+            if replica is None:
+                return None
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(replica.host, replica.port, limit=MAX_HEADER_BYTES),
+                    self.connect_timeout)
+                replica.down_until = 0.0
+                return replica, reader, writer
+            except (OSError, asyncio.TimeoutError) as e:
+                tried.add(replica.index)
+                if replica.available:
+                    access_log.event('WARNING', f"⚠️ 副本 {replica.index}（端口 {replica.port}）無法連接: {e}",
+                                     replica=replica.index)
+                replica.down_until = time.monotonic() + self.retry_seconds
+
+    async def _pipe(self, reader, writer):
+        """把 reader 的數據原樣寫入 writer，直到對方關閉"""
+        try:
+            while True:
+                data = await reader.read(CHUNK_BYTES)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+            if writer.can_write_eof():
+                writer.write_eof()
+        except (ConnectionError, OSError):
+            pass
+
+    async def _respond(self, upstream_reader, writer, set_cookie):
+        """轉發副本的第一個響應頭（需要時加入 Set-Cookie），然後轉發其餘數據"""
+        try:
+            head = await upstream_reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            return
+        if set_cookie:
+            head = add_header(head, set_cookie)
+        try:
+            writer.write(head)
+            await writer.drain()
+        except (ConnectionError, OSError):
+            return
+        await self._pipe(upstream_reader, writer)
+
+    async def _handle(self, reader, writer):
+        self.tunnels[writer] = None
+        upstream_writer = replica = None
+        try:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                return
+            sticky = sticky_index(head, self.cookie)
+            connected = await self._connect(sticky)
+            if connected is None:
+                writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+                await writer.drain()
+                return
+            replica, upstream_reader, upstream_writer = connected
+            self.tunnels[writer] = upstream_writer
+            replica.connections += 1
+            set_cookie = None
+            if sticky != replica.index:
+                replica.sessions += 1
+                set_cookie = f"Set-Cookie: {self.cookie}={replica.index}; Path=/; HttpOnly; SameSite=Lax"
+
+            upstream_writer.write(head)
+            await upstream_writer.drain()
+            # 副本關閉連接後不再等待瀏覽器關閉
+            requests = asyncio.create_task(self._pipe(reader, upstream_writer))
+            try:
+                await self._respond(upstream_reader, writer, set_cookie)
+            finally:
+                requests.cancel()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if replica is not None:
+                replica.connections -= 1
+            for stream in (writer, upstream_writer):
+                if stream is not None:
+                    stream.close()
+            self.tunnels.pop(writer, None)
+
+    def status(self):
+        """[{序號, 端口, 活動連接, 分配的會話, 是否可用}]"""
+        return [{'replica': r.index, 'port': r.port, 'connections': r.connections,
+                 'sessions': r.sessions, 'available': r.available} for r in self.replicas]
+
+    def stop(self):
+        """請求停止（可以從其他線程或信號處理器調用）"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    async def serve_forever(self):
+        """運行直到 stop()，然後關閉所有隧道"""
+        if self._server is None:
+            await self.start()
+        await self._stopping.wait()
+        self._server.close()
+        for writer, upstream_writer in list(self.tunnels.items()):
+            for stream in (writer, upstream_writer):
+                if stream is not None:
+                    stream.transport.abort()
+        while self.tunnels:
+            await asyncio.sleep(0.01)
+        await self._server.wait_closed()
+
+
+def main():
+    """主函數"""
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+    port = int(sys.argv[1])
+    replicas = [("127.0.0.1", int(p)) for p in sys.argv[2:]]
+
+    async def run():
+        proxy = await ReplicaProxy(replicas, port=port).start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, proxy.stop)
+            except (NotImplementedError, RuntimeError):
+                pass   # Windows 上由 KeyboardInterrupt 停止
+        print(f"🔀 代理已啟動: http://localhost:{proxy.port} -> "
+              f"{', '.join(str(r.port) for r in proxy.replicas)}")
+        await proxy.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    print("\n🛑 代理已停止")
+
+
+if __name__ == "__main__":
+    main()
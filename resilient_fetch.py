@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 容錯數據獲取
+重試（指數退避 + 隨機抖動）、超過p95延遲時發出對沖請求、按數據層熔斷，
+一個數據層失敗不會影響其他數據層（只需Python 3標準庫）
+"""
+
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import http_pool
+import metrics
+
+# 配置（見 .env.example）
+MAX_RETRIES = int(os.environ.get("MAX_RETRIES", "3"))
+TIMEOUT_SECONDS = float(os.environ.get("TIMEOUT_SECONDS", "10"))
+BACKOFF_BASE_SECONDS = float(os.environ.get("BACKOFF_BASE_SECONDS", "0.5"))
+BACKOFF_MAX_SECONDS = float(os.environ.get("BACKOFF_MAX_SECONDS", "8"))
+HEDGE_REQUESTS = os.environ.get("HEDGE_REQUESTS", "true").lower() == "true"
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "60"))
+
+# 至少有這麼多延遲樣本才計算p95並啟用對沖
+HEDGE_MIN_SAMPLES = 20
+
+# 熔斷器狀態
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class FetchError(Exception):
+    """獲取失敗（已用盡重試次數）"""
+
+
+class CircuitOpenError(FetchError):
+    """熔斷器打開，請求未發出"""
+
+
+class RetryableError(FetchError):
+    """可重試的錯誤（網絡錯誤、超時、5xx、429、響應不完整）"""
+
+
+class CircuitBreaker:
+    """單個數據層的熔斷器
+
+    連續 failure_threshold 次獲取失敗後打開，reset_seconds 後進入半開狀態，
+    只放行一個試探請求：成功則關閉，失敗則重新打開。
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self):
+        """是否允許發出請求"""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at < self.reset_seconds:
+                return False
+            # 半開：只放行一個試探請求
+            if self._probe_in_flight:
+                return False
+            self._state = HALF_OPEN
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """記錄最近的成功請求延遲，用於計算對沖閾值"""
+
+    def __init__(self, size=100):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        """返回百分位延遲；樣本不足時返回None"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+        return samples[index]
+
+
+def _http_get(url, timeout):
+    """經共享連接池發出一次HTTP GET請求，返回響應內容"""
+    try:
+        response = http_pool.get(url, timeout=timeout)
+    except (OSError, http.client.HTTPException) as e:
+        # 連接失敗、超時、連接被重置等網絡錯誤
+        raise RetryableError(str(e) or e.__class__.__name__) from e
+
+    if response.status >= 500 or response.status == 429:
+        raise RetryableError(f"HTTP {response.status}")
+    if response.status >= 400:
+        raise FetchError(f"HTTP {response.status}")
+    return response.body
+
+
+def _http_stream(url, timeout, consume):
+    """經共享連接池發出GET請求，由 consume 邊讀取邊解析響應流"""
+    try:
+        with http_pool.stream(url, timeout=timeout) as response:
+            if response.status >= 500 or response.status == 429:
+                raise RetryableError(f"HTTP {response.status}")
+            if response.status >= 400:
+                raise FetchError(f"HTTP {response.status}")
+            return consume(response)
+    except (OSError, http.client.HTTPException) as e:
+        # 連接失敗、超時、讀取中途連接斷開
+        raise RetryableError(str(e) or e.__class__.__name__) from e
+    except ValueError as e:
+        # 響應不完整或格式錯誤
+        raise RetryableError(f"無效的JSON響應: {e}") from e
+
+
+def _parse_json(body):
+    """解析JSON響應"""
+    try:
+        return json.loads(body.decode('utf-8'))
+    except ValueError as e:
+        raise RetryableError(f"無效的JSON響應: {e}") from e
+
+
+class ResilientFetcher:
+    """帶重試、對沖和熔斷的獲取器，熔斷器和延遲統計按數據層隔離"""
+
+    def __init__(self, max_retries=MAX_RETRIES, timeout=TIMEOUT_SECONDS,
+                 backoff_base=BACKOFF_BASE_SECONDS, backoff_max=BACKOFF_MAX_SECONDS,
+                 hedge=HEDGE_REQUESTS, hedge_percentile=95, transport=_http_get,
+                 stream_transport=_http_stream):
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.transport = transport
+        self.stream_transport = stream_transport
+        self._lock = threading.Lock()
+        self._breakers = {}
+        self._latency = {}
+        self._last_error = {}
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="fetch")
+
+    def breaker(self, layer):
+        with self._lock:
+            if layer not in self._breakers:
+                self._breakers[layer] = CircuitBreaker()
+            return self._breakers[layer]
+
+    def latency(self, layer):
+        with self._lock:
+            if layer not in self._latency:
+                self._latency[layer] = LatencyTracker()
+            return self._latency[layer]
+
+    def backoff_delay(self, attempt):
+        """第 attempt 次重試前的等待時間（指數退避 + full jitter）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _attempt(self, url, layer, parse, streaming=False):
+        """一次嘗試：延遲超過p95時再發一個相同請求，取先成功的結果"""
+        tracker = self.latency(layer)
+        hedge_after = tracker.percentile(self.hedge_percentile) if self.hedge else None
+
+        def timed():
+            start = time.monotonic()
+            if streaming:
+                body = self.stream_transport(url, self.timeout, parse)
+            else:
+                body = self.transport(url, self.timeout)
+                if parse is not None:
+                    body = parse(body)
+            elapsed = time.monotonic() - start
+            tracker.record(elapsed)
+            metrics.UPSTREAM_FETCH_SECONDS.observe(elapsed, layer=layer)
+            return body
+
+        primary = self._executor.submit(timed)
+        if hedge_after is None:
+            return primary.result()
+
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        hedged = self._executor.submit(timed)
+        pending = {primary, hedged}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except FetchError as e:
+                    error = e
+        raise error
+
+    def _fetch(self, url, layer, parse=None, streaming=False):
+        """按數據層熔斷和重試；parse 在每次嘗試內執行，解析失敗也會重試"""
+        layer = layer or url
+        breaker = self.breaker(layer)
+        if not breaker.allow():
+            error = CircuitOpenError(f"{layer}: 熔斷中，暫停請求上游")
+            self._last_error[layer] = str(error)
+            raise error
+
+        last_error = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    time.sleep(self.backoff_delay(attempt - 1))
+                try:
+                    body = self._attempt(url, layer, parse, streaming)
+                    breaker.record_success()
+                    self._last_error.pop(layer, None)
+                    return body
+                except RetryableError as e:
+                    last_error = e
+                except FetchError as e:
+                    # 4xx 等不可重試的錯誤
+                    last_error = e
+                    break
+        except Exception:
+            # parse 拋出的其他異常也算失敗，否則半開狀態的試探請求不會釋放，熔斷器不再放行請求
+            breaker.record_failure()
+            raise
+
+        breaker.record_failure()
+        metrics.UPSTREAM_ERRORS.inc(layer=layer)
+        self._last_error[layer] = str(last_error)
+        raise FetchError(f"{layer}: {last_error}") from last_error
+
+    def fetch_bytes(self, url, layer=None):
+        """獲取URL內容，失敗時拋出 FetchError"""
+        return self._fetch(url, layer)
+
+    def fetch_json(self, url, layer=None):
+        """獲取並解析JSON；內容不完整時按可重試錯誤處理"""
+        return self._fetch(url, layer, _parse_json)
+
+    def fetch_stream(self, url, layer, consume):
+        """獲取URL並由 consume(響應流) 增量解析，返回其結果
+
+        consume 在每次嘗試內執行，讀取中途斷開或內容不完整（ValueError）時重試。
+        """
+        return self._fetch(url, layer, consume, streaming=True)
+
+    def status(self, layer):
+        """數據層的熔斷狀態和最近錯誤"""
+        return {
+            'breaker': self.breaker(layer).state,
+            'last_error': self._last_error.get(layer),
+            'p95_seconds': self.latency(layer).percentile(95),
+        }
+
+
+# 進程內共享的獲取器
+fetcher = ResilientFetcher()
+
+
+def fetch_json(url, layer=None):
+    """使用共享獲取器獲取JSON"""
+    return fetcher.fetch_json(url, layer)
+
+
+def fetch_stream(url, layer, consume):
+    """使用共享獲取器增量解析響應"""
+    return fetcher.fetch_stream(url, layer, consume)
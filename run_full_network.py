@@ -1,13 +1,19 @@
 #!/usr/bin/env python3
 """
 運行完整Streamlit版本並允許網絡訪問
+
+用法:
+    python run_full_network.py                 # 單個Streamlit進程
+    python run_full_network.py --replicas 4    # 4個副本 + 會話保持的反向代理（多核機器上支持更多用戶）
 """
 
+import argparse
+import asyncio
 import subprocess
 import sys
 import socket
-import time
 import os
+import signal
 
 def get_local_ip():
     """獲取本機IP地址"""
@@ -41,7 +47,136 @@ def find_available_port(start_port=8501):
             return None
     return port
 
-def main():
+def find_available_ports(count, start_port=8501):
+    """查找 count 個連續的可用端口，返回第一個"""
+    port = find_available_port(start_port)
+    while port is not None:
+        if all(check_port_available(port + i) for i in range(1, count)):
+            return port
+        port = find_available_port(port + 1)
+    return None
+
+def streamlit_command(streamlit_path, port, address, local_ip, public_port=None):
+    """構建Streamlit命令；public_port 為瀏覽器看到的端口（經過代理時是代理端口）"""
+    return [
+        streamlit_path, "run", "app.py",
+        "--server.port", str(port),
+        "--server.address", address,
+        "--server.headless", "true",
+        "--browser.serverAddress", local_ip,
+        "--browser.serverPort", str(public_port or port),
+        "--browser.gatherUsageStats", "false",
+        "--theme.base", "light",
+        "--theme.primaryColor", "#d32f2f",
+        "--theme.backgroundColor", "#ffffff",
+        "--theme.secondaryBackgroundColor", "#f0f2f6",
+        "--theme.textColor", "#262730",
+        "--theme.font", "sans serif"
+    ]
+
+class ReplicaSet:
+    """在連續端口上運行的多個Streamlit副本，共用數據緩存（CACHE_BACKEND=redis 時用Redis，否則用磁盤緩存）
+
+    輸出寫入 logs/streamlit-replica{序號}.log（不經過本進程轉發）；退出的副本由 watch() 重新啟動。
+    """
+
+    def __init__(self, streamlit_path, ports, local_ip, public_port, cache_dir, log_dir="logs"):
+        self.streamlit_path = streamlit_path
+        self.ports = ports
+        self.local_ip = local_ip
+        self.public_port = public_port
+        self.env = dict(os.environ, CACHE_DIR=cache_dir)
+        if self.env.get("CACHE_BACKEND", "").lower() == "memory":
+            # 進程內緩存不能在副本之間共用
+            self.env["CACHE_BACKEND"] = "disk"
+        self.log_dir = log_dir
+        self.processes = [None] * len(ports)
+
+    def spawn(self, index):
+        os.makedirs(self.log_dir, exist_ok=True)
+        with open(os.path.join(self.log_dir, f"streamlit-replica{index}.log"), 'ab') as log:
+            cmd = streamlit_command(self.streamlit_path, self.ports[index], "127.0.0.1",
+                                    self.local_ip, self.public_port)
+            self.processes[index] = subprocess.Popen(cmd, env=self.env, stdout=log, stderr=subprocess.STDOUT)
+
+    def start(self):
+        for index in range(len(self.ports)):
+            self.spawn(index)
+        return self
+
+    async def watch(self, interval=1.0):
+        """重新啟動退出的副本"""
+        while True:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if process.poll() is not None:
+                    print(f"⚠️ 副本 {index}（端口 {self.ports[index]}）已退出（{process.returncode}），重新啟動")
+                    self.spawn(index)
+
+    def stop(self):
+        for process in self.processes:
+            if process and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+def run_single(streamlit_path, port, local_ip):
+    """運行單個Streamlit進程（輸出直接寫到控制台）"""
+    process = subprocess.Popen(streamlit_command(streamlit_path, port, "0.0.0.0", local_ip))
+    try:
+        process.wait()
+    except KeyboardInterrupt:
+        print("\n\n🛑 服務器正在停止...")
+        process.terminate()
+        process.wait()
+        print("✅ 服務器已停止")
+
+def run_replicas(streamlit_path, port, local_ip, replicas):
+    """運行多個副本和反向代理，直到 Ctrl+C"""
+    from replica_proxy import ReplicaProxy
+
+    first = find_available_ports(replicas, port + 1)
+    if not first:
+        print(f"❌ 找不到 {replicas} 個連續的可用端口")
+        return False
+    ports = list(range(first, first + replicas))
+    cache_dir = os.environ.get("CACHE_DIR") or os.path.join("data", "cache")
+    print(f"🧩 {replicas} 個副本: 端口 {ports[0]}-{ports[-1]}（只監聽127.0.0.1），日誌在 logs/streamlit-replica*.log")
+    if os.environ.get("CACHE_BACKEND", "").lower() == "redis":
+        print(f"💾 共享數據緩存: {os.environ.get('CACHE_URL', 'redis://127.0.0.1:6379/0')}")
+    else:
+        print(f"💾 共享數據緩存: {cache_dir}")
+
+    replica_set = ReplicaSet(streamlit_path, ports, local_ip, port, cache_dir).start()
+
+    async def serve():
+        proxy = await ReplicaProxy([("127.0.0.1", p) for p in ports], port=port).start()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, proxy.stop)
+            except (NotImplementedError, RuntimeError):
+                pass   # Windows 上由 KeyboardInterrupt 停止
+        watcher = asyncio.create_task(replica_set.watch())
+        try:
+            await proxy.serve_forever()
+        finally:
+            watcher.cancel()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n\n🛑 服務器正在停止...")
+    finally:
+        replica_set.stop()
+        print("✅ 服務器已停止")
+    return True
+
+def main(replicas=1):
     """主函數"""
     print("=" * 60)
     print("  香港消防處服務儀表板 - 完整網絡版本")
@@ -71,22 +206,6 @@ def main():
     
     print(f"🐍 Python路徑: {python_path}")
     
-    # 構建Streamlit命令
-    cmd = [
-        streamlit_path, "run", "app.py",
-        "--server.port", str(port),
-        "--server.address", "0.0.0.0",
-        "--server.headless", "true",
-        "--browser.serverAddress", local_ip,
-        "--browser.gatherUsageStats", "false",
-        "--theme.base", "light",
-        "--theme.primaryColor", "#d32f2f",
-        "--theme.backgroundColor", "#ffffff",
-        "--theme.secondaryBackgroundColor", "#f0f2f6",
-        "--theme.textColor", "#262730",
-        "--theme.font", "sans serif"
-    ]
-    
     print()
     print("🚀 啟動參數:")
     print(f"   服務器地址: 0.0.0.0 (允許所有IP訪問)")
@@ -115,25 +234,9 @@ def main():
     print("=" * 60)
     
     try:
-        # 運行Streamlit
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            encoding='utf-8'
-        )
-        
-        # 實時輸出日誌
-        for line in process.stdout:
-            print(line, end='')
-            sys.stdout.flush()
-            
-    except KeyboardInterrupt:
-        print("\n\n🛑 服務器正在停止...")
-        process.terminate()
-        process.wait()
-        print("✅ 服務器已停止")
+        if replicas > 1:
+            return run_replicas(streamlit_path, port, local_ip, replicas)
+        run_single(streamlit_path, port, local_ip)
     except Exception as e:
         print(f"\n❌ 啟動失敗: {e}")
         return False
@@ -141,6 +244,11 @@ def main():
     return True
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="運行完整Streamlit版本並允許網絡訪問")
+    parser.add_argument("--replicas", type=int, default=int(os.environ.get("STREAMLIT_REPLICAS", "1")),
+                        help="Streamlit副本數（大於1時在代理後面運行多個進程，默認 STREAMLIT_REPLICAS 或1）")
+    args = parser.parse_args()
+
     # 檢查依賴
     print("檢查依賴包...")
     try:
@@ -156,5 +264,5 @@ if __name__ == "__main__":
         sys.exit(1)
     
     # 運行主函數
-    success = main()
+    success = main(args.replicas)
     sys.exit(0 if success else 1)
\ No newline at end of file
@@ -6,17 +6,15 @@
 
 import http.server
 import socketserver
-import json
-import urllib.request
-import urllib.parse
 from datetime import datetime
-import threading
-import time
 import html
+import sys
+import time
 
-# API端點
-AMBULANCE_API = "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634799003993_7633/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=AmbDepots&outputFormat=geojson"
-FIRE_STATION_API = "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634798867463_89696/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=FireStations&outputFormat=geojson"
+import access_log
+import cache_backend
+import layers
+import snapshots
 
 # 緩存數據
 data_cache = {
@@ -25,59 +23,14 @@ data_cache = {
     'timestamp': None
 }
 
-def fetch_url(url):
-    """獲取URL內容"""
-    try:
-        req = urllib.request.Request(url)
-        req.add_header('User-Agent', 'Mozilla/5.0')
-        with urllib.request.urlopen(req, timeout=10) as response:
-            return json.loads(response.read().decode('utf-8'))
-    except Exception as e:
-        print(f"錯誤: {e}")
-        return None
+def on_layer_update(layer, records):
+    """數據層內容有變化時更新緩存，並保存歷史快照"""
+    snapshots.record(layer.name, records)
+    data_cache[layer.name] = records
+    data_cache['timestamp'] = datetime.now()
 
-def fetch_data():
-    """獲取數據並緩存"""
-    try:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 正在更新數據...")
-        
-        # 獲取救護站數據
-        ambulance_data = fetch_url(AMBULANCE_API)
-        if ambulance_data:
-            ambulance_records = []
-            for feature in ambulance_data.get("features", []):
-                props = feature.get("properties", {})
-                ambulance_records.append({
-                    "name": props.get("Name_TC", ""),
-                    "address": props.get("Address_TC", ""),
-                    "district": props.get("District_TC", ""),
-                    "phone": props.get("Telephone", ""),
-                    "lat": props.get("Latitude"),
-                    "lng": props.get("Longitude")
-                })
-            data_cache['ambulance'] = ambulance_records
-        
-        # 獲取消防局數據
-        fire_station_data = fetch_url(FIRE_STATION_API)
-        if fire_station_data:
-            fire_station_records = []
-            for feature in fire_station_data.get("features", []):
-                props = feature.get("properties", {})
-                fire_station_records.append({
-                    "name": props.get("Name_TC", ""),
-                    "address": props.get("Address_TC", ""),
-                    "district": props.get("District_TC", ""),
-                    "phone": props.get("Telephone", ""),
-                    "lat": props.get("Latitude"),
-                    "lng": props.get("Longitude")
-                })
-            data_cache['fire_station'] = fire_station_records
-        
-        data_cache['timestamp'] = datetime.now()
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 數據更新完成")
-        
-    except Exception as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 數據更新失敗: {e}")
+# 按各數據層的TTL在後台刷新
+scheduler = layers.LayerScheduler(on_update=on_layer_update)
 
 def generate_html():
     """生成HTML頁面"""
@@ -183,39 +136,52 @@ def generate_html():
 
 class SimpleHandler(http.server.SimpleHTTPRequestHandler):
     def do_GET(self):
+        start = time.perf_counter()
         if self.path == '/':
-            html_content = generate_html()
+            body = generate_html().encode('utf-8')
+            status = 200
             self.send_response(200)
             self.send_header('Content-type', 'text/html; charset=utf-8')
             self.end_headers()
-            self.wfile.write(html_content.encode('utf-8'))
+            self.wfile.write(body)
         else:
+            body = b''
+            status = 404
             self.send_response(404)
             self.end_headers()
+        route = '/' if status == 200 else 'other'
+        access_log.access('GET', self.path, route, status, len(body), time.perf_counter() - start,
+                          client=self.client_address[0])
+    
+    def log_request(self, code='-', size='-'):
+        """請求由 do_GET 寫入訪問日誌"""
+    
+    def log_message(self, format, *args):
+        access_log.event('WARNING', f"{self.address_string()} - {format % args}", client=self.client_address[0])
 
 def main():
     print("=" * 50)
     print("香港消防處服務查看器")
     print("=" * 50)
     
-    # 初始加載數據
-    fetch_data()
+    # 初始加載數據（經共享數據緩存，其他入口剛獲取過時不請求上游）
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] 正在更新數據...")
+    scheduler.cache = cache_backend.backend()
+    scheduler.refresh_all(force=False)
     
-    # 啟動服務器
+    # 啟動服務器（端口: python3 run_simple.py [端口]）
     port = 8000
+    if len(sys.argv) > 1:
+        try:
+            port = int(sys.argv[-1])
+        except ValueError:
+            print(f"⚠️  無效端口: {sys.argv[-1]}，使用默認端口 {port}")
     with socketserver.TCPServer(("", port), SimpleHandler) as httpd:
         print(f"服務器已啟動: http://localhost:{port}")
         print("按 Ctrl+C 停止")
         
-        # 簡單的後台更新
-        def update_data():
-            while True:
-                time.sleep(3600)  # 每小時更新
-                fetch_data()
-        
-        import threading
-        thread = threading.Thread(target=update_data, daemon=True)
-        thread.start()
+        # 後台按各數據層的TTL更新
+        scheduler.start()
         
         try:
             httpd.serve_forever()
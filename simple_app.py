@@ -5,11 +5,22 @@
 """
 
 import streamlit as st
-import requests
 import json
+import os
 import pandas as pd
 from datetime import datetime
 
+from incident_pipeline import DEFAULT_OUTPUT as INCIDENT_AGGREGATES_PATH, load_result, result_frames
+from layers import LAYERS
+import cache_backend
+from refresh import coordinator, describe_freshness, COOLDOWN, FAILED
+
+try:
+    import district_check
+except ImportError:
+    # 未安裝shapely時不做地區核對
+    district_check = None
+
 # 設置頁面配置
 st.set_page_config(
     page_title="香港消防處服務儀表板",
@@ -17,75 +28,57 @@ st.set_page_config(
     layout="wide"
 )
 
-# API端點
-AMBULANCE_API = "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634799003993_7633/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=AmbDepots&outputFormat=geojson"
-FIRE_STATION_API = "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634798867463_89696/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=FireStations&outputFormat=geojson"
+# 站點數據緩存時間（秒），取各數據層TTL中最短的
+DATA_TTL_SECONDS = min(layer.ttl for layer in LAYERS.values())
+
+# 數據層記錄字段 -> 表格列名
+COLUMN_NAMES = {
+    "id": "ID",
+    "fsd_id": "消防處編號",
+    "name": "名稱",
+    "name_en": "英文名稱",
+    "address": "地址",
+    "address_en": "英文地址",
+    "district": "地區",
+    "district_en": "英文地區",
+    "phone": "電話",
+    "lat": "緯度",
+    "lng": "經度"
+}
+
+def load_station_layer(name, force=False):
+    """從上游獲取一個站點數據層（失敗時拋出異常，由刷新協調器保留舊快照）
 
-@st.cache_data(ttl=3600)
-def fetch_ambulance_data():
-    """獲取救護站數據"""
+    經共享數據緩存（cache_backend）獲取，與其他入口共用；force=True（手動刷新）時忽略緩存。
+    """
+    records = LAYERS[name].fetch_cached(cache_backend.backend(), 0 if force else None).value
+    df = pd.DataFrame(records).rename(columns=COLUMN_NAMES)
+    return verify_districts(df)
+
+def fetch_station_layer(name):
+    """獲取站點數據層（進程內共享快照，按數據層的TTL緩存）"""
     try:
-        response = requests.get(AMBULANCE_API, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        # 轉換為DataFrame
-        features = data.get("features", [])
-        records = []
-        for feature in features:
-            props = feature.get("properties", {})
-            records.append({
-                "ID": props.get("OBJECTID"),
-                "消防處編號": props.get("FSDID"),
-                "名稱": props.get("Name_TC"),
-                "英文名稱": props.get("Name_ENG"),
-                "地址": props.get("Address_TC"),
-                "英文地址": props.get("Address_ENG"),
-                "地區": props.get("District_TC"),
-                "英文地區": props.get("District_ENG"),
-                "電話": props.get("Telephone"),
-                "緯度": props.get("Latitude"),
-                "經度": props.get("Longitude")
-            })
-        
-        df = pd.DataFrame(records)
-        return df
+        return coordinator.get(name, lambda: load_station_layer(name), ttl=LAYERS[name].ttl)
     except Exception as e:
-        st.error(f"獲取救護站數據失敗: {e}")
+        st.error(f"獲取{LAYERS[name].label}數據失敗: {e}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=3600)
-def fetch_fire_station_data():
-    """獲取消防局數據"""
-    try:
-        response = requests.get(FIRE_STATION_API, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        # 轉換為DataFrame
-        features = data.get("features", [])
-        records = []
-        for feature in features:
-            props = feature.get("properties", {})
-            records.append({
-                "ID": props.get("OBJECTID"),
-                "消防處編號": props.get("FSDID"),
-                "名稱": props.get("Name_TC"),
-                "英文名稱": props.get("Name_ENG"),
-                "地址": props.get("Address_TC"),
-                "英文地址": props.get("Address_ENG"),
-                "地區": props.get("District_TC"),
-                "英文地區": props.get("District_ENG"),
-                "電話": props.get("Telephone"),
-                "緯度": props.get("Latitude"),
-                "經度": props.get("Longitude")
-            })
-        
-        df = pd.DataFrame(records)
+@st.cache_data
+def load_incident_aggregates(path, mtime):
+    """加載歷史事故聚合結果（mtime作為緩存鍵，文件更新後自動重新加載）"""
+    result = load_result(path)
+    if result is None:
+        return None
+    return result, result_frames(result)
+
+def verify_districts(df):
+    """用本地地區邊界核對地區字段（需要shapely和邊界文件，否則原樣返回）"""
+    if district_check is None or df.empty:
         return df
-    except Exception as e:
-        st.error(f"獲取消防局數據失敗: {e}")
-        return pd.DataFrame()
+    districts = district_check.load_districts()
+    if districts is None:
+        return df
+    return district_check.verify_districts(df, districts)
 
 def create_summary_stats(ambulance_df, fire_station_df):
     """創建統計摘要"""
@@ -101,6 +94,22 @@ def create_summary_stats(ambulance_df, fire_station_df):
     
     return stats
 
+def refresh_station_layers():
+    """手動刷新站點數據
+
+    多個會話同時刷新只會發出一次上游請求；只替換站點數據的快照，
+    新數據準備好之前其他會話繼續顯示舊數據。
+    """
+    statuses = coordinator.refresh_many({
+        name: (lambda name=name: load_station_layer(name, force=True)) for name in LAYERS
+    })
+    if COOLDOWN in statuses.values():
+        st.info("數據剛剛刷新過，請稍後再試")
+    elif FAILED in statuses.values():
+        st.warning("部分數據刷新失敗，繼續顯示上次的數據")
+    else:
+        st.success("數據已刷新")
+
 def main():
     """主函數"""
     # 頁面標題
@@ -117,8 +126,7 @@ def main():
         
         st.subheader("數據更新")
         if st.button("🔄 刷新數據"):
-            st.cache_data.clear()
-            st.rerun()
+            refresh_station_layers()
         
         st.markdown("---")
         st.markdown("### 📊 數據來源")
@@ -126,14 +134,19 @@ def main():
         - **救護站數據**: [香港政府地理數據平台](https://portal.csdi.gov.hk)
         - **消防局數據**: [香港政府地理數據平台](https://portal.csdi.gov.hk)
         """)
-        
-        st.markdown("### 📅 最後更新")
-        st.write(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
     
-    # 加載數據
+    # 加載數據（只有首次加載需要等待；快照過期時先顯示舊數據，後台刷新）
     with st.spinner("正在加載數據..."):
-        ambulance_df = fetch_ambulance_data() if show_ambulance else pd.DataFrame()
-        fire_station_df = fetch_fire_station_data() if show_fire_stations else pd.DataFrame()
+        ambulance_df = fetch_station_layer('ambulance') if show_ambulance else pd.DataFrame()
+        fire_station_df = fetch_station_layer('fire_station') if show_fire_stations else pd.DataFrame()
+    
+    # 數據新鮮度（數據獲取時間，而非頁面渲染時間）
+    freshness = describe_freshness(
+        coordinator.freshness(list(LAYERS), ttl=DATA_TTL_SECONDS)
+    )
+    with st.sidebar:
+        st.markdown("### 📅 數據時間")
+        st.write(freshness)
     
     # 顯示統計摘要
     st.header("📈 統計摘要")
@@ -159,6 +172,13 @@ def main():
             with col4:
                 st.metric("消防局地區數", stats['消防局地區數'])
     
+    # 地區核對結果
+    for label, df in (("救護站", ambulance_df), ("消防局", fire_station_df)):
+        if district_check is not None and district_check.MISMATCH_COLUMN in df.columns:
+            mismatch_count = int(df[district_check.MISMATCH_COLUMN].sum())
+            if mismatch_count:
+                st.warning(f"⚠️ {mismatch_count} 個{label}的地區字段與坐標所在地區不符")
+    
     # 顯示地區分布
     st.header("📊 地區分布")
     
@@ -177,6 +197,24 @@ def main():
         # 顯示表格
         st.dataframe(merged_counts, use_container_width=True)
     
+    # 顯示歷史事故統計（由 incident_pipeline.py 預先生成）
+    if os.path.exists(INCIDENT_AGGREGATES_PATH):
+        loaded = load_incident_aggregates(
+            INCIDENT_AGGREGATES_PATH, os.path.getmtime(INCIDENT_AGGREGATES_PATH)
+        )
+        if loaded is not None:
+            result, (by_station, by_district, by_hour) = loaded
+            st.header("🚨 歷史事故統計")
+            st.caption(f"生成時間: {result['generated_at']} • 事故總數: {result['total_incidents']}")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.dataframe(by_district, use_container_width=True)
+            with col2:
+                st.bar_chart(by_hour.set_index('時段'))
+            
+            st.dataframe(by_station, use_container_width=True, height=300)
+    
     # 顯示數據表格
     st.header("📋 詳細數據")
     
@@ -296,9 +334,9 @@ def main():
     st.markdown("""
     <div style="text-align: center; color: gray;">
         <p>香港消防處服務儀表板 • 數據來源: 香港政府地理數據平台</p>
-        <p>最後更新: {}</p>
+        <p>數據時間: {}</p>
     </div>
-    """.format(datetime.now().strftime("%Y-%m-%d %H:%M:%S")), unsafe_allow_html=True)
+    """.format(freshness), unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
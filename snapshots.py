@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 歷史快照存儲
+每個數據層一個只追加的JSONL日誌：內容有變化時寫入相對上一個快照的差異
+（按消防處編號 FSDID 記錄新增、刪除和字段變化），每隔若干個差異寫入一個完整檢查點；
+查詢某一時間的狀態或兩個時間之間的變化時，從之前最近的檢查點重放差異
+（只需Python 3標準庫）
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+
+import access_log
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 沒有 fcntl：不加文件鎖，只能由一個進程寫入同一個目錄
+    fcntl = None
+
+# 配置（見 .env.example）
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", os.path.join("data", "snapshots"))
+SNAPSHOT_CHECKPOINT_EVERY = int(os.environ.get("SNAPSHOT_CHECKPOINT_EVERY", "24"))
+
+# 變化類型
+ADDED = "added"
+REMOVED = "removed"
+MOVED = "moved"          # 坐標變化
+RENAMED = "renamed"      # 名稱變化
+UPDATED = "updated"      # 其他字段變化
+
+KIND_LABELS = {ADDED: "新增", REMOVED: "刪除", MOVED: "移動", RENAMED: "改名", UPDATED: "資料更新"}
+
+_LOCATION_FIELDS = ("lat", "lng")
+_NAME_FIELDS = ("name", "name_en")
+
+
+def record_key(record):
+    """記錄的主鍵：消防處編號，沒有時用OBJECTID"""
+    key = record.get("fsd_id")
+    if key in (None, ""):
+        key = record.get("id")
+    return str(key)
+
+
+def index_records(records):
+    """{主鍵: 記錄}"""
+    return {record_key(record): record for record in records}
+
+
+def diff_states(old, new):
+    """兩個 {主鍵: 記錄} 狀態之間的差異：added 完整記錄，removed 主鍵列表，changed 只有變化的字段"""
+    added = {key: record for key, record in new.items() if key not in old}
+    removed = sorted(key for key in old if key not in new)
+    changed = {}
+    for key, record in new.items():
+        before = old.get(key)
+        if before is None:
+            continue
+        fields = {field: value for field, value in record.items() if before.get(field) != value}
+        fields.update({field: None for field in before if field not in record})
+        if fields:
+            changed[key] = fields
+    return {"added": added, "removed": removed, "changed": changed}
+
+
+def apply_delta(state, delta):
+    """把差異應用到 {主鍵: 記錄} 狀態（原地修改），返回 state"""
+    for key in delta.get("removed", ()):
+        state.pop(key, None)
+    for key, fields in delta.get("changed", {}).items():
+        state[key] = dict(state.get(key, {}), **fields)
+    state.update(delta.get("added", {}))
+    return state
+
+
+def describe_delta(delta, before):
+    """把差異展開為變化事件列表；before 是應用差異之前的狀態（用於舊名稱和舊坐標）"""
+    events = []
+    for key, record in delta.get("added", {}).items():
+        events.append({"key": key, "kind": ADDED, "name": record.get("name"), "before": None, "after": None})
+    for key in delta.get("removed", ()):
+        events.append({"key": key, "kind": REMOVED, "name": before.get(key, {}).get("name"),
+                       "before": None, "after": None})
+    for key, fields in delta.get("changed", {}).items():
+        old = before.get(key, {})
+        name = fields.get("name", old.get("name"))
+        if any(field in fields for field in _LOCATION_FIELDS):
+            events.append({"key": key, "kind": MOVED, "name": name,
+                           "before": [old.get("lat"), old.get("lng")],
+                           "after": [fields.get("lat", old.get("lat")), fields.get("lng", old.get("lng"))]})
+        if any(field in fields for field in _NAME_FIELDS):
+            events.append({"key": key, "kind": RENAMED, "name": name,
+                           "before": old.get("name"), "after": fields.get("name", old.get("name"))})
+        other = sorted(field for field in fields if field not in _LOCATION_FIELDS + _NAME_FIELDS)
+        if other:
+            events.append({"key": key, "kind": UPDATED, "name": name,
+                           "before": {field: old.get(field) for field in other},
+                           "after": {field: fields[field] for field in other}})
+    return events
+
+
+class _LayerLog:
+    """一個數據層的日誌文件和內存索引"""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0           # 已索引的文件長度，其他進程追加後重新讀取新增部分
+        self.times = []         # 每個條目的時間戳（遞增）
+        self.offsets = []       # 每個條目在文件中的偏移
+        self.checkpoints = []   # 檢查點條目的序號
+        self.latest = {}        # 最新狀態
+        self.since_checkpoint = 0
+
+
+class SnapshotStore:
+    """按數據層保存歷史快照
+
+    多個進程可以寫入同一個目錄：寫入時持有日誌文件的排他文件鎖，
+    在鎖內讀入其他進程追加的條目、計算差異並追加一行；
+    讀取前檢查文件長度，讀入其他進程追加的條目。
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, checkpoint_every=SNAPSHOT_CHECKPOINT_EVERY):
+        self.directory = directory
+        self.checkpoint_every = checkpoint_every
+        self._lock = threading.Lock()
+        self._logs = {}
+
+    def _log(self, layer):
+        """數據層的日誌（已同步到文件末尾）；調用者持有 _lock"""
+        log = self._logs.get(layer)
+        if log is None:
+            log = self._logs[layer] = _LayerLog(os.path.join(self.directory, f"{layer}.jsonl"))
+        if not os.path.exists(log.path) or os.path.getsize(log.path) == log.size:
+            return log
+        with open(log.path, 'rb') as f:
+            f.seek(log.size)
+            offset = log.size
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break   # 其他進程正在寫入的行
+                entry = json.loads(line)
+                log.times.append(entry["t"])
+                log.offsets.append(offset)
+                if "checkpoint" in entry:
+                    log.checkpoints.append(len(log.times) - 1)
+                    log.latest = entry["checkpoint"]
+                    log.since_checkpoint = 0
+                else:
+                    apply_delta(log.latest, entry)
+                    log.since_checkpoint += 1
+                offset += len(line)
+            log.size = offset
+        return log
+
+    def record(self, layer, records, at=None):
+        """保存數據層的新快照；內容沒有變化時不寫入，返回寫入的差異（或檢查點）或None"""
+        state = index_records(records)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{layer}.jsonl"), 'ab') as f:
+                # 持鎖期間其他進程不能追加，差異總是相對文件中的最後一個狀態
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    return self._append(f, layer, state, at)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _append(self, f, layer, state, at):
+        """讀入其他進程追加的條目後寫入新條目；調用者持有 _lock 和文件鎖"""
+        log = self._log(layer)
+        at = time.time() if at is None else at
+        if log.times and at < log.times[-1]:
+            raise ValueError(f"快照時間 {at} 早於最後一個快照 {log.times[-1]}")
+        if log.times and state == log.latest:
+            return None
+
+        if not log.times or log.since_checkpoint + 1 >= self.checkpoint_every:
+            entry = {"t": at, "checkpoint": state}
+            # 記錄相對上一個狀態的變化，讓變化查詢不需要比較兩個檢查點
+            if log.times:
+                entry["delta"] = diff_states(log.latest, state)
+        else:
+            entry = dict({"t": at}, **diff_states(log.latest, state))
+
+        f.write((json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + "\n").encode('utf-8'))
+        f.flush()
+        self._log(layer)
+        return entry
+
+    def _entries(self, log, start, stop):
+        """讀取日誌中第 start 到 stop-1 個條目"""
+        if start >= stop:
+            return []
+        with open(log.path, 'rb') as f:
+            f.seek(log.offsets[start])
+            return [json.loads(f.readline()) for _ in range(start, stop)]
+
+    def _replay(self, log, at):
+        """時間 at 的狀態和所在條目的序號（在第一個快照之前時為 ({}, -1)）"""
+        position = bisect.bisect_right(log.times, at) - 1
+        if position < 0:
+            return {}, -1
+        checkpoint = log.checkpoints[bisect.bisect_right(log.checkpoints, position) - 1]
+        entries = self._entries(log, checkpoint, position + 1)
+        state = entries[0]["checkpoint"]
+        for entry in entries[1:]:
+            apply_delta(state, entry)
+        return state, position
+
+    def state_at(self, layer, at):
+        """數據層在時間 at 的記錄列表"""
+        with self._lock:
+            log = self._log(layer)
+            return list(self._replay(log, at)[0].values())
+
+    def changes(self, layer, since=None, until=None):
+        """since（不含）到 until（含）之間的變化事件，每個事件帶時間 "t"，按時間排序
+
+        第一個快照是初次加載，不算變化。
+        """
+        with self._lock:
+            log = self._log(layer)
+            until = time.time() if until is None else until
+            if since is None:
+                state, position = {}, -1
+            else:
+                state, position = self._replay(log, since)
+            stop = bisect.bisect_right(log.times, until)
+            events = []
+            for index, entry in enumerate(self._entries(log, position + 1, stop), start=position + 1):
+                if index == 0:
+                    state = entry["checkpoint"]
+                    continue
+                if "checkpoint" in entry:
+                    delta = entry.get("delta") or diff_states(state, entry["checkpoint"])
+                else:
+                    delta = entry
+                for event in describe_delta(delta, state):
+                    events.append(dict(event, t=entry["t"]))
+                state = entry["checkpoint"] if "checkpoint" in entry else apply_delta(state, delta)
+            return events
+
+    def diff(self, layer, since, until):
+        """兩個時間之間的淨變化事件（中間來回的變化互相抵消）"""
+        with self._lock:
+            log = self._log(layer)
+            before = self._replay(log, since)[0]
+            after = self._replay(log, until)[0]
+        return describe_delta(diff_states(before, after), before)
+
+    def timeline(self, layer):
+        """所有快照的時間戳"""
+        with self._lock:
+            return list(self._log(layer).times)
+
+    def stats(self, layer):
+        """快照數、檢查點數和文件大小"""
+        with self._lock:
+            log = self._log(layer)
+            return {"snapshots": len(log.times), "checkpoints": len(log.checkpoints), "bytes": log.size}
+
+
+# 進程內共享的快照存儲
+store = SnapshotStore()
+
+
+def record(layer, records):
+    """把數據層的新記錄寫入共享存儲；寫入失敗只打印警告，不影響數據刷新"""
+    try:
+        return store.record(layer, records)
+    except (OSError, ValueError) as e:
+        access_log.event("WARNING", f"⚠️ 保存{layer}歷史快照失敗: {e}", layer=layer, error=str(e))
+        return None
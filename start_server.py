@@ -4,118 +4,144 @@
 超簡單版本，只需Python 3，無需安裝任何額外包
 """
 
+import collections
 import http.server
 import socketserver
 import json
-import urllib.request
 import urllib.parse
 from datetime import datetime
 import threading
-import time
 import html
 import sys
+import time
 
-# API端點
-AMBULANCE_API = "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634799003993_7633/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=AmbDepots&outputFormat=geojson"
-FIRE_STATION_API = "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634798867463_89696/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=FireStations&outputFormat=geojson"
+import access_log
+import cache_backend
+import debug_profiler
+import layers
+import metrics
+import snapshots
 
-# 緩存數據
-data_cache = {
-    'ambulance': [],
-    'fire_station': [],
-    'timestamp': None
-}
+try:
+    import station_distances
+except ImportError:
+    # 未安裝numpy時停用後備站點功能，其餘功能不受影響
+    station_distances = None
 
-def fetch_url(url):
-    """獲取URL內容"""
-    try:
-        req = urllib.request.Request(url)
-        req.add_header('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
-        with urllib.request.urlopen(req, timeout=10) as response:
-            return json.loads(response.read().decode('utf-8'))
-    except Exception as e:
-        print(f"  錯誤: 獲取數據失敗 - {e}")
-        return None
+# 一個一致的站點數據快照：兩個數據層的記錄、後備站點排名和 消防處編號 -> 行號
+StationData = collections.namedtuple("StationData", "ambulance fire_station backups fire_station_rows")
 
-def fetch_data():
-    """獲取數據並緩存"""
-    try:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 正在更新數據...")
-        
-        # 獲取救護站數據
-        print("  獲取救護站數據...")
-        ambulance_data = fetch_url(AMBULANCE_API)
-        if not ambulance_data:
-            print("  警告: 無法獲取救護站數據")
-            return
-        
-        # 獲取消防局數據
-        print("  獲取消防局數據...")
-        fire_station_data = fetch_url(FIRE_STATION_API)
-        if not fire_station_data:
-            print("  警告: 無法獲取消防局數據")
-            return
-        
-        # 處理救護站數據
-        ambulance_records = []
-        for feature in ambulance_data.get("features", []):
-            props = feature.get("properties", {})
-            ambulance_records.append({
-                "id": props.get("OBJECTID"),
-                "fsd_id": props.get("FSDID"),
-                "name": props.get("Name_TC", ""),
-                "name_en": props.get("Name_ENG", ""),
-                "address": props.get("Address_TC", ""),
-                "address_en": props.get("Address_ENG", ""),
-                "district": props.get("District_TC", ""),
-                "district_en": props.get("District_ENG", ""),
-                "phone": props.get("Telephone", ""),
-                "lat": props.get("Latitude"),
-                "lng": props.get("Longitude")
-            })
-        
-        # 處理消防局數據
-        fire_station_records = []
-        for feature in fire_station_data.get("features", []):
-            props = feature.get("properties", {})
-            fire_station_records.append({
-                "id": props.get("OBJECTID"),
-                "fsd_id": props.get("FSDID"),
-                "name": props.get("Name_TC", ""),
-                "name_en": props.get("Name_ENG", ""),
-                "address": props.get("Address_TC", ""),
-                "address_en": props.get("Address_ENG", ""),
-                "district": props.get("District_TC", ""),
-                "district_en": props.get("District_ENG", ""),
-                "phone": props.get("Telephone", ""),
-                "lat": props.get("Latitude"),
-                "lng": props.get("Longitude")
-            })
-        
-        data_cache['ambulance'] = ambulance_records
-        data_cache['fire_station'] = fire_station_records
-        data_cache['timestamp'] = datetime.now()
-        
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] ✅ 數據更新完成")
-        print(f"  救護站: {len(ambulance_records)} 個")
-        print(f"  消防局: {len(fire_station_records)} 個")
-        
-    except Exception as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] ❌ 數據更新失敗: {e}")
+def station_data(ambulance, fire_station, backups):
+    """構建站點數據快照（行號索引由消防局記錄計算）"""
+    return StationData(ambulance, fire_station, backups,
+                       {str(item['fsd_id']): row for row, item in enumerate(fire_station)})
+
+# 當前快照（由數據層調度器在內容變化時替換）：更新時先構建完整的新快照再替換引用，
+# 讀取方先取得一次引用再讀取各字段，不會混用新舊數據
+data_cache = station_data([], [], None)
+
+_update_lock = threading.Lock()
 
-def background_data_fetcher():
-    """後台數據更新線程"""
-    while True:
-        fetch_data()
-        # 每小時更新一次
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] 下次更新: 1小時後")
-        time.sleep(3600)
+def publish(snapshot):
+    """替換當前的站點數據快照"""
+    global data_cache
+    data_cache = snapshot
+
+def on_layer_update(layer, records):
+    """數據層內容有變化時保存歷史快照、更新緩存，並重新計算後備站點排名（每次變化只計算一次）"""
+    snapshots.record(layer.name, records)
+    with _update_lock:
+        current = data_cache._replace(**{layer.name: records})
+        publish(station_data(current.ambulance, current.fire_station,
+                             compute_backups(current.fire_station, current.ambulance)))
+
+# 按各數據層的TTL在後台刷新，內容沒有變化時不重新計算
+scheduler = layers.LayerScheduler(on_update=on_layer_update)
+
+def data_age():
+    """各數據層距最後一次成功獲取的秒數（/metrics）"""
+    now = time.time()
+    return {(name,): now - status['checked_at']
+            for name, status in scheduler.status().items() if status['checked_at']}
+
+metrics.DATA_AGE_SECONDS.add_callback(data_age)
+
+def cache_status():
+    """頁面所用數據的狀態（訪問日誌）：miss 未加載，stale 最近一次刷新失敗仍用舊數據，hit 正常"""
+    statuses = scheduler.status().values()
+    if any(not status['records'] for status in statuses):
+        return 'miss'
+    if any(status['error'] for status in statuses):
+        return 'stale'
+    return 'hit'
+
+# /metrics 中的路由標籤（其他路徑歸為 other，避免標籤數量無限增長）
+ROUTES = ('/', '/api/backup', '/metrics', '/debug/profile', '/debug/memory')
+
+def route_label(path):
+    route = urllib.parse.urlsplit(path).path
+    return route if route in ROUTES else 'other'
+
+def compute_backups(fire_station_records, ambulance_records):
+    """計算每個消防局的後備消防局和救護站（需要numpy）"""
+    if station_distances is None:
+        return None
+    
+    def coords(records):
+        lats = [item['lat'] if item['lat'] is not None else float('nan') for item in records]
+        lngs = [item['lng'] if item['lng'] is not None else float('nan') for item in records]
+        return lats, lngs
+    
+    fire_lat, fire_lng = coords(fire_station_records)
+    amb_lat, amb_lng = coords(ambulance_records)
+    return station_distances.build_backup_index(fire_lat, fire_lng, amb_lat, amb_lng)
+
+def get_backup_stations(fsd_id, limit=5, snapshot=None):
+    """查詢消防局的後備站點（只查預先計算的結果；snapshot 默認為當前快照）"""
+    snapshot = snapshot or data_cache
+    backups = snapshot.backups
+    fire_station_data = snapshot.fire_station
+    ambulance_data = snapshot.ambulance
+    row = snapshot.fire_station_rows.get(str(fsd_id))
+    if backups is None or row is None:
+        return None
+    
+    ranked = station_distances.backups_for(backups, row, limit)
+    
+    def describe(item, distance):
+        return {
+            'fsd_id': item['fsd_id'],
+            'name': item['name'],
+            'name_en': item['name_en'],
+            'district': item['district'],
+            'distance_km': round(distance, 3)
+        }
+    
+    return {
+        'station': describe(fire_station_data[row], 0.0),
+        'backup_fire_stations': [describe(fire_station_data[j], d) for j, d in ranked['fire_station']],
+        'backup_ambulance_depots': [describe(ambulance_data[j], d) for j, d in ranked['ambulance']]
+    }
 
 def generate_html(data_type="all", search_term="", district=""):
     """生成HTML頁面"""
-    ambulance_data = data_cache['ambulance']
-    fire_station_data = data_cache['fire_station']
-    timestamp = data_cache['timestamp'] or datetime.now()
+    snapshot = data_cache
+    ambulance_data = snapshot.ambulance
+    fire_station_data = snapshot.fire_station
+    statuses = scheduler.status()
+    
+    # 最後一次成功獲取（內容沒有變化也算）的時間
+    checked_times = [status['checked_at'] for status in statuses.values() if status['checked_at']]
+    timestamp = datetime.fromtimestamp(max(checked_times)) if checked_times else datetime.now()
+    
+    # 上游獲取失敗的數據層（顯示的是舊數據）
+    warnings_html = ""
+    for status in statuses.values():
+        if not status['error']:
+            continue
+        checked = status['checked_at']
+        since = f"，顯示的是 {datetime.fromtimestamp(checked).strftime('%Y-%m-%d %H:%M:%S')} 的數據" if checked else ""
+        warnings_html += f'<div class="warning">⚠️ {status["label"]}數據更新失敗{since}（{html.escape(status["error"])}）</div>'
     
     # 過濾數據
     if data_type == "ambulance":
@@ -264,6 +290,14 @@ def generate_html(data_type="all", search_term="", district=""):
         .ambulance-badge {{ background-color: #1976d2; color: white; }}
         .fire-badge {{ background-color: #d32f2f; color: white; }}
         
+        .warning {{
+            background-color: #fff8e1;
+            border-left: 4px solid #ff9800;
+            padding: 10px 15px;
+            margin-bottom: 15px;
+            border-radius: 4px;
+        }}
+        
         .footer {{
             margin-top: 30px;
             text-align: center;
@@ -293,6 +327,8 @@ def generate_html(data_type="all", search_term="", district=""):
             <p class="subtitle">實時顯示救護站和消防局數據 • 最後更新: {timestamp.strftime('%Y-%m-%d %H:%M:%S')}</p>
         </header>
         
+        {warnings_html}
+        
         <div class="controls">
             <form method="GET" action="/">
                 <input type="text" name="search" placeholder="搜索名稱或地址..." value="{html.escape(search_term)}" class="search-box">
@@ -394,42 +430,119 @@ def generate_html(data_type="all", search_term="", district=""):
     
     return html_content
 
+def backup_response(path):
+    """消防局的後備站點排名 (JSON)，返回 (狀態碼, 內容)"""
+    query_string = path.split('?', 1)[1] if '?' in path else ''
+    query_params = urllib.parse.parse_qs(query_string)
+    fsd_id = query_params.get('id', [''])[0]
+    try:
+        limit = int(query_params.get('limit', ['5'])[0])
+    except ValueError:
+        limit = 5
+    
+    snapshot = data_cache
+    if snapshot.backups is None:
+        return 503, {'error': '後備站點功能不可用（需要numpy）或數據尚未加載'}
+    result = get_backup_stations(fsd_id, limit, snapshot)
+    if result is None:
+        return 404, {'error': f'找不到消防局: {fsd_id}'}
+    return 200, result
+
+def handle_request(path, headers):
+    """按路徑生成響應，返回 (狀態碼, 內容類型, 內容字節, 緩存狀態)
+
+    FireServiceHandler 和 async_server.py 共用，兩者的路由和查詢參數相同。
+    """
+    # 主頁面
+    if path == '/' or path.startswith('/?'):
+        # 解析查詢參數
+        query_string = path.split('?', 1)[1] if '?' in path else ''
+        query_params = urllib.parse.parse_qs(query_string)
+        
+        # 獲取查詢參數
+        data_type = query_params.get('type', ['all'])[0]
+        search_term = query_params.get('search', [''])[0]
+        district = query_params.get('district', [''])[0]
+        status = cache_status()
+        
+        # 生成HTML響應
+        with metrics.RENDER_SECONDS.time(page='index'):
+            html_content = generate_html(data_type, search_term, district)
+        return 200, 'text/html; charset=utf-8', html_content.encode('utf-8'), status
+    if path.startswith('/api/backup'):
+        status = cache_status()
+        code, payload = backup_response(path)
+        return code, 'application/json; charset=utf-8', json.dumps(payload, ensure_ascii=False).encode('utf-8'), status
+    if path == '/metrics':
+        # Prometheus 文本格式的運行指標
+        return 200, metrics.CONTENT_TYPE, metrics.REGISTRY.render().encode('utf-8'), None
+    if path.startswith('/debug/'):
+        # 按需採樣分析和內存快照（需要 DEBUG_TOKEN，見 debug_profiler.py）
+        code, content_type, text = debug_profiler.handle(path, headers)
+        return code, content_type, text.encode('utf-8'), None
+    # 其他路徑返回404
+    return 404, 'text/html; charset=utf-8', '<h1>404 - Page Not Found</h1><p>只有主頁面可用。</p>'.encode('utf-8'), None
+
+def record_request(path, status, size, seconds, cache=None, client=None):
+    """按路由記錄處理時間，並寫入訪問日誌（後台線程寫文件，不阻塞請求）"""
+    route = route_label(path)
+    metrics.REQUEST_SECONDS.observe(seconds, route=route, method='GET', status=status)
+    access_log.access('GET', path, route, status, size, seconds, cache, client)
+
 class FireServiceHandler(http.server.SimpleHTTPRequestHandler):
     """自定義HTTP請求處理器"""
     
     def do_GET(self):
         """處理GET請求"""
-        # 只處理根路徑
-        if self.path == '/' or self.path.startswith('/?'):
-            # 解析查詢參數
-            query_string = self.path.split('?', 1)[1] if '?' in self.path else ''
-            query_params = urllib.parse.parse_qs(query_string)
-            
-            # 獲取查詢參數
-            data_type = query_params.get('type', ['all'])[0]
-            search_term = query_params.get('search', [''])[0]
-            district = query_params.get('district', [''])[0]
-            
-            # 生成HTML響應
-            html_content = generate_html(data_type, search_term, district)
-            
-            # 發送響應
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            self.wfile.write(html_content.encode('utf-8'))
-        else:
-            # 其他路徑返回404
-            self.send_response(404)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
+        start = time.perf_counter()
+        status, body, cache = 0, b'', None
+        try:
+            status, content_type, body, cache = handle_request(self.path, self.headers)
+            self.send_response(status)
+            self.send_header('Content-type', content_type)
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(b'<h1>404 - Page Not Found</h1><p>只有主頁面可用。</p>')
+            self.wfile.write(body)
+        finally:
+            record_request(self.path, status, len(body), time.perf_counter() - start, cache, self.client_address[0])
+    
+    def log_request(self, code='-', size='-'):
+        """請求由 do_GET 寫入訪問日誌"""
     
     def log_message(self, format, *args):
-        """自定義日誌格式"""
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] {self.address_string()} - {format % args}")
+        """其他消息（例如無效請求）寫入結構化日誌"""
+        access_log.event('WARNING', f"{self.address_string()} - {format % args}", client=self.client_address[0])
 
 def main():
     """主函數"""
     print("=" * 60)
-    print("  香港消防處服務查看器 -
\ No newline at end of file
+    print("  香港消防處服務查看器 - 啟動腳本")
+    print("=" * 60)
+    
+    # 端口: python3 start_server.py [端口]
+    port = 8000
+    if len(sys.argv) > 1:
+        try:
+            port = int(sys.argv[-1])
+        except ValueError:
+            print(f"⚠️  無效端口: {sys.argv[-1]}，使用默認端口 {port}")
+    
+    # 啟動數據層調度器（啟動後立即進行首次更新）；經共享數據緩存獲取，與其他入口共用
+    scheduler.cache = cache_backend.backend()
+    scheduler.start()
+    
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    socketserver.ThreadingTCPServer.daemon_threads = True
+    with socketserver.ThreadingTCPServer(("", port), FireServiceHandler) as httpd:
+        print(f"🌐 服務器已啟動: http://localhost:{port}")
+        print(f"📊 運行指標: http://localhost:{port}/metrics")
+        if debug_profiler.DEBUG_TOKEN:
+            print(f"🔬 調試端點: http://localhost:{port}/debug/profile?seconds=5 和 /debug/memory（需要 DEBUG_TOKEN）")
+        print("   按 Ctrl+C 停止")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\n🛑 服務器已停止")
+
+if __name__ == "__main__":
+    main()
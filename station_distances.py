@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 站點距離矩陣
+每次數據刷新時計算一次消防局到其他消防局/救護站的距離，
+只保留最近的 top-k（float32），查詢時不再重新計算距離
+"""
+
+import numpy as np
+
+# 地球平均半徑（公里）
+EARTH_RADIUS_KM = 6371.0088
+
+# 每個站點保留的後備站點數量
+TOP_K = 10
+
+# 每次計算的行數，限制中間矩陣的大小
+BLOCK_ROWS = 1024
+
+
+def haversine_matrix(src_lat, src_lng, dst_lat, dst_lng):
+    """向量化大圓距離矩陣（公里），形狀為 (len(src), len(dst))"""
+    src_lat = np.radians(np.asarray(src_lat, dtype=np.float64))[:, None]
+    src_lng = np.radians(np.asarray(src_lng, dtype=np.float64))[:, None]
+    dst_lat = np.radians(np.asarray(dst_lat, dtype=np.float64))[None, :]
+    dst_lng = np.radians(np.asarray(dst_lng, dtype=np.float64))[None, :]
+
+    a = (np.sin((dst_lat - src_lat) / 2) ** 2 +
+         np.cos(src_lat) * np.cos(dst_lat) * np.sin((dst_lng - src_lng) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_k(src_lat, src_lng, dst_lat, dst_lng, top_k=TOP_K, exclude_self=False):
+    """為每個源站點找出最近的 top_k 個目標站點
+
+    返回 (indices int32, distances float32)，形狀均為 (len(src), k)，按距離升序。
+    exclude_self=True 時源和目標是同一圖層，排除站點自身。
+    """
+    n_src, n_dst = len(src_lat), len(dst_lat)
+    k = min(top_k, n_dst - 1 if exclude_self else n_dst)
+    indices = np.zeros((n_src, max(k, 0)), dtype=np.int32)
+    distances = np.zeros((n_src, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return indices, distances
+
+    for start in range(0, n_src, BLOCK_ROWS):
+        stop = min(start + BLOCK_ROWS, n_src)
+        block = haversine_matrix(src_lat[start:stop], src_lng[start:stop], dst_lat, dst_lng)
+        if exclude_self:
+            rows = np.arange(stop - start)
+            block[rows, rows + start] = np.inf
+
+        if k < n_dst:
+            part = np.argpartition(block, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(n_dst), (stop - start, 1))
+        part_dist = np.take_along_axis(block, part, axis=1)
+        order = np.argsort(part_dist, axis=1, kind='stable')
+
+        indices[start:stop] = np.take_along_axis(part, order, axis=1)
+        distances[start:stop] = np.take_along_axis(part_dist, order, axis=1)
+
+    return indices, distances
+
+
+def build_backup_index(fire_lat, fire_lng, amb_lat, amb_lng, top_k=TOP_K):
+    """計算每個消防局的後備消防局和救護站排名
+
+    返回字典 {'fire_station': (indices, distances), 'ambulance': (indices, distances)}，
+    行號對應輸入消防局的順序，indices 對應各自圖層的記錄順序。
+    """
+    fire_lat = np.asarray(fire_lat, dtype=np.float64)
+    fire_lng = np.asarray(fire_lng, dtype=np.float64)
+    amb_lat = np.asarray(amb_lat, dtype=np.float64)
+    amb_lng = np.asarray(amb_lng, dtype=np.float64)
+
+    return {
+        'fire_station': nearest_k(fire_lat, fire_lng, fire_lat, fire_lng, top_k, exclude_self=True),
+        'ambulance': nearest_k(fire_lat, fire_lng, amb_lat, amb_lng, top_k),
+    }
+
+
+def backups_for(index, row, limit=None):
+    """查詢第 row 個消防局的後備站點，返回 {圖層: [(記錄行號, 距離公里), ...]}"""
+    result = {}
+    for layer, (indices, distances) in index.items():
+        pairs = [(int(j), float(d)) for j, d in zip(indices[row], distances[row]) if np.isfinite(d)]
+        result[layer] = pairs[:limit] if limit else pairs
+    return result
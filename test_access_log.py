@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+測試結構化日誌
+使用本地回放服務器和合成夾具，不需要訪問 portal.csdi.gov.hk
+"""
+
+import contextlib
+import io
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import access_log
+import http_pool
+import layers
+import snapshots
+import wfs_replay
+
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_json_lines():
+    """記錄寫成JSON行，flush 等待寫入；只有非訪問記錄顯示在控制台"""
+    print("📝 測試JSON行...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "logs", "app.log")
+        writer = access_log.LogWriter(path, flush_interval=0.05)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            writer.submit({"ts": time.time(), "level": "INFO", "event": "access", "route": "/", "status": 200})
+            writer.submit({"ts": time.time(), "level": "INFO", "event": "message", "message": "✅ 救護站: 39 個",
+                           "layer": "ambulance"})
+            assert writer.flush()
+        writer.close()
+
+        access, message = read_lines(path)
+        assert access["event"] == "access" and access["status"] == 200
+        assert datetime.fromisoformat(access["ts"])
+        assert message["layer"] == "ambulance" and message["message"] == "✅ 救護站: 39 個"
+        assert output.getvalue().count("\n") == 1 and "✅ 救護站: 39 個" in output.getvalue()
+        assert writer.written == 2 and writer.dropped == 0
+        print("✅ 2 條記錄")
+
+
+def test_rotation():
+    """超過大小時輪換，只保留 backup_count 個舊文件，每行都完整"""
+    print("\n🔄 測試輪換...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "app.log")
+        writer = access_log.LogWriter(path, max_bytes=2000, backup_count=2, flush_interval=0.01, console=False)
+        for index in range(100):
+            writer.submit({"ts": time.time(), "level": "INFO", "event": "access", "index": index})
+            if index % 10 == 9:
+                assert writer.flush()
+        writer.close()
+
+        assert sorted(os.listdir(directory)) == ["app.log", "app.log.1", "app.log.2"]
+        indexes = []
+        for name in ("app.log.2", "app.log.1", "app.log"):
+            assert os.path.getsize(os.path.join(directory, name)) <= 2000
+            indexes.extend(entry["index"] for entry in read_lines(os.path.join(directory, name)))
+        assert indexes == list(range(indexes[0], 100)) and indexes[0] > 0
+        print(f"✅ 保留最後 {len(indexes)} 條記錄")
+
+
+def test_never_blocks():
+    """寫入線程很慢時提交記錄也不等待，隊列滿了就丟棄並計數"""
+    print("\n🚦 測試不阻塞...")
+    with tempfile.TemporaryDirectory() as directory:
+        writer = access_log.LogWriter(os.path.join(directory, "app.log"), queue_size=10, console=False)
+        release = threading.Event()
+        original = writer._write
+
+        def slow_write(entries):
+            release.wait(5)
+            original(entries)
+
+        writer._write = slow_write
+        start = time.perf_counter()
+        for index in range(1000):
+            writer.submit({"ts": time.time(), "level": "INFO", "event": "access", "index": index})
+        elapsed = time.perf_counter() - start
+        release.set()
+        writer.close()
+
+        assert elapsed < 0.5, elapsed
+        assert writer.dropped >= 900 and writer.written + writer.dropped == 1000
+        print(f"✅ {elapsed * 1000:.1f} 毫秒提交 1000 條，丟棄 {writer.dropped} 條")
+
+
+def test_server_access_log():
+    """start_server.py 每個請求一條訪問記錄：路由、狀態碼、響應字節數、耗時和緩存狀態"""
+    print("\n🌐 測試服務器訪問日誌...")
+    import start_server
+
+    with tempfile.TemporaryDirectory() as directory:
+        for layer in layers.LAYERS.values():
+            wfs_replay.save_fixture(directory, layer, wfs_replay.synthetic_features(layer, 30),
+                                    source_url="synthetic")
+        upstream = wfs_replay.start_replay_server(directory)
+        path = os.path.join(directory, "app.log")
+        original = layers.WFS_UPSTREAM, snapshots.store.directory, access_log.writer
+        layers.WFS_UPSTREAM, snapshots.store.directory = upstream.base_url, directory
+        access_log.writer = access_log.LogWriter(path, flush_interval=0.05, console=False)
+        server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), start_server.FireServiceHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            start_server.scheduler.refresh_all()
+            base = f"http://127.0.0.1:{server.server_address[1]}"
+            responses = [http_pool.get(base + path) for path in
+                         ("/?type=fire&search=%E5%90%88%E6%88%90", "/api/backup?id=none", "/no-such-page")]
+            # 訪問記錄在響應發出後提交，等待三條都寫入
+            deadline = time.monotonic() + 5
+            entries = []
+            while len(entries) < 3 and time.monotonic() < deadline:
+                assert access_log.flush()
+                entries = [entry for entry in read_lines(path) if entry["event"] == "access"] \
+                    if os.path.exists(path) else []
+            # 各請求在不同線程處理，記錄順序不一定與請求順序相同
+            entries.sort(key=lambda entry: ["/", "/api/backup", "other"].index(entry["route"]))
+            assert [(entry["route"], entry["status"], entry["cache"]) for entry in entries] == [
+                ("/", 200, "hit"), ("/api/backup", responses[1].status, "hit"), ("other", 404, None)]
+            assert [entry["bytes"] for entry in entries] == [len(response.body) for response in responses]
+            assert entries[0]["path"] == "/?type=fire&search=%E5%90%88%E6%88%90"
+            assert all(entry["ms"] >= 0 and entry["client"] == "127.0.0.1" for entry in entries)
+            print(f"✅ {len(entries)} 條訪問記錄")
+        finally:
+            access_log.writer.close()
+            layers.WFS_UPSTREAM, snapshots.store.directory, access_log.writer = original
+            server.shutdown()
+            upstream.shutdown()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -3,10 +3,11 @@
 測試香港消防處API
 """
 
-import requests
 import json
 from datetime import datetime
 
+import http_pool
+
 def test_ambulance_api():
     """測試救護站API"""
     print("🚑 測試救護站API...")
@@ -14,15 +15,16 @@ def test_ambulance_api():
     url = "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634799003993_7633/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=AmbDepots&outputFormat=geojson&count=5"
     
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
+        response = http_pool.get(url, timeout=10)
+        if response.status >= 400:
+            raise RuntimeError(f"HTTP {response.status} {response.reason}")
         
         data = response.json()
         
         print(f"✅ API響應成功")
-        print(f"   狀態碼: {response.status_code}")
+        print(f"   狀態碼: {response.status}")
         print(f"   救護站數量: {len(data.get('features', []))}")
-        print(f"   響應時間: {response.elapsed.total_seconds():.2f}秒")
+        print(f"   響應時間: {response.elapsed:.2f}秒")
         
         if data.get('features'):
             print("\n📋 前5個救護站:")
@@ -43,15 +45,16 @@ def test_fire_station_api():
     url = "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634798867463_89696/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=FireStations&outputFormat=geojson&count=5"
     
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
+        response = http_pool.get(url, timeout=10)
+        if response.status >= 400:
+            raise RuntimeError(f"HTTP {response.status} {response.reason}")
         
         data = response.json()
         
         print(f"✅ API響應成功")
-        print(f"   狀態碼: {response.status_code}")
+        print(f"   狀態碼: {response.status}")
         print(f"   消防局數量: {len(data.get('features', []))}")
-        print(f"   響應時間: {response.elapsed.total_seconds():.2f}秒")
+        print(f"   響應時間: {response.elapsed:.2f}秒")
         
         if data.get('features'):
             print("\n📋 前5個消防局:")
@@ -75,7 +78,7 @@ def test_data_processing():
         
         # 測試救護站API
         url = "https://portal.csdi.gov.hk/server/services/common/hkfsd_rcd_1634799003993_7633/MapServer/WFSServer?service=wfs&request=GetFeature&typenames=AmbDepots&outputFormat=geojson&count=3"
-        response = requests.get(url, timeout=10)
+        response = http_pool.get(url, timeout=10)
         data = response.json()
         
         # 轉換為GeoDataFrame
@@ -123,6 +126,10 @@ def main():
     for test, result in results.items():
         print(f"  {test}: {result}")
     
+    # 連接池統計：同一主機的請求應重用長連接
+    for host, pool_stats in http_pool.stats().items():
+        print(f"  連接池 {host}: 新建 {pool_stats['created']} 個連接, 重用 {pool_stats['reused']} 次")
+    
     all_passed = ambulance_ok and fire_station_ok and processing_ok
     
     print("\n" + "=" * 50)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+測試 asyncio 服務器
+使用本地回放服務器和合成夾具，不需要訪問 portal.csdi.gov.hk
+"""
+
+import asyncio
+import http.client
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+
+import async_server
+import debug_profiler
+import http_pool
+import layers
+import snapshots
+import wfs_replay
+
+
+class BackgroundServer:
+    """在後台線程的事件循環中運行 AsyncFireServer"""
+
+    def __init__(self, **options):
+        self.loop = asyncio.new_event_loop()
+        self.server = async_server.AsyncFireServer(host="127.0.0.1", port=0, refresh=False, **options)
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.server.start())
+            ready.set()
+            self.loop.run_until_complete(self.server.serve_forever())
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        assert ready.wait(10), "服務器沒有啟動"
+        self.port = self.server.port
+
+    def stop(self):
+        self.server.stop()
+        self.thread.join(15)
+        self.loop.close()
+
+
+def read_response(stream):
+    """從 sock.makefile('rb') 讀取一個響應，返回 (狀態碼, 頭部字典, 內容)；連接已關閉時返回None"""
+    status_line = stream.readline()
+    if not status_line:
+        return None
+    headers = {}
+    for line in iter(stream.readline, b"\r\n"):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.lower()] = value.strip()
+    return int(status_line.split()[1]), headers, stream.read(int(headers.get("content-length", 0)))
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_same_responses():
+    """所有路由和查詢參數的響應與 start_server.py 的 FireServiceHandler 相同"""
+    print("🔁 測試與 start_server.py 相同的響應...")
+    import start_server
+
+    with tempfile.TemporaryDirectory() as directory:
+        fsd_id = None
+        for layer in layers.LAYERS.values():
+            features = wfs_replay.synthetic_features(layer, 30)
+            if layer.name == 'fire_station':
+                fsd_id = features[0]["properties"]["FSDID"]
+            wfs_replay.save_fixture(directory, layer, features, source_url="synthetic")
+        upstream = wfs_replay.start_replay_server(directory)
+        original = layers.WFS_UPSTREAM, snapshots.store.directory
+        layers.WFS_UPSTREAM, snapshots.store.directory = upstream.base_url, directory
+        threaded = socketserver.ThreadingTCPServer(("127.0.0.1", 0), start_server.FireServiceHandler)
+        threaded.daemon_threads = True
+        threading.Thread(target=threaded.serve_forever, daemon=True).start()
+        background = BackgroundServer()
+        try:
+            start_server.scheduler.refresh_all()
+            paths = ["/", "/?type=ambulance", "/?search=%E5%90%88%E6%88%90&type=fire",
+                     "/?district=%E6%B2%99%E7%94%B0%E5%8D%80", f"/api/backup?id={fsd_id}&limit=3",
+                     "/api/backup?id=none", "/no-such-page"]
+            for path in paths:
+                expected = http_pool.get(f"http://127.0.0.1:{threaded.server_address[1]}{path}")
+                actual = http_pool.get(f"http://127.0.0.1:{background.port}{path}")
+                assert (actual.status, actual.body) == (expected.status, expected.body), path
+            print(f"✅ {len(paths)} 個路徑的響應相同")
+        finally:
+            background.stop()
+            layers.WFS_UPSTREAM, snapshots.store.directory = original
+            threaded.shutdown()
+            upstream.shutdown()
+
+
+def test_keep_alive():
+    """HTTP/1.1 保持連接並支持流水線請求；HTTP/1.0、Connection: close 和錯誤請求後關閉連接"""
+    print("\n🔗 測試保持連接...")
+    background = BackgroundServer()
+    try:
+        with socket.create_connection(("127.0.0.1", background.port), timeout=5) as sock:
+            stream = sock.makefile("rb")
+            sock.sendall(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\nGET /no-such-page HTTP/1.1\r\nHost: x\r\n\r\n")
+            first, second = read_response(stream), read_response(stream)
+            assert first[0] == 200 and first[1]["connection"] == "keep-alive"
+            assert b"fsd_open_connections" in first[2]
+            assert second[0] == 404 and second[1]["connection"] == "keep-alive"
+            sock.sendall(b"GET /metrics HTTP/1.1\r\nConnection: close\r\n\r\n")
+            assert read_response(stream)[1]["connection"] == "close"
+            assert stream.read() == b""
+
+        for request, status in ((b"GET /metrics HTTP/1.0\r\n\r\n", 200), (b"POST / HTTP/1.1\r\n\r\n", 501),
+                                (b"nonsense\r\n\r\n", 400), (b"GET / HTTP/1.1\r\nbroken\r\n\r\n", 400)):
+            with socket.create_connection(("127.0.0.1", background.port), timeout=5) as sock:
+                stream = sock.makefile("rb")
+                sock.sendall(request)
+                response = read_response(stream)
+                assert response[0] == status and response[1]["connection"] == "close", request
+                assert stream.read() == b""
+        print(f"✅ 共處理 {background.server.requests} 個請求")
+    finally:
+        background.stop()
+
+
+def test_idle_connections():
+    """大量空閒連接不影響其他請求，超過保持時間後關閉"""
+    print("\n🔌 測試空閒連接...")
+    background = BackgroundServer(keepalive=1.5)
+    sockets = []
+    try:
+        for _ in range(1000):
+            sockets.append(socket.create_connection(("127.0.0.1", background.port), timeout=5))
+        assert wait_for(lambda: async_server.open_connections()[('idle',)] >= 1000)
+
+        start = time.perf_counter()
+        assert http_pool.get(f"http://127.0.0.1:{background.port}/metrics").status == 200
+        elapsed = time.perf_counter() - start
+        assert elapsed < 1.0, elapsed
+
+        assert wait_for(lambda: not background.server.connections, timeout=10)
+        assert all(sock.recv(1) == b"" for sock in sockets)
+        print(f"✅ 1000 個空閒連接時請求耗時 {elapsed * 1000:.1f} 毫秒，超時後全部關閉")
+    finally:
+        for sock in sockets:
+            sock.close()
+        background.stop()
+
+
+def test_graceful_shutdown():
+    """停止時關閉空閒連接、拒絕新連接，進行中的請求完成並帶 Connection: close"""
+    print("\n🛑 測試優雅關閉...")
+    original = debug_profiler.DEBUG_TOKEN
+    debug_profiler.DEBUG_TOKEN = "secret"
+    background = BackgroundServer()
+    idle = [socket.create_connection(("127.0.0.1", background.port), timeout=5) for _ in range(10)]
+    result = {}
+
+    def slow_request():
+        conn = http.client.HTTPConnection("127.0.0.1", background.port, timeout=10)
+        conn.request("GET", "/debug/profile?seconds=0.5&token=secret")
+        response = conn.getresponse()
+        result.update(status=response.status, connection=response.getheader("Connection"),
+                      body=response.read())
+        conn.close()
+
+    try:
+        thread = threading.Thread(target=slow_request)
+        thread.start()
+        assert wait_for(lambda: any(background.server.connections.values()))
+        background.stop()
+        thread.join(10)
+
+        assert result["status"] == 200 and result["connection"] == "close"
+        assert result["body"].startswith("# ".encode("utf-8"))
+        assert all(sock.recv(1) == b"" for sock in idle)
+        try:
+            socket.create_connection(("127.0.0.1", background.port), timeout=2).close()
+            raise AssertionError("關閉後不應接受新連接")
+        except ConnectionRefusedError:
+            pass
+        print("✅ 進行中的請求完成，空閒連接已關閉")
+    finally:
+        debug_profiler.DEBUG_TOKEN = original
+        for sock in idle:
+            sock.close()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
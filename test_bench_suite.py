@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+測試基準測試套件
+每個基準在 1× 合成夾具上運行一次，不需要網絡
+"""
+
+import pytest
+
+import bench_suite
+from bench_suite import BENCHMARKS, REAL_COUNTS
+
+# folium 對離線底圖的提示與基準無關
+pytestmark = pytest.mark.filterwarnings("ignore::UserWarning:folium")
+
+
+def test_each_benchmark_runs_once():
+    """所有基準在 1× 下各運行一次並返回計時和結果"""
+    print("⏱️ 測試基準冒煙運行...")
+    stations = sum(REAL_COUNTS.values())
+    result = bench_suite.run_suite(scales=(1,), repeats=1, max_seconds=60, log=lambda message: None)
+    by_name = {r['benchmark']: r for r in result['results']}
+    assert list(by_name) == list(BENCHMARKS)
+    for name, r in by_name.items():
+        assert r['scale'] == 1 and r['stations'] == stations, r
+        assert r['repeats'] == 1 and r['min_seconds'] >= 0, r
+
+    assert by_name['parse']['extra']['records'] == stations
+    assert by_name['dataframe']['extra']['rows'] == stations
+    assert by_name['districts']['extra']['districts'] > 0
+    assert by_name['server_html']['extra']['bytes'] > 0
+    assert by_name['map_html']['extra']['bytes'] > 0
+    print(f"✅ {len(by_name)} 個基準都已運行")
+
+
+def test_map_build_recomputes_sites():
+    """map_build 每次都重新計算共用站址，而不是測量 st.cache_data 的緩存命中"""
+    print("\n🗺️ 測試地圖構建不使用緩存...")
+    import app
+
+    calls = []
+    original = app.find_sites
+
+    def counting(points):
+        calls.append(len(points))
+        return original(points)
+
+    fixture = bench_suite.Fixture(1)
+    app.find_sites = counting
+    try:
+        result = bench_suite.run_benchmark('map_build', BENCHMARKS['map_build'], fixture, 3, 60)
+    finally:
+        app.find_sites = original
+    assert result['repeats'] == 3
+    assert calls == [fixture.stations] * 3, calls
+    print("✅ 3 次運行計算 3 次站址")
+
+
+def test_estimate_seconds():
+    """按最近兩個倍數的增長率估算，不低於線性"""
+    history = [{'scale': 1, 'min_seconds': 0.01}, {'scale': 10, 'min_seconds': 1.0}]
+    assert abs(bench_suite.estimate_seconds(history, 100) - 100.0) < 1e-6
+    assert abs(bench_suite.estimate_seconds(history[:1], 10) - 0.1) < 1e-9
+    flat = [{'scale': 1, 'min_seconds': 0.5}, {'scale': 10, 'min_seconds': 0.5}]
+    assert abs(bench_suite.estimate_seconds(flat, 100) - 5.0) < 1e-9
+    assert bench_suite.estimate_seconds([], 10) == 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
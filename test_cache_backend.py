@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+測試共享數據緩存後端
+使用本地回放服務器、合成夾具和 cache_server.py，不需要訪問 portal.csdi.gov.hk 或安裝Redis
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cache_backend
+import cache_server
+import layers
+import load_test
+import wfs_replay
+
+
+def test_memory_lru():
+    """內存後端按最近使用淘汰，版本號每次寫入加一，max_age 過濾舊條目"""
+    print("🧠 測試內存LRU...")
+    cache = cache_backend.MemoryCache(maxsize=2)
+    assert cache.put("a", [1]) == 1 and cache.put("b", [2]) == 1
+    assert cache.get("a").value == [1]
+    cache.put("c", [3])
+    assert cache.get("b") is None and cache.get("a").value == [1] and cache.get("c").value == [3]
+    assert cache.put("a", [4]) == 2 and cache.version("a") == 2 and cache.version("missing") is None
+
+    time.sleep(0.05)
+    assert cache.get("a", max_age=0.01) is None and cache.get("a", max_age=60).value == [4]
+    calls = []
+    entry = cache.get_or_load("a", lambda: calls.append(1) or [5], ttl=0.01)
+    assert calls and entry.value == [5] and entry.version == 3
+
+    # 淘汰的鍵不保留版本號，重新寫入時版本號仍大於淘汰前
+    for i in range(100):
+        cache.put(f"k{i}", [i])
+    assert len(cache._entries) == 2 and cache.version("a") is None
+    assert cache.put("a", [6]) > 3
+    print("✅ 淘汰和版本號正確")
+
+
+def test_disk_cross_process():
+    """多個進程同時請求過期的鍵時只有一個調用加載函數，其他進程讀到它寫入的值"""
+    print("\n💽 測試磁盤緩存（多進程）...")
+    with tempfile.TemporaryDirectory() as directory:
+        marker = os.path.join(directory, "loads.txt")
+        script = (
+            "import sys, time, cache_backend\n"
+            "def loader():\n"
+            f"    open({marker!r}, 'a').write('x')\n"
+            "    time.sleep(0.5)\n"
+            "    return {'records': ['合成站']}\n"
+            f"entry = cache_backend.DiskCache({directory!r}).get_or_load('layer:test', loader, ttl=60)\n"
+            "print(entry.version, entry.value['records'][0])\n"
+        )
+        root = os.path.dirname(os.path.abspath(__file__))
+        processes = [subprocess.Popen([sys.executable, "-c", script], cwd=root, stdout=subprocess.PIPE,
+                                      text=True, encoding='utf-8') for _ in range(4)]
+        outputs = [process.communicate(timeout=60)[0].strip() for process in processes]
+        assert all(process.returncode == 0 for process in processes)
+        assert outputs == ["1 合成站"] * 4, outputs
+        with open(marker) as f:
+            assert f.read() == "x"
+
+        cache = cache_backend.DiskCache(directory)
+        assert cache.version("layer:test") == 1
+        assert cache.put("layer:test", {'records': []}) == 2
+        assert cache.get("layer:test").value == {'records': []}
+        with open(cache._path("layer:test"), 'w') as f:
+            f.write("{損壞")
+        assert cache.get("layer:test") is None and cache.version("layer:test") is None
+        print("✅ 4 個進程只加載一次")
+
+
+def test_redis_protocol():
+    """RedisCache 通過 cache_server.py 讀寫、加鎖；服務器不可用時數據層直接請求上游"""
+    print("\n🧰 測試Redis協議後端...")
+    loop = asyncio.new_event_loop()
+    server = cache_server.CacheServer(port=0)
+    loop.run_until_complete(server.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    url = f"redis://127.0.0.1:{server.port}/3"
+    try:
+        cache = cache_backend.RedisCache(url)
+        assert cache.get("k") is None and cache.version("k") is None
+        assert cache.put("k", {"名稱": "合成站"}) == 1 and cache.put("k", [1, 2]) == 2
+        assert cache.get("k").value == [1, 2] and cache.version("k") == 2
+        assert cache_backend.RedisCache(f"redis://127.0.0.1:{server.port}/0").get("k") is None
+
+        client = cache.client
+        assert client.command("SET", "t", "v", "PX", "50") == "OK"
+        assert client.command("SET", "t", "w", "NX") is None
+        time.sleep(0.1)
+        assert client.command("GET", "t") is None
+        try:
+            client.command("NOSUCH")
+            raise AssertionError("未知命令應返回錯誤")
+        except cache_backend.RespError:
+            pass
+
+        # 兩個客戶端的鎖互斥
+        inside, overlaps = [], []
+
+        def hold():
+            with cache_backend.RedisCache(url).lock("k"):
+                inside.append(1)
+                overlaps.append(len(inside))
+                time.sleep(0.1)
+                inside.pop()
+
+        threads = [threading.Thread(target=hold) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert overlaps == [1, 1, 1]
+        assert client.command("EXISTS", "fsd:k:lock") == 0
+
+        # 鎖過期後被其他進程取得：釋放時不刪除別人的鎖
+        with cache.lock("k"):
+            client.command("SET", "fsd:k:lock", "別人的令牌")
+        assert client.command("GET", "fsd:k:lock") == "別人的令牌".encode()
+        client.command("DEL", "fsd:k:lock")
+
+        # 釋放鎖失敗時已完成的加載照常返回，數據層不會再直接請求上游
+        command = cache.client.command
+
+        def failing_release(*args):
+            if args[0] == "EVAL":
+                raise cache_backend.CacheUnavailable("連接中斷")
+            return command(*args)
+
+        cache.client.command = failing_release
+        layer = layers.Layer('cache-test', '測試層', "http://example.invalid/wfs", {"id": "OBJECTID"})
+        fetches = []
+        layer.fetch = lambda: fetches.append(1) or [{"id": 1}]
+        entry = layer.fetch_cached(cache, 0)
+        assert fetches == [1] and entry.value == [{"id": 1}] and entry.version == 1
+        cache.client.command = command
+    finally:
+        asyncio.run_coroutine_threadsafe(server.shutdown(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+    dead = cache_backend.RedisCache(f"redis://127.0.0.1:{load_test.free_port()}/0")
+    try:
+        dead.get("k")
+        raise AssertionError("服務器不可用時應拋出 CacheUnavailable")
+    except cache_backend.CacheUnavailable:
+        pass
+    layer = layers.Layer('cache-test', '測試層', "http://example.invalid/wfs", {"id": "OBJECTID"})
+    layer.fetch = lambda: [{"id": 1}]
+    entry = layer.fetch_cached(dead)
+    assert entry.value == [{"id": 1}] and entry.version is None
+    print(f"✅ 共處理 {server.commands} 個命令")
+
+
+def test_schedulers_share_refresh():
+    """兩個入口的調度器共用磁盤緩存：只有第一個請求上游，手動刷新寫入的新版本被另一個讀入"""
+    print("\n🔁 測試入口之間共用刷新...")
+    with tempfile.TemporaryDirectory() as directory:
+        for layer in layers.LAYERS.values():
+            wfs_replay.save_fixture(directory, layer, wfs_replay.synthetic_features(layer, 20),
+                                    source_url="synthetic")
+        upstream = wfs_replay.start_replay_server(directory)
+        original = layers.WFS_UPSTREAM
+        layers.WFS_UPSTREAM = upstream.base_url
+        cache = cache_backend.DiskCache(os.path.join(directory, "cache"))
+        first = layers.LayerScheduler(cache=cache)
+        second = layers.LayerScheduler(cache=cache)
+        try:
+            assert set(first.refresh_all(force=False).values()) == {layers.UPDATED}
+            fetched = upstream.requests
+            assert fetched > 0
+            assert set(second.refresh_all(force=False).values()) == {layers.UPDATED}
+            assert upstream.requests == fetched
+            assert second.records('fire_station') == first.records('fire_station')
+            assert second.status()['fire_station']['next_refresh_seconds'] > 0
+            assert not second.run_pending()
+
+            # 另一個入口手動刷新（例如 app.py 的刷新按鈕）
+            layer = layers.LAYERS['fire_station']
+            entry = layer.fetch_cached(cache, 0)
+            assert upstream.requests > fetched and entry.version == 2
+            refetched = upstream.requests
+            futures = second.run_pending()
+            assert set(futures) == {'fire_station'}
+            assert futures['fire_station'].result() == layers.UNCHANGED
+            assert upstream.requests == refetched
+            assert second.status()['fire_station']['checked_at'] == entry.stored_at
+            print(f"✅ 上游請求 {refetched} 次（兩個調度器 + 一次手動刷新）")
+        finally:
+            layers.WFS_UPSTREAM = original
+            first.stop()
+            second.stop()
+            upstream.shutdown()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+測試共用站址檢測
+使用合成的東距/北距坐標，不需要訪問 portal.csdi.gov.hk
+"""
+
+from colocation import find_sites, site_summary
+
+
+def point(layer, row, easting, northing):
+    """合成站點：經緯度只用於站址坐標，距離按東距/北距計算"""
+    return (layer, row, 22.3 + northing / 1e6, 114.1 + easting / 1e6, easting, northing)
+
+
+def test_same_layer_not_merged():
+    """相距很近的兩個消防局（或兩個救護站）仍然是兩個站址"""
+    print("🚒 測試同一圖層不合併...")
+    points = [
+        point('fire_station', 0, 836000.0, 818000.0),
+        point('fire_station', 1, 836010.0, 818000.0),
+        point('ambulance', 0, 840000.0, 820000.0),
+        point('ambulance', 1, 840005.0, 820000.0),
+    ]
+    sites = find_sites(points, radius_m=60)
+    assert [site['members'] for site in sites] == [
+        [('fire_station', 0)], [('fire_station', 1)], [('ambulance', 0)], [('ambulance', 1)]
+    ], sites
+    assert site_summary(sites) == {'sites': 4, 'shared_sites': 0}
+    print("✅ 4 個站址，沒有共用站址")
+
+
+def test_chain_not_transitive():
+    """消防局-救護站-消防局 相鄰排列時，救護站只併入最近的消防局，兩個消防局不會連成一個站址"""
+    print("\n🔗 測試不傳遞合併...")
+    points = [
+        point('fire_station', 0, 836000.0, 818000.0),
+        point('ambulance', 0, 836040.0, 818000.0),
+        point('fire_station', 1, 836090.0, 818000.0),
+    ]
+    sites = find_sites(points, radius_m=60)
+    assert [site['members'] for site in sites] == [
+        [('fire_station', 0), ('ambulance', 0)], [('fire_station', 1)]
+    ], sites
+    assert (sites[0]['lat'], sites[0]['lng']) == points[0][2:4]
+
+    # 救護站更靠近第二個消防局時併入第二個
+    points[1] = point('ambulance', 0, 836050.0, 818000.0)
+    sites = find_sites(points, radius_m=60)
+    assert [site['members'] for site in sites] == [
+        [('fire_station', 0)], [('ambulance', 0), ('fire_station', 1)]
+    ], sites
+    print("✅ 救護站只併入最近的消防局")
+
+
+def test_radius_and_grid_cells():
+    """半徑邊界和跨網格的點；超出半徑的救護站獨立成站址"""
+    print("\n📏 測試半徑邊界...")
+    points = [
+        point('fire_station', 0, 119.0, 0.0),
+        point('ambulance', 0, 179.0, 0.0),     # 相距60米（在相鄰網格）
+        point('fire_station', 1, 1000.0, 1000.0),
+        point('ambulance', 1, 1040.0, 1045.0),  # 相距約60.2米
+    ]
+    sites = find_sites(points, radius_m=60)
+    assert [site['members'] for site in sites] == [
+        [('fire_station', 0), ('ambulance', 0)], [('fire_station', 1)], [('ambulance', 1)]
+    ], sites
+    assert site_summary(sites) == {'sites': 3, 'shared_sites': 1}
+    print("✅ 半徑以內合併，以外獨立")
+
+
+def test_invalid_coordinates():
+    """坐標缺失或為NaN的點不屬於任何站址"""
+    print("\n❓ 測試無效坐標...")
+    nan = float('nan')
+    points = [
+        ('fire_station', 0, 22.3, 114.1, nan, nan),
+        ('ambulance', 0, None, None, None, None),
+        point('ambulance', 1, 0.0, 0.0),
+    ]
+    assert find_sites([]) == []
+    sites = find_sites(points)
+    assert [site['members'] for site in sites] == [[('ambulance', 1)]], sites
+    print("✅ 無效坐標被忽略")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+測試按需採樣分析和內存快照
+不需要網絡
+"""
+
+import socketserver
+import threading
+import time
+import tracemalloc
+
+import debug_profiler
+import http_pool
+
+
+def spin_until(stop):
+    """佔用CPU的測試函數，採樣結果中應該出現"""
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def parse_collapsed(text):
+    """{collapsed棧: 次數}"""
+    stacks = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            stack, count = line.rsplit(' ', 1)
+            stacks[stack] = int(count)
+    return stacks
+
+
+def test_collapsed_stacks():
+    """所有線程的棧按 線程名;外層函數;...;內層函數 次數 輸出，同一時間只允許一個採樣"""
+    print("🔥 測試調用棧採樣...")
+    stop = threading.Event()
+    worker = threading.Thread(target=spin_until, args=(stop,), name="layer-refresh-test")
+    worker.start()
+    try:
+        text = debug_profiler.profile(0.3, interval=0.005)
+    finally:
+        stop.set()
+        worker.join()
+
+    stacks = parse_collapsed(text)
+    assert text.startswith("# ")
+    worker_stacks = {stack: count for stack, count in stacks.items() if stack.startswith("layer-refresh-test;")}
+    assert worker_stacks, list(stacks)
+    assert all(stack.split(";")[1].startswith("_bootstrap ") for stack in worker_stacks)
+    assert any("spin_until (test_debug_profiler.py:" in stack for stack in worker_stacks)
+    assert sum(worker_stacks.values()) >= 10
+    # 請求線程本身不出現在結果中
+    assert not any("sample_stacks" in stack for stack in stacks)
+
+    with debug_profiler._profile_lock:
+        try:
+            debug_profiler.profile(0.01)
+            raise AssertionError("同時採樣應該被拒絕")
+        except debug_profiler.ProfileBusy:
+            pass
+    print(f"✅ 工作線程 {sum(worker_stacks.values())} 個樣本")
+
+
+def test_guard():
+    """沒有設置令牌時停用，令牌錯誤時返回404，參數錯誤返回400"""
+    print("\n🔒 測試訪問控制...")
+    assert debug_profiler.handle("/debug/memory", {}, token="")[0] == 404
+    assert debug_profiler.handle("/debug/memory?token=secret", {}, token="")[0] == 404
+    assert debug_profiler.handle("/debug/memory?token=wrong", {}, token="secret")[0] == 404
+    assert debug_profiler.handle("/debug/memory", {'X-Debug-Token': 'wrong'}, token="secret")[0] == 404
+    assert debug_profiler.handle("/debug/other?token=secret", {}, token="secret")[0] == 404
+    assert debug_profiler.handle("/debug/profile?seconds=x&token=secret", {}, token="secret")[0] == 400
+    assert debug_profiler.handle("/debug/memory?group=x&token=secret", {}, token="secret")[0] == 400
+    assert not tracemalloc.is_tracing()
+
+    status, content_type, text = debug_profiler.handle("/debug/profile?seconds=0.05", {'X-Debug-Token': 'secret'},
+                                                       token="secret")
+    assert status == 200 and content_type.startswith('text/plain') and text.startswith("# ")
+    print("✅ 只有正確的令牌可以訪問")
+
+
+def test_memory_growth():
+    """第一次請求開始跟踪，之後顯示佔用最多的位置和增長，停止後不再跟踪"""
+    print("\n🧠 測試內存快照...")
+    tracker = debug_profiler.MemoryTracker()
+    assert not tracemalloc.is_tracing()
+    try:
+        assert "已開始" in tracker.report()
+        assert tracemalloc.is_tracing()
+        first = tracker.report(limit=5)
+        assert "增長" not in first
+
+        retained = [bytearray(1024) for _ in range(2000)]
+        second = tracker.report(limit=5)
+        growth = second.split("增長最多", 1)[1]
+        assert "test_debug_profiler.py:" in growth.splitlines()[1], growth
+        assert len(retained) == 2000
+    finally:
+        assert "已停止" in tracker.stop()
+    assert not tracemalloc.is_tracing()
+    assert "沒有在跟踪" in tracker.stop()
+    print("✅ 增長來自測試中的分配")
+
+
+def test_server_endpoints():
+    """start_server.py 的 /debug/profile 和 /debug/memory"""
+    print("\n🌐 測試服務器端點...")
+    import start_server
+
+    original = debug_profiler.DEBUG_TOKEN
+    debug_profiler.DEBUG_TOKEN = "secret"
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), start_server.FireServiceHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="test-http").start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        assert http_pool.get(base + "/debug/profile?seconds=0.1").status == 404
+
+        start = time.monotonic()
+        response = http_pool.get(base + "/debug/profile?seconds=0.3&token=secret", timeout=10)
+        assert response.status == 200
+        assert time.monotonic() - start >= 0.3
+        stacks = parse_collapsed(response.body.decode('utf-8'))
+        assert any(stack.startswith("test-http;") and "serve_forever" in stack for stack in stacks), list(stacks)
+
+        response = http_pool.get(base + "/debug/memory", headers={'X-Debug-Token': 'secret'})
+        assert response.status == 200 and tracemalloc.is_tracing()
+        response = http_pool.get(base + "/debug/memory?limit=3", headers={'X-Debug-Token': 'secret'})
+        assert "佔用最多的 3 個位置" in response.body.decode('utf-8')
+        response = http_pool.get(base + "/debug/memory?stop=1", headers={'X-Debug-Token': 'secret'})
+        assert response.status == 200 and not tracemalloc.is_tracing()
+        print(f"✅ {len(stacks)} 個不同的調用棧")
+    finally:
+        debug_profiler.DEBUG_TOKEN = original
+        debug_profiler.memory.stop()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+測試地區核對
+使用臨時目錄中的合成地區邊界，不需要訪問 portal.csdi.gov.hk
+"""
+
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import district_check
+from district_check import COMPUTED_COLUMN, MISMATCH_COLUMN
+
+
+def square(props, min_lat, min_lng, max_lat, max_lng):
+    return {"type": "Feature", "properties": props,
+            "geometry": {"type": "Polygon", "coordinates": [[
+                [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]
+            ]]}}
+
+
+def write_boundaries(path, features):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False)
+
+
+# 兩個相鄰的地區，邊界在經度114.2
+FEATURES = [
+    square({"District_TC": "西區"}, 22.2, 114.1, 22.4, 114.2),
+    square({"NAME_TC": " 東區 "}, 22.2, 114.2, 22.4, 114.3),
+    square({}, 22.4, 114.1, 22.5, 114.3),     # 沒有名稱的要素被忽略
+]
+
+
+def test_locate_points():
+    """點在多邊形內判斷：邊界上的點取第一個地區，多邊形以外和NaN坐標為None"""
+    print("📍 測試地區判斷...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "districts.geojson")
+        write_boundaries(path, FEATURES)
+        index = district_check.load_districts(path)
+        assert list(index["names"]) == ["西區", "東區"]
+
+        lats = [22.3, 22.3, 22.3, 22.45, float('nan'), 22.2]
+        lngs = [114.15, 114.25, 114.2, 114.2, 114.15, 114.1]
+        names = district_check.locate_districts(index, lats, lngs)
+        assert list(names) == ["西區", "東區", "西區", None, None, "西區"], list(names)
+        codes = district_check.locate_codes(index, lats, lngs)
+        assert codes.dtype == np.int32 and list(codes) == [0, 1, 0, -1, -1, 0]
+        assert list(district_check.locate_codes(index, [], [])) == []
+        print("✅ 地區判斷正確")
+
+
+def test_verify_flags_mismatches():
+    """WFS的地區與邊界計算結果不同、或不在任何地區內時標記為不符"""
+    print("\n🏷️ 測試地區核對...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "districts.geojson")
+        write_boundaries(path, FEATURES)
+        index = district_check.load_districts(path)
+        df = pd.DataFrame({
+            "名稱": ["甲", "乙", "丙", "丁"],
+            "地區": ["西區", "西區", "東區 ", "東區"],
+            "緯度": ["22.3", "22.3", "22.3", "22.45"],
+            "經度": [114.15, 114.25, 114.25, 114.25],
+        })
+        df = district_check.verify_districts(df, index)
+        assert list(df[MISMATCH_COLUMN]) == [False, True, False, True]
+        assert list(df[COMPUTED_COLUMN][:3]) == ["西區", "東區", "東區"] and pd.isna(df[COMPUTED_COLUMN][3])
+        assert list(df[COMPUTED_COLUMN].cat.categories) == ["東區", "西區"]
+
+        empty = district_check.verify_districts(pd.DataFrame(), index)
+        assert COMPUTED_COLUMN in empty.columns and MISMATCH_COLUMN in empty.columns
+        print("✅ 2 個站點地區不符")
+
+
+def test_boundary_file_cache():
+    """邊界按 (路徑, 修改時間) 緩存，文件更新後重新加載；文件不存在時返回None"""
+    print("\n💾 測試邊界緩存...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "districts.geojson")
+        assert district_check.load_districts(path) is None
+        write_boundaries(path, FEATURES)
+        first = district_check.load_districts(path)
+        assert district_check.load_districts(path) is first
+
+        write_boundaries(path, FEATURES[:1])
+        later = time.time() + 10
+        os.utime(path, (later, later))
+        reloaded = district_check.load_districts(path)
+        assert reloaded is not first and list(reloaded["names"]) == ["西區"]
+        print("✅ 文件更新後重新加載")
+
+
+def test_multipolygon_and_holes():
+    """多部分地區和帶洞的多邊形（洞內的點不屬於該地區）"""
+    print("\n🏝️ 測試多部分地區...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "districts.geojson")
+        outer = [[114.0, 22.0], [114.4, 22.0], [114.4, 22.4], [114.0, 22.4], [114.0, 22.0]]
+        hole = [[114.1, 22.1], [114.3, 22.1], [114.3, 22.3], [114.1, 22.3], [114.1, 22.1]]
+        island = [[114.5, 22.5], [114.6, 22.5], [114.6, 22.6], [114.5, 22.6], [114.5, 22.5]]
+        write_boundaries(path, [
+            {"type": "Feature", "properties": {"District_TC": "離島區"},
+             "geometry": {"type": "MultiPolygon", "coordinates": [[outer, hole], [island]]}},
+        ])
+        index = district_check.load_districts(path)
+        names = district_check.locate_districts(index, [22.05, 22.2, 22.55], [114.05, 114.2, 114.55])
+        assert list(names) == ["離島區", None, "離島區"], list(names)
+        print("✅ 洞內的點不屬於地區")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
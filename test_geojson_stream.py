@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+測試增量GeoJSON解析
+用很小的讀取塊覆蓋塊邊界上的字符串、數字和多字節字符
+"""
+
+import io
+import json
+
+import geojson_stream
+
+COLLECTION = {
+    "type": "FeatureCollection",
+    "crs": {"type": "name", "properties": {"name": "EPSG:4326"}},
+    "features": [
+        {
+            "type": "Feature",
+            "id": f"FireStations.{i}",
+            "geometry": {"type": "Point", "coordinates": [114.1 + i / 1000, 22.3]},
+            "properties": {
+                "OBJECTID": i,
+                "Name_TC": f"消防局{i}",
+                "Address_TC": "香港 \"中環\" 消防街\\1號",
+                "Latitude": 22.3 + i / 12345,
+                "Longitude": 114.17,
+            },
+        }
+        for i in range(40)
+    ],
+    "numberMatched": 40,
+}
+
+
+def parse(document, **kwargs):
+    stream = io.BytesIO(json.dumps(document, ensure_ascii=False, indent=1).encode('utf-8'))
+    return list(geojson_stream.iter_features(stream, **kwargs))
+
+
+def test_matches_json_loads():
+    """任何塊大小下結果都和 json.loads 相同"""
+    print("🧩 測試塊邊界...")
+    for chunk_size in (1, 3, 7, 64, 4096):
+        assert parse(COLLECTION, chunk_size=chunk_size) == COLLECTION["features"], chunk_size
+    print("✅ 各種塊大小結果一致")
+
+
+def test_projection():
+    """只保留需要的屬性字段"""
+    print("\n✂️ 測試字段投影...")
+    features = parse(COLLECTION, fields=("OBJECTID", "Latitude", "Telephone"), chunk_size=5)
+    assert features[3] == {
+        "id": "FireStations.3",
+        "properties": {"OBJECTID": 3, "Latitude": COLLECTION["features"][3]["properties"]["Latitude"]},
+    }
+    print("✅ 幾何和其他屬性已丟棄")
+
+
+def test_empty_and_missing_features():
+    """空的 features 數組或沒有 features 成員"""
+    print("\n📭 測試空數據...")
+    assert parse({"type": "FeatureCollection", "features": []}) == []
+    assert parse({"type": "FeatureCollection"}) == []
+    assert parse({}) == []
+    print("✅ 沒有要素")
+
+
+def test_truncated_response():
+    """響應被截斷時拋出 ValueError"""
+    print("\n🪓 測試截斷響應...")
+    body = json.dumps(COLLECTION).encode('utf-8')
+    for cut in (len(body) // 2, len(body) - 1):
+        try:
+            list(geojson_stream.iter_features(io.BytesIO(body[:cut]), chunk_size=1024))
+            raise AssertionError("應該拋出 ValueError")
+        except ValueError:
+            pass
+    print("✅ 截斷響應被發現")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
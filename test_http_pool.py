@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+測試HTTP連接池
+使用本地 http.server，不需要訪問 portal.csdi.gov.hk
+"""
+
+import http.server
+import threading
+import time
+
+import http_pool
+
+
+class KeepAliveHandler(http.server.BaseHTTPRequestHandler):
+    """HTTP/1.1 長連接；路徑為 /close 時響應後由服務器關閉連接（不發送 Connection: close）"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.path == "/close":
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer:
+    def __enter__(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+        http_pool.close_all()
+
+
+def test_keep_alive_reused():
+    """同一主機的連續請求重用同一個連接，reused 遞增"""
+    print("🔁 測試連接重用...")
+    with LocalServer() as server:
+        for _ in range(3):
+            assert http_pool.get(server.url + "/data", timeout=5).json() == {"ok": True}
+        with http_pool.stream(server.url + "/data", timeout=5) as response:
+            assert response.read() == b'{"ok": true}'
+        assert http_pool.stats()[server.url] == {"created": 1, "reused": 3, "idle": 1}
+    print("✅ 4 個請求只建立 1 個連接")
+
+
+def test_server_closed_connection_retried():
+    """服務器已關閉的空閒連接被重用時，換新連接重試一次，調用方看不到錯誤"""
+    print("\n🔌 測試服務器關閉連接...")
+    with LocalServer() as server:
+        assert http_pool.get(server.url + "/close", timeout=5).status == 200
+        time.sleep(0.1)  # 等服務器關閉連接
+        assert http_pool.get(server.url + "/data", timeout=5).json() == {"ok": True}
+        pool_stats = http_pool.stats()[server.url]
+        assert pool_stats["reused"] == 1 and pool_stats["created"] == 2, pool_stats
+
+        assert http_pool.get(server.url + "/close", timeout=5).status == 200
+        time.sleep(0.1)
+        with http_pool.stream(server.url + "/data", timeout=5) as response:
+            assert response.read() == b'{"ok": true}'
+        pool_stats = http_pool.stats()[server.url]
+        assert pool_stats["reused"] == 3 and pool_stats["created"] == 3, pool_stats
+    print("✅ 失效連接自動重試")
+
+
+def test_acquire_timeout():
+    """連接池已滿時 acquire 等待 timeout 秒後拋出 PoolTimeout，歸還連接後可再取得"""
+    print("\n⏱️ 測試連接池已滿...")
+    pool = http_pool.ConnectionPool("http", "127.0.0.1", 9, maxsize=1)
+    conn, reused = pool.acquire(1)
+    assert not reused
+    start = time.monotonic()
+    try:
+        pool.acquire(0.2)
+        raise AssertionError("連接池已滿時應拋出 PoolTimeout")
+    except http_pool.PoolTimeout:
+        pass
+    assert 0.15 < time.monotonic() - start < 2
+    assert issubclass(http_pool.PoolTimeout, OSError)  # resilient_fetch 按網絡錯誤處理
+
+    pool.release(conn)
+    again, reused = pool.acquire(0.2)
+    assert again is conn and reused
+    pool.release(again, reusable=False)
+    print("✅ 超時後拋出 PoolTimeout")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
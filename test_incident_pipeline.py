@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+測試歷史事故串流聚合
+使用臨時目錄中的合成事故CSV和地區邊界，不需要訪問 portal.csdi.gov.hk
+"""
+
+import csv
+import json
+import os
+import random
+import tempfile
+
+import pandas as pd
+
+import incident_pipeline
+
+# 三個相距數公里的合成站點
+STATIONS = pd.DataFrame([
+    {"fsd_id": "F001", "name": "中環站", "district": "中西區", "lat": 22.282, "lng": 114.158},
+    {"fsd_id": "F002", "name": "旺角站", "district": "油尖旺區", "lat": 22.319, "lng": 114.169},
+    {"fsd_id": "F003", "name": "沙田站", "district": "沙田區", "lat": 22.383, "lng": 114.188},
+])
+
+
+def write_incidents(path, rng, per_station=20):
+    """每個站點附近（約300米內）生成事故，另加無效坐標和無效時間的行
+
+    返回 (按站點的 [每小時計數], 無效行數)
+    """
+    expected = [[0] * 24 for _ in range(len(STATIONS))]
+    rows = []
+    for i, station in STATIONS.iterrows():
+        for _ in range(per_station):
+            hour = rng.randrange(24)
+            rows.append((station["lat"] + rng.uniform(-0.002, 0.002), station["lng"] + rng.uniform(-0.002, 0.002),
+                         f"2023-05-{rng.randrange(1, 29):02d} {hour:02d}:{rng.randrange(60):02d}:00"))
+            expected[i][hour] += 1
+    invalid = [("", 114.16, "2023-05-01 10:00:00"), ("abc", 114.16, "2023-05-01 10:00:00"),
+               (22.3, 114.16, "不是時間")]
+    rows += invalid
+    rng.shuffle(rows)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["latitude", "longitude", "timestamp"])
+        writer.writerows(rows)
+    return expected, len(invalid)
+
+
+def square(name, min_lat, min_lng, max_lat, max_lng):
+    return {"type": "Feature", "properties": {"District_TC": name},
+            "geometry": {"type": "Polygon", "coordinates": [[
+                [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]
+            ]]}}
+
+
+def test_small_chunks_match_expected():
+    """很小的數據塊和多個工作進程：每宗事故對應到最近的站點，按小時計數"""
+    print("🧮 測試小數據塊聚合...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "incidents.csv")
+        expected, invalid = write_incidents(path, random.Random(1))
+        result = incident_pipeline.run_pipeline([path], STATIONS, chunksize=7, workers=2)
+
+        assert result["chunks"] == -(-(60 + invalid) // 7)
+        assert result["unmatched"] == invalid
+        assert result["total_incidents"] == 60
+        assert [item["hours"] for item in result["by_station"]] == expected
+        assert [item["count"] for item in result["by_station"]] == [20, 20, 20]
+        assert result["by_hour"] == [sum(column) for column in zip(*expected)]
+        assert result["by_district"] == {"中西區": 20, "油尖旺區": 20, "沙田區": 20}
+        assert result["sources"] == ["incidents.csv"]
+        print(f"✅ {result['chunks']} 個數據塊，{result['total_incidents']} 宗事故")
+
+
+def test_chunk_size_independent():
+    """數據塊大小和多個文件不影響聚合結果"""
+    print("\n📦 測試數據塊大小...")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, f"part{i}.csv") for i in range(2)]
+        for i, path in enumerate(paths):
+            write_incidents(path, random.Random(10 + i), per_station=15)
+        small = incident_pipeline.run_pipeline(paths, STATIONS, chunksize=4, workers=1)
+        large = incident_pipeline.run_pipeline(paths, STATIONS, chunksize=100_000, workers=1)
+        assert large["chunks"] == 2 and small["chunks"] > large["chunks"]
+        for key in ("total_incidents", "unmatched", "by_station", "by_district", "by_hour"):
+            assert small[key] == large[key], key
+        assert small["total_incidents"] == 90
+        print(f"✅ {small['chunks']} 塊與 {large['chunks']} 塊結果相同")
+
+
+def test_district_boundaries():
+    """指定地區邊界時按事故坐標所在地區統計，邊界外的事故不計入任何地區"""
+    print("\n🗺️ 測試按事故坐標統計地區...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "incidents.csv")
+        write_incidents(path, random.Random(2))
+        boundary = os.path.join(directory, "districts.geojson")
+        with open(boundary, "w", encoding="utf-8") as f:
+            json.dump({"type": "FeatureCollection", "features": [
+                square("南區", 22.20, 114.10, 22.30, 114.30),
+                square("北區", 22.30, 114.10, 22.35, 114.30),
+            ]}, f, ensure_ascii=False)
+        result = incident_pipeline.run_pipeline([path], STATIONS, chunksize=9, workers=1, district_path=boundary)
+        # 中環的事故在南區，旺角的在北區，沙田的在兩個多邊形以外
+        assert result["by_district"] == {"北區": 20, "南區": 20}, result["by_district"]
+        assert result["total_incidents"] == 60
+        print("✅ 地區按事故坐標統計")
+
+
+def test_result_round_trip():
+    """結果寫入gzip文件後讀回相同內容，並轉為三個表格"""
+    print("\n💾 測試結果文件...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "incidents.csv")
+        write_incidents(path, random.Random(3))
+        result = incident_pipeline.run_pipeline([path], STATIONS, chunksize=50, workers=1)
+        output = os.path.join(directory, "out", "aggregates.json.gz")
+        assert incident_pipeline.load_result(output) is None
+        incident_pipeline.write_result(result, output)
+        assert incident_pipeline.load_result(output) == result
+        assert not os.path.exists(output + ".tmp")
+
+        by_station, by_district, by_hour = incident_pipeline.result_frames(result)
+        assert list(by_station.columns) == ["消防處編號", "名稱", "地區", "事故數"]
+        assert by_station["事故數"].sum() == 60 and len(by_district) == 3
+        assert list(by_hour["時段"]) == list(range(24)) and by_hour["事故數"].sum() == 60
+        print("✅ 結果文件讀寫正確")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
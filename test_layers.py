@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+測試數據層註冊表和刷新調度器
+使用本地的模擬WFS服務器，不需要訪問 portal.csdi.gov.hk
+"""
+
+import http.server
+import json
+import socketserver
+import threading
+import time
+import urllib.parse
+
+import layers
+from layers import Layer, LayerScheduler, UPDATED, UNCHANGED, FAILED
+
+
+class LayerHandler(http.server.BaseHTTPRequestHandler):
+    """/stations 返回 names 中的站點；/down 總是503；-delay 結尾的路徑延遲0.4秒響應"""
+
+    names = ["甲", "乙"]
+    hits = {}
+    inflight = {}
+    max_inflight = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        with self.lock:
+            self.hits[path] = self.hits.get(path, 0) + 1
+            self.inflight[path] = self.inflight.get(path, 0) + 1
+            self.max_inflight[path] = max(self.max_inflight.get(path, 0), self.inflight[path])
+        try:
+            self.respond(path)
+        finally:
+            with self.lock:
+                self.inflight[path] -= 1
+
+    def respond(self, path):
+        if path == '/down':
+            return self.send_error(503)
+        if path.endswith('-delay'):
+            time.sleep(0.4)
+
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+        features = [
+            {"type": "Feature", "geometry": None,
+             "properties": {"OBJECTID": i, "Name_TC": name, "Extra": "x" * 10}}
+            for i, name in enumerate(self.names)
+        ][int(query.get('startIndex', 0)):]
+        body = json.dumps({"type": "FeatureCollection", "features": features}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    """啟動模擬服務器，返回 (server, base_url)"""
+    LayerHandler.names = ["甲", "乙"]
+    LayerHandler.hits = {}
+    LayerHandler.inflight = {}
+    LayerHandler.max_inflight = {}
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), LayerHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def make_layer(base, path='/stations', **kwargs):
+    return Layer('layers-test' + path.replace('/', '-'), '測試層', f"{base}{path}?service=wfs",
+                 {"id": "OBJECTID", "name": "Name_TC"}, **kwargs)
+
+
+def test_field_mapping():
+    """記錄只包含聲明的字段"""
+    print("🗂️ 測試字段映射...")
+    server, base = start_stub_server()
+    try:
+        assert make_layer(base).fetch() == [{"id": 0, "name": "甲"}, {"id": 1, "name": "乙"}]
+        assert set(layers.LAYERS) >= {'ambulance', 'fire_station'}
+        print("✅ 字段映射正確")
+    finally:
+        server.shutdown()
+
+
+def test_unchanged_content_skipped():
+    """內容哈希相同時不通知下游"""
+    print("\n#️⃣ 測試內容哈希...")
+    server, base = start_stub_server()
+    try:
+        updates = []
+        layer = make_layer(base)
+        scheduler = LayerScheduler({layer.name: layer}, on_update=lambda l, records: updates.append(records))
+        assert scheduler.refresh_all() == {layer.name: UPDATED}
+        assert scheduler.refresh_all() == {layer.name: UNCHANGED}
+        LayerHandler.names = ["甲", "丙"]
+        assert scheduler.refresh_all() == {layer.name: UPDATED}
+        assert [[r["name"] for r in records] for records in updates] == [["甲", "乙"], ["甲", "丙"]]
+        scheduler.stop()
+        print("✅ 只有內容變化時才通知")
+    finally:
+        server.shutdown()
+
+
+def test_failure_keeps_records():
+    """一個數據層失敗不影響其他數據層，並在重試間隔後再試"""
+    print("\n🛡️ 測試失敗隔離...")
+    server, base = start_stub_server()
+    try:
+        good, bad = make_layer(base), make_layer(base, '/down')
+        scheduler = LayerScheduler({good.name: good, bad.name: bad}, retry_seconds=0.2)
+        statuses = scheduler.refresh_all()
+        assert statuses == {good.name: UPDATED, bad.name: FAILED}
+        status = scheduler.status()
+        assert status[bad.name]['error'] and status[good.name]['error'] is None
+        assert len(scheduler.records(good.name)) == 2 and scheduler.records(bad.name) == []
+        assert status[bad.name]['next_refresh_seconds'] <= 0.2 * (1 + scheduler.jitter)
+        assert status[good.name]['next_refresh_seconds'] > 3000
+        scheduler.stop()
+
+        # on_update 失敗時記錄錯誤，重試時再次通知
+        attempts, errors = [], []
+
+        def on_update(layer, records):
+            attempts.append(records)
+            if len(attempts) == 1:
+                raise RuntimeError("計算後備站點失敗")
+
+        scheduler = LayerScheduler({good.name: good}, retry_seconds=0.2, on_update=on_update,
+                                   on_error=lambda layer, e: errors.append(str(e)))
+        assert scheduler.refresh_all() == {good.name: FAILED}
+        assert errors == ["計算後備站點失敗"] and "計算後備站點失敗" in scheduler.status()[good.name]['error']
+        assert scheduler.status()[good.name]['next_refresh_seconds'] <= 0.2 * (1 + scheduler.jitter)
+        assert scheduler.refresh_all() == {good.name: UPDATED}
+        assert len(attempts) == 2 and scheduler.status()[good.name]['error'] is None
+        scheduler.stop()
+        print("✅ 失敗的數據層稍後重試，其他數據層正常")
+    finally:
+        server.shutdown()
+
+
+def test_scheduler_respects_ttl():
+    """後台調度按TTL刷新，同一數據層不會並行刷新"""
+    print("\n⏲️ 測試TTL調度...")
+    server, base = start_stub_server()
+    try:
+        fast, slow = make_layer(base, ttl=0.3), make_layer(base, '/stations-slow', ttl=3600)
+        # 響應時間比TTL長的數據層：上一次刷新完成前不會開始下一次
+        busy = make_layer(base, '/stations-delay', ttl=0.1)
+        scheduler = LayerScheduler({fast.name: fast, slow.name: slow, busy.name: busy}, jitter=0).start()
+        time.sleep(1.6)
+        scheduler.stop()
+        assert LayerHandler.hits["/stations-slow"] == 1, LayerHandler.hits
+        assert 4 <= LayerHandler.hits['/stations'] <= 6, LayerHandler.hits
+        assert LayerHandler.hits['/stations-delay'] >= 2, LayerHandler.hits
+        assert set(LayerHandler.max_inflight.values()) == {1}, LayerHandler.max_inflight
+        print(f"✅ 短TTL數據層刷新 {LayerHandler.hits['/stations']} 次，長TTL數據層 1 次")
+    finally:
+        server.shutdown()
+
+
+def test_server_snapshot_consistent():
+    """start_server 更新數據時，並發的後備站點查詢總是讀到同一個快照中的記錄和排名"""
+    print("\n🔒 測試數據快照一致...")
+    import start_server
+
+    def stations(count):
+        return [{"fsd_id": f"F{i:03d}", "name": f"站{i}", "name_en": "", "district": "",
+                 "lat": 22.2 + i / 500, "lng": 114.0 + (i * 7 % 40) / 200} for i in range(count)]
+
+    small, large = stations(3), stations(60)
+    original, record = start_server.data_cache, start_server.snapshots.record
+    start_server.snapshots.record = lambda *args: None
+    errors, stop = [], threading.Event()
+
+    def read():
+        while not stop.is_set():
+            fsd_id = f"F{int(time.monotonic() * 1e6) % 60:03d}"
+            try:
+                result = start_server.get_backup_stations(fsd_id, limit=60)
+                if result is not None:
+                    assert result['station']['fsd_id'] == fsd_id
+                    assert all(item['fsd_id'] != fsd_id for item in result['backup_fire_stations'])
+            except Exception as e:
+                errors.append(repr(e))
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    try:
+        layer = layers.LAYERS['fire_station']
+        start_server.on_layer_update(layers.LAYERS['ambulance'], stations(5))
+        for thread in readers:
+            thread.start()
+        for i in range(200):
+            start_server.on_layer_update(layer, large if i % 2 else small)
+    finally:
+        stop.set()
+        for thread in readers:
+            thread.join()
+        start_server.snapshots.record = record
+        start_server.publish(original)
+    assert not errors, errors[:3]
+    print("✅ 200 次更新期間查詢沒有混用新舊數據")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
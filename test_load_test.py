@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+測試HTTP壓力測試工具
+使用本地回放服務器和子進程服務器，不需要訪問 portal.csdi.gov.hk
+"""
+
+import os
+import random
+import urllib.request
+
+import load_test
+from load_test import LoadResult, ServerProcess, StubUpstream
+
+
+class FixedChoice:
+    """代替 random.Random：choice 總是返回指定的值"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def choice(self, values):
+        assert self.value in values, (self.value, values)
+        return self.value
+
+
+def test_percentiles_and_summary():
+    """百分位按最近秩計算，錯誤不計入延遲"""
+    print("📐 測試統計...")
+    values = sorted(i / 1000 for i in range(1, 101))
+    assert load_test.percentile(values, 50) == 0.05
+    assert load_test.percentile(values, 99) == 0.099
+    assert load_test.percentile([0.2], 95) == 0.2
+
+    result = LoadResult()
+    result.samples = [(0.1, 'home', 200, 0.01, 100), (0.5, 'home', 200, 0.03, 100),
+                      (1.2, 'search', 'ConnectionResetError', 0.5, 0), (1.5, 'search', 503, 0.02, 10)]
+    summary = load_test.summarize(result, 2)
+    assert summary['requests'] == 4 and summary['errors'] == 2
+    assert summary['throughput_rps'] == 1.0
+    assert summary['latency_ms']['max'] == 30
+    assert summary['throughput_per_second'] == [2, 2]
+    assert summary['outcomes'] == {'200': 2, 'ConnectionResetError': 1, '503': 1}
+    print("✅ 統計正確")
+
+
+def test_query_mix():
+    """查詢組合只保留服務器支持的類型"""
+    print("\n🎲 測試查詢組合...")
+    mix = load_test.parse_mix("home=1,type=3,search=0,backup=2", ('home', 'type'))
+    assert mix == [('home', 1.0), ('type', 3.0)]
+    try:
+        load_test.parse_mix("search=1", ('home',))
+        raise AssertionError("沒有支持的類型時應該拋出異常")
+    except ValueError:
+        pass
+    rng = random.Random(0)
+    assert load_test.request_path('district', rng).startswith("/?district=")
+    assert load_test.request_path('backup', rng, ['F007']) == "/api/backup?id=F007"
+    types = {load_test.request_path('type', rng) for _ in range(50)}
+    assert types == {"/?type=fire", "/?type=ambulance", "/?type=all"}, types
+    print("✅ 組合正確")
+
+
+def test_rss_sampling():
+    """能讀取當前進程的RSS"""
+    print("\n💾 測試RSS採樣...")
+    rss = load_test.rss_bytes(os.getpid())
+    assert rss and 1024 * 1024 < rss < 64 * 1024 ** 3, rss
+    print(f"✅ {rss / 1024 / 1024:.1f} MB")
+
+
+def test_short_run():
+    """對 start_server.py 運行1秒，所有查詢類型都成功"""
+    print("\n🚀 測試短時間壓力測試...")
+    upstream = StubUpstream()
+    server = None
+    try:
+        server = ServerProcess('start_server', upstream.base_url).start()
+        mix = load_test.parse_mix(load_test.DEFAULT_MIX, load_test.SERVERS['start_server']['kinds'])
+        result = load_test.run_load("127.0.0.1", server.port, mix, 1.0, 4, server.process.pid,
+                                    upstream.fsd_ids, log=lambda message: None)
+        summary = load_test.summarize(result, 1.0)
+        assert summary['requests'] > 20 and summary['errors'] == 0, summary['outcomes']
+        assert set(summary['latency_p95_ms_by_kind']) == {'home', 'type', 'search', 'district', 'backup'}
+        assert summary['rss_mb'] and summary['rss_mb']['max'] > 1
+
+        # 每個 type 請求都返回按類型過濾的頁面
+        titles = {"fire": "消防局數據", "ambulance": "救護站數據", "all": "香港消防處服務數據"}
+        for data_type, title in titles.items():
+            path = load_test.request_path('type', FixedChoice(data_type))
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.port}{path}", timeout=10) as response:
+                page = response.read().decode('utf-8')
+            assert f"<title>{title} - " in page, (path, page[:300])
+            assert f'<option value="{data_type}" selected>' in page, path
+        print(f"✅ {summary['requests']} 個請求，{summary['throughput_rps']:.0f} 請求/秒")
+    finally:
+        if server:
+            server.stop()
+        upstream.stop()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+測試運行指標和 /metrics
+使用本地回放服務器和合成夾具，不需要訪問 portal.csdi.gov.hk
+"""
+
+import socketserver
+import tempfile
+import threading
+import time
+
+import http_pool
+import layers
+import metrics
+import snapshots
+import wfs_replay
+from metrics import Counter, Gauge, Histogram, Registry
+from refresh import RefreshCoordinator
+
+
+def parse_exposition(text):
+    """{樣本名和標籤: 值}"""
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_exposition_format():
+    """直方圖桶是累計的，標籤值被轉義"""
+    print("📄 測試輸出格式...")
+    registry = Registry()
+    histogram = Histogram("t_seconds", "測試", ("route",), buckets=(0.1, 1.0), registry=registry)
+    counter = Counter("t_requests_total", "測試", ("path",), registry=registry)
+    Gauge("t_age", "測試", callback=lambda: 42.5, registry=registry)
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, route="/")
+    counter.inc(path='a"b')
+
+    text = registry.render()
+    samples = parse_exposition(text)
+    assert "# TYPE t_seconds histogram" in text
+    assert "# TYPE t_requests_total counter" in text
+    assert samples['t_seconds_bucket{route="/",le="0.1"}'] == 1
+    assert samples['t_seconds_bucket{route="/",le="1"}'] == 3
+    assert samples['t_seconds_bucket{route="/",le="+Inf"}'] == 4
+    assert samples['t_seconds_count{route="/"}'] == 4
+    assert abs(samples['t_seconds_sum{route="/"}'] - 4.05) < 1e-9
+    assert samples['t_requests_total{path="a\\"b"}'] == 1
+    assert samples['t_age'] == 42.5
+    try:
+        counter.inc(other="x")
+        raise AssertionError("錯誤的標籤應該拋出異常")
+    except ValueError:
+        pass
+    try:
+        Counter("t_errors", "測試", registry=registry)
+        raise AssertionError("沒有 _total 後綴的計數器名稱應該拋出異常")
+    except ValueError:
+        pass
+    print("✅ 格式正確")
+
+
+def test_sharded_counts_exact():
+    """多線程並發記錄時總數準確"""
+    print("\n🧵 測試並發記錄...")
+    registry = Registry()
+    counter = Counter("c_test_total", "測試", ("kind",), registry=registry, shards=4)
+    histogram = Histogram("h_test", "測試", registry=registry, shards=4)
+
+    def work():
+        for _ in range(5000):
+            counter.inc(kind="x")
+            histogram.observe(0.01)
+
+    threads = [threading.Thread(target=work) for _ in range(16)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    assert counter.value(kind="x") == 80000
+    assert histogram.count() == 80000
+    print(f"✅ 160000 次記錄，{elapsed:.2f} 秒")
+
+
+def test_snapshot_cache_counters():
+    """刷新協調器的快照命中、過期和未命中都被計數"""
+    print("\n🎯 測試緩存計數...")
+    before = {result: metrics.CACHE_REQUESTS.value(cache='snapshot', result=result)
+              for result in ('hit', 'stale', 'miss')}
+    coordinator = RefreshCoordinator(cooldown_seconds=0)
+    coordinator.get('metrics-test', lambda: 1, ttl=60)
+    coordinator.get('metrics-test', lambda: 1, ttl=60)
+    coordinator.get('metrics-test', lambda: 1, ttl=0)
+    after = {result: metrics.CACHE_REQUESTS.value(cache='snapshot', result=result)
+             for result in before}
+    assert {result: after[result] - before[result] for result in before} == {'hit': 1, 'stale': 1, 'miss': 1}
+    print("✅ 命中、過期、未命中各1次")
+
+
+def test_metrics_endpoint():
+    """start_server.py 的 /metrics 包含請求、頁面生成、上游獲取、解析和數據時間"""
+    print("\n📊 測試 /metrics...")
+    import start_server
+
+    with tempfile.TemporaryDirectory() as directory:
+        for layer in layers.LAYERS.values():
+            wfs_replay.save_fixture(directory, layer, wfs_replay.synthetic_features(layer, 30),
+                                    source_url="synthetic")
+        upstream = wfs_replay.start_replay_server(directory)
+        original = layers.WFS_UPSTREAM, snapshots.store.directory
+        layers.WFS_UPSTREAM, snapshots.store.directory = upstream.base_url, directory
+        server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), start_server.FireServiceHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            start_server.scheduler.refresh_all()
+            base = f"http://127.0.0.1:{server.server_address[1]}"
+            assert http_pool.get(base + "/?type=fire").status == 200
+            assert http_pool.get(base + "/no-such-page").status == 404
+
+            response = http_pool.get(base + "/metrics")
+            assert response.status == 200
+            assert {k.lower(): v for k, v in response.headers.items()}['content-type'] == metrics.CONTENT_TYPE
+            samples = parse_exposition(response.body.decode('utf-8'))
+            assert samples['fsd_http_request_duration_seconds_count{route="/",method="GET",status="200"}'] >= 1
+            assert samples['fsd_http_request_duration_seconds_count{route="other",method="GET",status="404"}'] >= 1
+            assert samples['fsd_render_duration_seconds_count{page="index"}'] >= 1
+            for name in ('ambulance', 'fire_station'):
+                assert samples[f'fsd_upstream_response_bytes_total{{layer="{name}"}}'] > 1000
+                assert samples[f'fsd_upstream_fetch_duration_seconds_count{{layer="{name}"}}'] >= 1
+                assert samples[f'fsd_parse_duration_seconds_count{{layer="{name}"}}'] >= 1
+                assert 0 <= samples[f'fsd_data_age_seconds{{layer="{name}"}}'] < 60
+            print(f"✅ {len(samples)} 個樣本")
+        finally:
+            layers.WFS_UPSTREAM, snapshots.store.directory = original
+            server.shutdown()
+            upstream.shutdown()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+測試多進程服務器
+使用本地回放服務器和合成夾具，不需要訪問 portal.csdi.gov.hk
+"""
+
+import os
+import signal
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import load_test
+import prefork_server
+import start_server
+
+
+def sample_records(count, prefix="F"):
+    return [{'fsd_id': f"{prefix}{i:03d}", 'name': f"合成站{i}", 'lat': 22.3 + i * 0.001, 'lng': 114.1}
+            for i in range(count)]
+
+
+def worker_pids(parent):
+    """parent 的子進程（讀取 /proc）"""
+    children = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == parent:
+                        children.append(int(entry))
+            except (OSError, ValueError, IndexError):
+                continue
+    return sorted(children)
+
+
+def test_snapshot_roundtrip():
+    """快照包含記錄和後備站點數組，讀取時數組直接引用映射的內存"""
+    print("🗺️ 測試快照文件...")
+    with tempfile.TemporaryDirectory() as directory:
+        records = {'ambulance': sample_records(5, "A"), 'fire_station': sample_records(7)}
+        backups = {'fire_station': (np.arange(21, dtype=np.int32).reshape(7, 3),
+                                    np.linspace(0, 1, 21, dtype=np.float32).reshape(7, 3)),
+                   'ambulance': (np.zeros((7, 3), dtype=np.int32), np.ones((7, 3), dtype=np.float32))}
+        path = prefork_server.write_snapshot(directory, 3, records, backups)
+        generation, loaded, loaded_backups = prefork_server.read_snapshot(path)
+
+        assert generation == 3 and loaded == records
+        for layer, (indices, distances) in backups.items():
+            mapped_indices, mapped_distances = loaded_backups[layer]
+            assert np.array_equal(mapped_indices, indices) and np.array_equal(mapped_distances, distances)
+            assert not mapped_indices.flags.owndata and not mapped_indices.flags.writeable
+            assert mapped_indices.ctypes.data % prefork_server.ALIGN == 0
+        assert not os.path.exists(path + ".tmp")
+        print(f"✅ {os.path.getsize(path)} 字節")
+
+
+def test_generation_pickup():
+    """只有狀態變化時不重新加載快照；新代數加載新記錄；落後的工作進程跳過已刪除的快照"""
+    print("\n🔄 測試快照代數...")
+    original = start_server.data_cache
+    with tempfile.TemporaryDirectory() as directory:
+        publisher = prefork_server.Publisher(directory)
+        view = prefork_server.SnapshotView(directory)
+        lagging = prefork_server.SnapshotView(directory)
+        try:
+            assert view.refresh() and view.generation == 0
+            assert not view.refresh()
+
+            status = {'fire_station': {'label': '消防局', 'records': 7, 'checked_at': 1.0, 'error': None,
+                                       'next_refresh_at': time.time() + 60}}
+            publisher.publish_data({'ambulance': [], 'fire_station': sample_records(7)}, None, status)
+            assert view.refresh() and view.generation == 1
+            assert len(start_server.data_cache.fire_station) == 7
+            assert start_server.data_cache.fire_station_rows['F006'] == 6
+            assert 55 < view.status()['fire_station']['next_refresh_seconds'] <= 60
+            assert 'next_refresh_at' not in view.status()['fire_station']
+
+            cached = start_server.data_cache.fire_station
+            status['fire_station']['error'] = "上游超時"
+            publisher.publish_status(status)
+            assert view.refresh() and view.generation == 1
+            assert start_server.data_cache.fire_station is cached
+            assert view.status()['fire_station']['error'] == "上游超時"
+
+            for count in range(8, 8 + prefork_server.KEEP_SNAPSHOTS + 1):
+                publisher.publish_data({'ambulance': [], 'fire_station': sample_records(count)}, None, status)
+            assert not os.path.exists(prefork_server.snapshot_path(directory, 2))
+            assert lagging.refresh() and lagging.generation == publisher.generation
+            assert len(start_server.data_cache.fire_station) == 8 + prefork_server.KEEP_SNAPSHOTS
+            print(f"✅ 代數 {publisher.generation}，保留 {len(os.listdir(directory)) - 1} 個快照文件")
+        finally:
+            publisher.control.close()
+            start_server.publish(original)
+
+
+def test_control_block_consistent():
+    """監督進程寫入時，工作進程讀到的狀態總是完整的"""
+    print("\n🔒 測試控制塊...")
+    with tempfile.TemporaryDirectory() as directory:
+        publisher = prefork_server.Publisher(directory)
+        reader = prefork_server.ControlBlock(os.path.join(directory, prefork_server.CONTROL_NAME))
+        stop = threading.Event()
+
+        def write():
+            n = 0
+            while not stop.is_set():
+                n += 1
+                publisher.publish_status({'n': n, 'pad': "x" * (n % 997)})
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        reads = 0
+        try:
+            deadline = time.monotonic() + 1.0
+            while time.monotonic() < deadline:
+                seq, _, statuses = reader.read()
+                assert seq % 2 == 0
+                if statuses:
+                    assert len(statuses['pad']) == statuses['n'] % 997
+                reads += 1
+        finally:
+            stop.set()
+            writer.join()
+            reader.close()
+            publisher.control.close()
+        print(f"✅ {reads} 次讀取都完整")
+
+
+def test_workers_share_snapshot():
+    """多個工作進程共用監聽套接字和快照，不請求上游；退出的工作進程被重新啟動"""
+    print("\n👷 測試工作進程...")
+    upstream = load_test.StubUpstream(stations=40)
+    server = load_test.ServerProcess('prefork_server', upstream.base_url, env={'PREFORK_WORKERS': '3'})
+    try:
+        server.start()
+        assert wait_until(lambda: len(worker_pids(server.process.pid)) == 3)
+        fetches = upstream.server.requests
+        for index in range(30):
+            path = f"/api/backup?id={upstream.fsd_ids[index % 40]}" if index % 3 else "/?type=fire"
+            status, body = load_test.http_get("127.0.0.1", server.port, path)
+            assert status == 200, (path, status)
+        assert upstream.server.requests == fetches
+
+        victim = worker_pids(server.process.pid)[0]
+        os.kill(victim, signal.SIGKILL)
+        assert wait_until(lambda: len(worker_pids(server.process.pid)) == 3
+                          and victim not in worker_pids(server.process.pid))
+        assert load_test.http_get("127.0.0.1", server.port, "/")[0] == 200
+        assert wait_until(lambda: "已退出" in server.log_tail())
+        print(f"✅ 3 個工作進程，上游請求 {fetches} 次")
+    finally:
+        server.stop()
+        upstream.stop()
+
+
+def wait_until(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+測試HK1980方格網投影
+只在本地轉換坐標，不需要網絡
+"""
+
+import math
+import threading
+
+import numpy as np
+import pandas as pd
+
+import projection
+from projection import EASTING_COLUMN, NORTHING_COLUMN, add_grid_columns, to_hk1980
+
+# HK1980方格網原點：HK80經緯度 22°18'43.68"N 114°10'42.80"E，東距 836694.05，北距 819069.80
+ORIGIN_LAT = 22 + 18 / 60 + 43.68 / 3600
+ORIGIN_LNG = 114 + 10 / 60 + 42.80 / 3600
+ORIGIN_EASTING = 836694.05
+ORIGIN_NORTHING = 819069.80
+
+
+def test_known_point():
+    """方格網原點：WGS84 約等於 HK80 緯度減5.5秒、經度加8.8秒（地政總署的近似換算，誤差約1米）"""
+    print("📍 測試已知點...")
+    easting, northing = to_hk1980([ORIGIN_LAT - 5.5 / 3600], [ORIGIN_LNG + 8.8 / 3600])
+    error = math.hypot(easting[0] - ORIGIN_EASTING, northing[0] - ORIGIN_NORTHING)
+    assert error < 2.0, (easting[0], northing[0])
+    print(f"✅ 原點誤差 {error:.2f} 米")
+
+
+def test_invalid_coordinates():
+    """缺失或無效的坐標返回NaN，不影響其他點；批量結果與逐點轉換相同"""
+    print("\n❓ 測試無效坐標...")
+    lats = [22.3193, float('nan'), None, 22.45, 22.28]
+    lngs = [114.1694, 114.1, 114.2, float('inf'), 114.16]
+    easting, northing = to_hk1980(lats, lngs)
+    assert easting.dtype == np.float64 and northing.dtype == np.float64
+    assert np.isnan(easting[1:4]).all() and np.isnan(northing[1:4]).all()
+    for i in (0, 4):
+        single = to_hk1980([lats[i]], [lngs[i]])
+        assert single[0][0] == easting[i] and single[1][0] == northing[i]
+    assert 800_000 < easting[0] < 870_000 and 800_000 < northing[0] < 850_000
+    print("✅ 無效坐標為NaN")
+
+
+def test_grid_columns():
+    """東距/北距插在經度後面；方格網距離與大圓距離相差不到0.5%"""
+    print("\n📐 測試DataFrame投影列...")
+    df = pd.DataFrame({"名稱": ["甲", "乙"], "緯度": ["22.30", "22.31"], "經度": [114.17, 114.18], "地區": ["", ""]})
+    df = add_grid_columns(df)
+    assert list(df.columns) == ["名稱", "緯度", "經度", EASTING_COLUMN, NORTHING_COLUMN, "地區"]
+
+    grid = math.hypot(df[EASTING_COLUMN][1] - df[EASTING_COLUMN][0], df[NORTHING_COLUMN][1] - df[NORTHING_COLUMN][0])
+    lat1, lng1, lat2, lng2 = map(math.radians, (22.30, 114.17, 22.31, 114.18))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    great_circle = 2 * 6_371_008.8 * math.asin(math.sqrt(a))
+    assert abs(grid - great_circle) / great_circle < 0.005, (grid, great_circle)
+
+    empty = add_grid_columns(pd.DataFrame({"緯度": [], "經度": []}))
+    assert EASTING_COLUMN in empty.columns and NORTHING_COLUMN in empty.columns and empty.empty
+    print(f"✅ 兩站相距 {grid:.0f} 米（大圓距離 {great_circle:.0f} 米）")
+
+
+def test_shared_transformer_threads():
+    """整個進程共用一個轉換器，多線程同時轉換結果一致"""
+    print("\n🧵 測試共用轉換器...")
+    assert projection.get_transformer() is projection.get_transformer()
+    lats = np.linspace(22.2, 22.5, 500)
+    lngs = np.linspace(113.9, 114.3, 500)
+    expected = to_hk1980(lats, lngs)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(to_hk1980(lats, lngs))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 8
+    assert all(np.array_equal(r[0], expected[0]) and np.array_equal(r[1], expected[1]) for r in results)
+    print("✅ 8 個線程結果一致")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
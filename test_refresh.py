@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+測試刷新協調器
+加載函數用本地函數模擬上游，不需要網絡
+"""
+
+import threading
+import time
+
+from refresh import RefreshCoordinator, REFRESHED, JOINED, COOLDOWN, FAILED
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_concurrent_get_single_flight():
+    """沒有快照時多個會話同時讀取，只調用一次加載函數，所有會話拿到同一個結果"""
+    print("🛬 測試並發讀取...")
+    coordinator = RefreshCoordinator(cooldown_seconds=0)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return ["合成站"]
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(coordinator.get("fire_station", loader)))
+               for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1, calls
+    assert len(results) == 10 and all(result is results[0] for result in results)
+    assert coordinator.get("fire_station", loader, ttl=60) == ["合成站"] and len(calls) == 1
+    print("✅ 10 個並發讀取只請求上游一次")
+
+
+def test_failed_refresh_keeps_snapshot():
+    """刷新失敗時保留舊快照；沒有舊快照時拋出異常"""
+    print("\n🧯 測試刷新失敗...")
+    coordinator = RefreshCoordinator(cooldown_seconds=0)
+    coordinator.get("ambulance", lambda: ["舊數據"])
+    fetched_at = coordinator.fetched_at("ambulance")
+
+    def failing():
+        raise OSError("上游超時")
+
+    assert coordinator.refresh("ambulance", failing) == FAILED
+    assert coordinator.get("ambulance", failing, ttl=0, stale_while_revalidate=False) == ["舊數據"]
+    assert coordinator.fetched_at("ambulance") == fetched_at
+    assert not coordinator.is_refreshing("ambulance")
+
+    try:
+        coordinator.get("empty", failing)
+        raise AssertionError("沒有舊快照時應拋出異常")
+    except OSError:
+        pass
+    assert coordinator.refresh("ambulance", lambda: ["新數據"]) == REFRESHED
+    assert coordinator.get("ambulance", failing, ttl=60) == ["新數據"]
+    print("✅ 失敗後仍返回舊快照")
+
+
+def test_stale_read_revalidates_once():
+    """快照過期時立即返回舊數據，多次讀取只觸發一次後台刷新，之後讀到新數據"""
+    print("\n♻️ 測試過期後台刷新...")
+    coordinator = RefreshCoordinator(cooldown_seconds=0)
+    coordinator.get("fire_station", lambda: ["舊數據"])
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return ["新數據"]
+
+    start = time.monotonic()
+    stale = [coordinator.get("fire_station", loader, ttl=0) for _ in range(5)]
+    assert time.monotonic() - start < 1, "過期讀取不應等待上游"
+    assert stale == [["舊數據"]] * 5
+    assert wait_for(lambda: calls) and coordinator.is_refreshing("fire_station")
+    release.set()
+    assert wait_for(lambda: not coordinator.is_refreshing("fire_station"))
+    assert len(calls) == 1, calls
+    assert coordinator.get("fire_station", loader, ttl=60) == ["新數據"]
+    print("✅ 5 次過期讀取只觸發一次後台刷新")
+
+
+def test_manual_refresh_cooldown():
+    """刷新進行中時手動刷新合併到同一個請求；冷卻時間內不再請求上游"""
+    print("\n⏳ 測試手動刷新冷卻...")
+    coordinator = RefreshCoordinator(cooldown_seconds=60)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return ["數據"]
+
+    results = coordinator.refresh_many({"ambulance": loader, "fire_station": loader})
+    assert results == {"ambulance": REFRESHED, "fire_station": REFRESHED}
+
+    statuses = []
+    threads = [threading.Thread(target=lambda: statuses.append(coordinator.refresh("other", loader)))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+    assert sorted(statuses) == sorted([REFRESHED, JOINED]), statuses
+    assert coordinator.refresh("ambulance", loader) == COOLDOWN
+    assert len(calls) == 3, calls
+    print("✅ 並發刷新合併，冷卻中不請求上游")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
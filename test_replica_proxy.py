@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+測試多副本反向代理和共享數據緩存
+副本用本地的標準庫HTTP服務器代替Streamlit，不需要訪問 portal.csdi.gov.hk
+"""
+
+import asyncio
+import http.client
+import http.server
+import socket
+import tempfile
+import threading
+import time
+
+import cache_backend
+import load_test
+import replica_proxy
+
+
+class NamedHandler(http.server.BaseHTTPRequestHandler):
+    """響應內容為副本名稱"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.headers.get("Upgrade", "").lower() == "websocket":
+            # 模擬 WebSocket：101 之後回顯收到的數據
+            self.send_response(101)
+            self.send_header("Upgrade", "websocket")
+            self.send_header("Connection", "Upgrade")
+            self.end_headers()
+            self.wfile.flush()
+            while True:
+                data = self.connection.recv(4096)
+                if not data:
+                    break
+                self.connection.sendall(self.server.name.encode() + b":" + data)
+            self.close_connection = True
+            return
+        body = self.server.name.encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_replica(name):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), NamedHandler)
+    server.daemon_threads = True
+    server.name = name
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class BackgroundProxy:
+    """在後台線程的事件循環中運行 ReplicaProxy"""
+
+    def __init__(self, ports, **options):
+        self.loop = asyncio.new_event_loop()
+        self.proxy = replica_proxy.ReplicaProxy([("127.0.0.1", p) for p in ports], host="127.0.0.1", port=0,
+                                                **options)
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.proxy.start())
+            ready.set()
+            self.loop.run_until_complete(self.proxy.serve_forever())
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        assert ready.wait(10), "代理沒有啟動"
+        self.port = self.proxy.port
+
+    def get(self, path="/", cookie=None):
+        """新連接上的一個請求，返回 (內容, Set-Cookie)"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+        try:
+            conn.request("GET", path, headers={"Cookie": cookie} if cookie else {})
+            response = conn.getresponse()
+            return response.read().decode(), response.getheader("Set-Cookie")
+        finally:
+            conn.close()
+
+    def stop(self):
+        self.proxy.stop()
+        self.thread.join(10)
+        self.loop.close()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_sticky_sessions():
+    """新會話分配到各個副本並帶 Set-Cookie；帶 Cookie 的請求總是到同一個副本"""
+    print("🍪 測試會話保持...")
+    replicas = [start_replica(f"r{i}") for i in range(3)]
+    background = BackgroundProxy([r.server_address[1] for r in replicas])
+    try:
+        first = [background.get() for _ in range(6)]
+        assert {body for body, _ in first} == {"r0", "r1", "r2"}, first
+        for body, set_cookie in first:
+            assert set_cookie.startswith(f"fsd_replica={body[1]};"), set_cookie
+
+        for _ in range(5):
+            assert background.get(cookie="theme=light; fsd_replica=2") == ("r2", None)
+
+        # 保持連接的後續請求經過同一條隧道
+        conn = http.client.HTTPConnection("127.0.0.1", background.port, timeout=5)
+        conn.request("GET", "/")
+        response = conn.getresponse()
+        name = response.read().decode()
+        assert response.getheader("Set-Cookie")
+        for _ in range(3):
+            conn.request("GET", "/")
+            response = conn.getresponse()
+            assert response.read().decode() == name and response.getheader("Set-Cookie") is None
+        conn.close()
+        assert wait_for(lambda: all(r['connections'] == 0 for r in background.proxy.status()))
+        print(f"✅ 會話分配: {[r['sessions'] for r in background.proxy.status()]}")
+    finally:
+        background.stop()
+        for replica in replicas:
+            replica.shutdown()
+
+
+def test_websocket_tunnel():
+    """WebSocket 升級後雙向轉發數據，連接關閉後釋放副本的連接計數"""
+    print("\n🔌 測試 WebSocket 隧道...")
+    replicas = [start_replica(f"r{i}") for i in range(2)]
+    background = BackgroundProxy([r.server_address[1] for r in replicas])
+    try:
+        with socket.create_connection(("127.0.0.1", background.port), timeout=5) as sock:
+            stream = sock.makefile("rb")
+            sock.sendall(b"GET /_stcore/stream HTTP/1.1\r\nHost: x\r\nUpgrade: websocket\r\n"
+                         b"Connection: Upgrade\r\nCookie: fsd_replica=1\r\n\r\n")
+            status = stream.readline()
+            assert b" 101 " in status, status
+            headers = b"".join(iter(stream.readline, b"\r\n"))
+            assert b"set-cookie" not in headers.lower()
+            for message in (b"ping", b"rerun"):
+                sock.sendall(message)
+                assert sock.recv(100) == b"r1:" + message
+            assert [r['connections'] for r in background.proxy.status()] == [0, 1]
+            stream.close()
+        assert wait_for(lambda: background.proxy.status()[1]['connections'] == 0)
+        assert wait_for(lambda: not background.proxy.tunnels)
+        print("✅ 升級後雙向轉發")
+    finally:
+        background.stop()
+        for replica in replicas:
+            replica.shutdown()
+
+
+def test_failover():
+    """無法連接的副本暫時停用，會話轉到其他副本；全部不可用時返回502"""
+    print("\n🚑 測試副本故障轉移...")
+    live = start_replica("live")
+    dead_port = load_test.free_port()
+    background = BackgroundProxy([dead_port, live.server_address[1]], retry_seconds=60)
+    try:
+        body, set_cookie = background.get(cookie="fsd_replica=0")
+        assert body == "live" and set_cookie.startswith("fsd_replica=1;")
+        status = background.proxy.status()
+        assert not status[0]['available'] and status[1]['available']
+        assert all(background.get()[0] == "live" for _ in range(3))
+
+        live.shutdown()
+        live.server_close()
+        conn = http.client.HTTPConnection("127.0.0.1", background.port, timeout=10)
+        conn.request("GET", "/")
+        assert conn.getresponse().status == 502
+        conn.close()
+        print("✅ 停用的副本被跳過")
+    finally:
+        background.stop()
+
+
+def test_disk_cache_single_load():
+    """多個進程（這裡用各自打開文件的線程模擬）同時請求過期數據時只加載一次"""
+    print("\n💾 測試共享數據緩存...")
+    with tempfile.TemporaryDirectory() as directory:
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.3)
+            return [{'fsd_id': 'F001', 'name': '合成站'}]
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            cache_backend.DiskCache(directory).get_or_load("layer:fire_station", loader, ttl=60).value))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(calls) == 1 and len(results) == 8
+        assert all(result == [{'fsd_id': 'F001', 'name': '合成站'}] for result in results)
+
+        cache = cache_backend.DiskCache(directory)
+        stored_at = cache.get("layer:fire_station").stored_at
+        assert cache.get("layer:fire_station", max_age=0) is None
+        cache.get_or_load("layer:fire_station", loader, ttl=0)
+        assert len(calls) == 2 and cache.get("layer:fire_station").stored_at > stored_at
+
+        def failing():
+            raise OSError("上游超時")
+
+        try:
+            cache.get_or_load("layer:ambulance", failing, ttl=60)
+            raise AssertionError("加載失敗時應拋出異常")
+        except OSError:
+            pass
+        assert cache.get("layer:ambulance") is None
+        print("✅ 8 個並發請求只加載一次")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
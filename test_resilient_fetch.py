@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+測試容錯數據獲取
+使用本地的不穩定模擬WFS服務器，不需要訪問 portal.csdi.gov.hk
+"""
+
+import http.server
+import json
+import socketserver
+import threading
+import time
+
+import resilient_fetch
+from resilient_fetch import ResilientFetcher, FetchError, CircuitOpenError, CLOSED, OPEN
+
+FEATURES = {"type": "FeatureCollection", "features": [{"properties": {"Name_TC": "測試站"}}]}
+
+
+class FlakyHandler(http.server.BaseHTTPRequestHandler):
+    """按路徑模擬不同的故障：/fail-N 前N次返回503，/slow 第一次很慢，/down 總是503，/missing 返回404"""
+
+    counters = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            count = self.counters.get(self.path, 0) + 1
+            self.counters[self.path] = count
+
+        if self.path.startswith('/fail-') and count <= int(self.path.split('-')[1]):
+            return self.send_error(503)
+        if self.path == '/down':
+            return self.send_error(503)
+        if self.path == '/missing':
+            return self.send_error(404)
+        if self.path == '/slow' and count == 1:
+            time.sleep(1.5)
+
+        body = json.dumps(FEATURES).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    """啟動模擬服務器，返回 (server, base_url)"""
+    FlakyHandler.counters = {}
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FlakyHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def make_fetcher(**kwargs):
+    """測試用獲取器：很短的退避時間"""
+    options = dict(max_retries=3, timeout=5, backoff_base=0.01, backoff_max=0.05, hedge=False)
+    options.update(kwargs)
+    return ResilientFetcher(**options)
+
+
+def test_retry_recovers():
+    """前兩次503，第三次成功"""
+    print("🔁 測試重試...")
+    server, base = start_stub_server()
+    try:
+        data = make_fetcher().fetch_json(f"{base}/fail-2", layer='ambulance')
+        assert data == FEATURES
+        assert FlakyHandler.counters['/fail-2'] == 3
+        print("✅ 重試後成功")
+    finally:
+        server.shutdown()
+
+
+def test_client_error_not_retried():
+    """404不重試"""
+    print("\n🚫 測試不可重試錯誤...")
+    server, base = start_stub_server()
+    try:
+        try:
+            make_fetcher().fetch_json(f"{base}/missing", layer='ambulance')
+            raise AssertionError("應該拋出 FetchError")
+        except FetchError:
+            pass
+        assert FlakyHandler.counters['/missing'] == 1
+        print("✅ 404只請求一次")
+    finally:
+        server.shutdown()
+
+
+def test_circuit_breaker_isolated_per_layer():
+    """一個數據層熔斷後快速失敗，其他數據層不受影響"""
+    print("\n⚡ 測試熔斷器...")
+    server, base = start_stub_server()
+    try:
+        fetcher = make_fetcher(max_retries=0)
+        for _ in range(resilient_fetch.BREAKER_FAILURE_THRESHOLD):
+            try:
+                fetcher.fetch_json(f"{base}/down", layer='ambulance')
+            except FetchError:
+                pass
+        assert fetcher.breaker('ambulance').state == OPEN
+
+        requests_before = FlakyHandler.counters['/down']
+        try:
+            fetcher.fetch_json(f"{base}/down", layer='ambulance')
+            raise AssertionError("應該拋出 CircuitOpenError")
+        except CircuitOpenError:
+            pass
+        assert FlakyHandler.counters['/down'] == requests_before
+
+        assert fetcher.fetch_json(f"{base}/ok", layer='fire_station') == FEATURES
+        assert fetcher.breaker('fire_station').state == CLOSED
+        print("✅ 救護站熔斷，消防局正常")
+    finally:
+        server.shutdown()
+
+
+def test_half_open_recovers():
+    """熔斷時間過後放行一個試探請求，成功則關閉"""
+    print("\n🩹 測試半開恢復...")
+    server, base = start_stub_server()
+    try:
+        fetcher = make_fetcher(max_retries=0)
+        breaker = fetcher.breaker('ambulance')
+        breaker.reset_seconds = 0.2
+        for _ in range(breaker.failure_threshold):
+            try:
+                fetcher.fetch_json(f"{base}/down", layer='ambulance')
+            except FetchError:
+                pass
+        time.sleep(0.3)
+
+        # 試探請求的解析函數拋出意外異常時重新打開，熔斷時間過後再放行下一個試探請求
+        def broken(stream):
+            raise RuntimeError("解析程序錯誤")
+
+        try:
+            fetcher.fetch_stream(f"{base}/ok", 'ambulance', broken)
+            raise AssertionError("應該拋出 RuntimeError")
+        except RuntimeError:
+            pass
+        assert breaker.state == OPEN
+        time.sleep(0.3)
+        assert fetcher.fetch_json(f"{base}/ok", layer='ambulance') == FEATURES
+        assert breaker.state == CLOSED
+        print("✅ 熔斷器已恢復")
+    finally:
+        server.shutdown()
+
+
+def test_hedged_request():
+    """第一個請求超過p95時發出對沖請求，取先返回的結果"""
+    print("\n🏁 測試對沖請求...")
+    server, base = start_stub_server()
+    try:
+        fetcher = make_fetcher(hedge=True)
+        tracker = fetcher.latency('fire_station')
+        for _ in range(resilient_fetch.HEDGE_MIN_SAMPLES):
+            tracker.record(0.05)
+
+        start = time.monotonic()
+        assert fetcher.fetch_json(f"{base}/slow", layer='fire_station') == FEATURES
+        elapsed = time.monotonic() - start
+        assert elapsed < 1.0, f"對沖請求應該更快返回 ({elapsed:.2f}秒)"
+        assert FlakyHandler.counters['/slow'] == 2
+        print(f"✅ 對沖請求在 {elapsed:.2f}秒 內返回")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+測試歷史快照存儲
+只使用臨時目錄，不需要網絡
+"""
+
+import copy
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+from snapshots import SnapshotStore, ADDED, REMOVED, MOVED, RENAMED, UPDATED
+
+
+def stations(n=50):
+    return [
+        {"id": i, "fsd_id": f"F{i:03d}", "name": f"站{i}", "district": "沙田區",
+         "phone": "2000 0000", "lat": 22.3 + i / 1000, "lng": 114.1 + i / 1000}
+        for i in range(n)
+    ]
+
+
+def random_edit(records, rng, serial):
+    """隨機新增、刪除、移動或改名一個站點"""
+    records = copy.deepcopy(records)
+    action = rng.choice(["add", "remove", "move", "rename", "phone"])
+    if action == "add" or not records:
+        records.append({"id": 1000 + serial, "fsd_id": f"N{serial:03d}", "name": f"新站{serial}",
+                        "district": "北區", "phone": "", "lat": 22.5, "lng": 114.1})
+    elif action == "remove":
+        records.pop(rng.randrange(len(records)))
+    elif action == "move":
+        records[rng.randrange(len(records))]["lat"] += 0.001
+    elif action == "rename":
+        records[rng.randrange(len(records))]["name"] += "（新）"
+    else:
+        records[rng.randrange(len(records))]["phone"] = f"2{serial:07d}"
+    return records
+
+
+def by_key(records):
+    return sorted(records, key=lambda record: record["fsd_id"])
+
+
+def test_time_travel():
+    """任意時間的狀態與當時寫入的記錄相同（跨越多個檢查點）"""
+    print("🕰️ 測試時間回溯...")
+    rng = random.Random(3)
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(directory, checkpoint_every=5)
+        records, history = stations(), []
+        for hour in range(40):
+            records = random_edit(records, rng, hour)
+            store.record("history-test", records, at=hour * 3600)
+            history.append((hour * 3600, records))
+
+        assert store.stats("history-test")["checkpoints"] == 8
+        for at, expected in history:
+            assert by_key(store.state_at("history-test", at + 1800)) == by_key(expected), at
+        assert store.state_at("history-test", -1) == []
+
+        # 新實例（例如另一個進程）從文件重建同樣的狀態
+        reopened = SnapshotStore(directory, checkpoint_every=5)
+        assert by_key(reopened.state_at("history-test", 10 ** 10)) == by_key(records)
+        print(f"✅ {len(history)} 個快照都能還原")
+
+
+def test_unchanged_not_stored():
+    """內容沒有變化時不寫入；差異比完整快照小得多"""
+    print("\n📦 測試存儲大小...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(directory, checkpoint_every=1000)
+        records = stations(200)
+        assert store.record("size-test", records, at=0) is not None
+        full = os.path.getsize(os.path.join(directory, "size-test.jsonl"))
+        for hour in range(1, 100):
+            assert store.record("size-test", list(reversed(records)), at=hour) is None
+        records[0]["phone"] = "2999 9999"
+        store.record("size-test", records, at=100)
+        delta = os.path.getsize(os.path.join(directory, "size-test.jsonl")) - full
+        assert store.stats("size-test")["snapshots"] == 2
+        assert delta < full / 50, (delta, full)
+        print(f"✅ 完整快照 {full} 字節，差異 {delta} 字節")
+
+
+def test_change_kinds():
+    """變化按新增、刪除、移動、改名和其他字段分類"""
+    print("\n🏷️ 測試變化分類...")
+    with tempfile.TemporaryDirectory() as directory:
+        store = SnapshotStore(directory, checkpoint_every=2)
+        records = stations(5)
+        store.record("kinds-test", records, at=0)
+
+        changed = copy.deepcopy(records)
+        changed[0]["lat"] += 0.01
+        changed[1]["name"] = "改名站"
+        changed[2]["phone"] = "2111 1111"
+        del changed[3]
+        changed.append({"id": 99, "fsd_id": "F099", "name": "新站", "district": "北區",
+                        "phone": "", "lat": 22.5, "lng": 114.1})
+        store.record("kinds-test", changed, at=10)
+        store.record("kinds-test", records, at=20)   # 檢查點：全部改回
+
+        events = store.changes("kinds-test", since=0, until=10)
+        kinds = {(event["kind"], event["key"]) for event in events}
+        assert kinds == {(MOVED, "F000"), (RENAMED, "F001"), (UPDATED, "F002"),
+                         (REMOVED, "F003"), (ADDED, "F099")}, kinds
+        renamed = next(event for event in events if event["kind"] == RENAMED)
+        assert (renamed["before"], renamed["after"]) == ("站1", "改名站")
+        removed = next(event for event in events if event["kind"] == REMOVED)
+        assert removed["name"] == "站3"
+
+        assert len(store.changes("kinds-test")) == 10, "初次加載不算變化，兩次各5個變化"
+        assert store.diff("kinds-test", 0, 20) == [], "來回的變化互相抵消"
+        print("✅ 變化分類正確")
+
+
+def test_other_process_appends():
+    """其他進程追加的快照在下次查詢時可見"""
+    print("\n🔀 測試多進程寫入...")
+    with tempfile.TemporaryDirectory() as directory:
+        first, second = SnapshotStore(directory), SnapshotStore(directory)
+        records = stations(3)
+        first.record("shared-test", records, at=0)
+        assert second.record("shared-test", records, at=5) is None, "另一個進程已寫入相同內容"
+        records[0]["name"] = "更新"
+        second.record("shared-test", records, at=10)
+        assert first.timeline("shared-test") == [0, 10]
+        assert first.state_at("shared-test", 10)[0]["name"] == "更新"
+
+        # 多個進程同時寫入：每個進程只修改自己的站點，重放出的每個快照都應該是某個進程寫入的完整狀態
+        script = (
+            "import sys, snapshots, test_snapshots\n"
+            "index = int(sys.argv[1])\n"
+            f"store = snapshots.SnapshotStore({directory!r}, checkpoint_every=1000)\n"
+            "for n in range(20):\n"
+            "    records = test_snapshots.stations(4)\n"
+            "    records[index]['name'] = f'p{index}-{n}'\n"
+            "    store.record('race-test', records)\n"
+        )
+        root = os.path.dirname(os.path.abspath(__file__))
+        processes = [subprocess.Popen([sys.executable, "-c", script, str(i)], cwd=root) for i in range(4)]
+        assert all(process.wait(timeout=60) == 0 for process in processes)
+        written = []
+        for index in range(4):
+            for n in range(20):
+                records = stations(4)
+                records[index]["name"] = f"p{index}-{n}"
+                written.append(by_key(records))
+        timeline = first.timeline("race-test")
+        assert len(timeline) >= 20
+        for at in timeline:
+            assert by_key(first.state_at("race-test", at)) in written, f"時間 {at} 的快照混合了多個進程的狀態"
+        print(f"✅ 讀取到其他進程寫入的快照（4 個進程並發寫入 {len(timeline)} 個快照）")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+測試站點距離矩陣
+用逐對計算的大圓距離核對 top-k 排名，使用隨機坐標，不需要網絡
+"""
+
+import math
+import random
+
+import numpy as np
+
+import station_distances
+from station_distances import build_backup_index, backups_for, haversine_matrix, EARTH_RADIUS_KM
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """單對站點的大圓距離（公里）"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def random_points(rng, n, missing=()):
+    """香港範圍內的隨機坐標，missing 中的序號坐標為NaN"""
+    lats = [22.15 + rng.random() * 0.4 for _ in range(n)]
+    lngs = [113.85 + rng.random() * 0.5 for _ in range(n)]
+    for i in missing:
+        lats[i] = lngs[i] = float('nan')
+    return lats, lngs
+
+
+def brute_force(src_lats, src_lngs, row, dst_lats, dst_lngs, k, exclude_self):
+    """逐對計算後排序，跳過坐標缺失的站點"""
+    if math.isnan(src_lats[row]):
+        return []
+    pairs = [
+        (j, haversine(src_lats[row], src_lngs[row], dst_lats[j], dst_lngs[j]))
+        for j in range(len(dst_lats))
+        if not math.isnan(dst_lats[j]) and not (exclude_self and j == row)
+    ]
+    return sorted(pairs, key=lambda pair: pair[1])[:k]
+
+
+def assert_matches(ranked, expected):
+    assert [j for j, _ in ranked] == [j for j, _ in expected], (ranked, expected)
+    for (_, d), (_, e) in zip(ranked, expected):
+        assert abs(d - e) < 1e-3, (d, e)
+
+
+def test_matches_brute_force():
+    """與逐對計算的結果一致（包括NaN坐標的站點）"""
+    print("📐 測試與逐對計算一致...")
+    rng = random.Random(11)
+    fire_lats, fire_lngs = random_points(rng, 60, missing=(3, 17))
+    amb_lats, amb_lngs = random_points(rng, 40, missing=(0, 25))
+    index = build_backup_index(fire_lats, fire_lngs, amb_lats, amb_lngs, top_k=8)
+    for row in range(60):
+        ranked = backups_for(index, row)
+        assert_matches(ranked['fire_station'], brute_force(fire_lats, fire_lngs, row, fire_lats, fire_lngs, 8, True))
+        assert_matches(ranked['ambulance'], brute_force(fire_lats, fire_lngs, row, amb_lats, amb_lngs, 8, False))
+    assert backups_for(index, 3) == {'fire_station': [], 'ambulance': []}
+    print("✅ 60 個消防局的排名一致")
+
+
+def test_k_larger_than_candidates():
+    """top_k 大於候選站點數時返回全部候選站點"""
+    print("\n🔢 測試候選站點不足...")
+    rng = random.Random(5)
+    fire_lats, fire_lngs = random_points(rng, 6)
+    amb_lats, amb_lngs = random_points(rng, 3, missing=(1,))
+    index = build_backup_index(fire_lats, fire_lngs, amb_lats, amb_lngs, top_k=50)
+    assert index['fire_station'][0].shape == (6, 5)
+    assert index['ambulance'][0].shape == (6, 3)
+    for row in range(6):
+        ranked = backups_for(index, row)
+        assert_matches(ranked['fire_station'], brute_force(fire_lats, fire_lngs, row, fire_lats, fire_lngs, 50, True))
+        assert_matches(ranked['ambulance'], brute_force(fire_lats, fire_lngs, row, amb_lats, amb_lngs, 50, False))
+        assert len(ranked['ambulance']) == 2
+    assert len(backups_for(index, 0, limit=2)['fire_station']) == 2
+
+    single = build_backup_index([22.3], [114.1], [], [], top_k=10)
+    assert backups_for(single, 0) == {'fire_station': [], 'ambulance': []}
+    print("✅ 返回全部候選站點")
+
+
+def test_blocks_match_single_pass():
+    """分塊計算與一次計算整個矩陣的結果相同"""
+    print("\n🧱 測試分塊計算...")
+    rng = random.Random(3)
+    lats, lngs = random_points(rng, 50)
+    original = station_distances.BLOCK_ROWS
+    try:
+        station_distances.BLOCK_ROWS = 7
+        blocked = station_distances.nearest_k(lats, lngs, lats, lngs, 5, exclude_self=True)
+    finally:
+        station_distances.BLOCK_ROWS = original
+    single = station_distances.nearest_k(lats, lngs, lats, lngs, 5, exclude_self=True)
+    assert np.array_equal(blocked[0], single[0]) and np.array_equal(blocked[1], single[1])
+    print("✅ 分塊結果相同")
+
+
+def test_haversine_known_distance():
+    """已知距離：同一點為0，赤道上經度相差1度約111.2公里"""
+    print("\n🌏 測試大圓距離...")
+    matrix = haversine_matrix([0.0, 22.3], [0.0, 114.1], [0.0, 0.0], [0.0, 1.0])
+    assert matrix.shape == (2, 2)
+    assert matrix[0, 0] == 0
+    assert abs(matrix[0, 1] - 111.195) < 0.01, matrix[0, 1]
+    assert abs(matrix[1, 0] - haversine(22.3, 114.1, 0.0, 0.0)) < 1e-6
+    print(f"✅ 經度1度 = {matrix[0, 1]:.3f} 公里")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
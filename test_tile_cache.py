@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+測試按瓦片獲取WFS要素
+使用本地支持BBOX過濾的模擬WFS服務器，不需要訪問 portal.csdi.gov.hk
+"""
+
+import http.server
+import json
+import os
+import random
+import socketserver
+import tempfile
+import threading
+import urllib.parse
+
+import tile_cache
+from tile_cache import TileCache, TileFetcher
+
+random.seed(7)
+STATIONS = [
+    {"type": "Feature", "properties": {"OBJECTID": i, "Latitude": 22.2 + random.random() * 0.3,
+                                       "Longitude": 113.95 + random.random() * 0.35}}
+    for i in range(300)
+]
+
+
+class BBoxHandler(http.server.BaseHTTPRequestHandler):
+    """按 bbox=緯度,經度,緯度,經度,crs 過濾站點（邊界包含在內）"""
+
+    requests = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query))
+        with self.lock:
+            self.requests.append(query)
+        min_lat, min_lng, max_lat, max_lng = map(float, query['bbox'].split(',')[:4])
+        features = [
+            f for f in STATIONS
+            if min_lat <= f["properties"]["Latitude"] <= max_lat
+            and min_lng <= f["properties"]["Longitude"] <= max_lng
+        ]
+        start = int(query.get('startIndex', 0))
+        features = features[start:start + int(query.get('count', len(features)))]
+
+        body = json.dumps({"type": "FeatureCollection", "features": features}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    """啟動模擬服務器，返回 (server, base_url)"""
+    BBoxHandler.requests = []
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), BBoxHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def object_id(feature):
+    return feature["properties"]["OBJECTID"]
+
+
+def make_fetcher(base, directory, **kwargs):
+    cache = TileCache(directory=directory, **kwargs)
+    return TileFetcher('tile-test', f"{base}/wfs?service=wfs", object_id, key=lambda record: record,
+                       zoom=13, cache=cache)
+
+
+def test_tile_math():
+    """瓦片範圍包含其中心點，BBOX參數為緯度在前"""
+    print("🧮 測試瓦片計算...")
+    x, y = tile_cache.lnglat_to_tile(114.1694, 22.3193, 13)
+    min_lng, min_lat, max_lng, max_lat = tile_cache.tile_bounds(13, x, y)
+    assert min_lng <= 114.1694 < max_lng and min_lat < 22.3193 <= max_lat
+    assert tile_cache.lnglat_to_tile((min_lng + max_lng) / 2, (min_lat + max_lat) / 2, 13) == (x, y)
+
+    url = tile_cache.bbox_url("http://x/wfs?service=wfs", (114.0, 22.0, 114.5, 22.5))
+    bbox = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query))['bbox']
+    assert bbox.startswith("22.0000000,114.0000000,22.5000000,114.5000000,")
+    print("✅ 瓦片和BBOX正確")
+
+
+def test_viewport_matches_full_fetch():
+    """合併的瓦片正好包含可見範圍內的所有站點"""
+    print("\n🗺️ 測試可見範圍...")
+    server, base = start_stub_server()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            bbox = tile_cache.viewport_bbox((22.3193, 114.1694), 13, 1200, 600)
+            records = set(make_fetcher(base, directory).records_in_bbox(bbox))
+            min_lng, min_lat, max_lng, max_lat = bbox
+            visible = {
+                object_id(f) for f in STATIONS
+                if min_lat <= f["properties"]["Latitude"] <= max_lat
+                and min_lng <= f["properties"]["Longitude"] <= max_lng
+            }
+            assert visible <= records, "可見站點缺失"
+            assert len(BBoxHandler.requests) == len(set(tile_cache.tiles_for_bbox(bbox, 13)))
+            print(f"✅ {len(records)} 個站點，{len(BBoxHandler.requests)} 個瓦片請求")
+    finally:
+        server.shutdown()
+
+
+def test_pan_requests_only_new_tiles():
+    """移動地圖只請求新瓦片；內存緩存清空後從磁盤讀取"""
+    print("\n🧭 測試瓦片緩存...")
+    server, base = start_stub_server()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            fetcher = make_fetcher(base, directory)
+            first = tile_cache.viewport_bbox((22.3193, 114.1694), 14, 800, 600)
+            fetcher.records_in_bbox(first)
+            first_tiles = set(tile_cache.tiles_for_bbox(first, 13))
+            assert len(BBoxHandler.requests) == len(first_tiles)
+
+            panned = tile_cache.viewport_bbox((22.3193, 114.2200), 14, 800, 600)
+            fetcher.records_in_bbox(panned)
+            new_tiles = set(tile_cache.tiles_for_bbox(panned, 13)) - first_tiles
+            assert new_tiles, "移動後應該有新瓦片"
+            assert len(BBoxHandler.requests) == len(first_tiles) + len(new_tiles)
+
+            # 新進程（空的內存LRU）從磁盤讀取
+            requests_before = len(BBoxHandler.requests)
+            restarted = make_fetcher(base, directory)
+            restarted.records_in_bbox(first)
+            assert len(BBoxHandler.requests) == requests_before
+            assert restarted.cache.hits['disk'] == len(first_tiles)
+            print(f"✅ 移動後只請求了 {len(new_tiles)} 個新瓦片")
+    finally:
+        server.shutdown()
+
+
+def test_lru_eviction():
+    """內存LRU超過大小時淘汰最久未用的瓦片"""
+    print("\n♻️ 測試LRU淘汰...")
+    with tempfile.TemporaryDirectory() as directory:
+        cache = TileCache(directory=directory, maxsize=2)
+        for y in range(3):
+            cache.put(('lru-test', 13, 0, y), [y])
+        assert list(cache._lru) == [('lru-test', 13, 0, 1), ('lru-test', 13, 0, 2)]
+        assert cache.get(('lru-test', 13, 0, 0)) == [0]
+        assert cache.hits['disk'] == 1
+
+        # 寫入失敗時不留下臨時文件
+        try:
+            cache.put(('lru-test', 13, 0, 9), [object()])
+            raise AssertionError("無法序列化的記錄應拋出異常")
+        except TypeError:
+            pass
+        leftovers = [name for _, _, names in os.walk(directory) for name in names if name.endswith(".tmp")]
+        assert not leftovers, leftovers
+    print("✅ 淘汰後仍可從磁盤讀取")
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+測試輕量級追蹤
+不需要網絡
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+import access_log
+import tracing
+
+
+@tracing.traced("裝飾的階段")
+def decorated(seconds):
+    time.sleep(seconds)
+    return "ok"
+
+
+def test_nested_spans():
+    """嵌套的階段記錄深度和耗時，with 區塊內可以補充參數"""
+    print("🪆 測試嵌套階段...")
+    with tracing.trace("nested") as trace:
+        with tracing.span("外層") as outer:
+            time.sleep(0.02)
+            with tracing.span("內層", rows=3):
+                time.sleep(0.01)
+            outer.set(bytes=123)
+        assert decorated(0.01) == "ok"
+
+    stages = trace.stages()
+    assert [(stage["name"], stage["depth"]) for stage in stages] == [("外層", 0), ("內層", 1), ("裝飾的階段", 0)]
+    assert stages[0]["ms"] >= stages[1]["ms"] >= 10
+    assert stages[0]["args"] == {"bytes": 123} and stages[1]["args"] == {"rows": 3}
+    assert trace.seconds * 1000 >= stages[0]["ms"] + stages[2]["ms"]
+    assert tracing.current() is None
+    print("✅ 深度和耗時正確")
+
+
+def test_no_active_trace():
+    """沒有活動追蹤時不記錄，開銷很小"""
+    print("\n🪶 測試空閒開銷...")
+    assert decorated(0) == "ok"
+    with tracing.span("沒有追蹤") as span:
+        span.set(ignored=True)
+    assert span.span is None
+
+    start = time.perf_counter()
+    for _ in range(100000):
+        with tracing.span("x"):
+            pass
+    per_call = (time.perf_counter() - start) / 100000
+    assert per_call < 20e-6, per_call
+    print(f"✅ 每次 {per_call * 1e6:.2f} 微秒")
+
+
+def test_threads_have_own_stacks():
+    """不同線程的階段各自嵌套，Chrome trace 按線程分開"""
+    print("\n🧵 測試多線程...")
+    with tracing.trace("threads") as trace:
+        def work():
+            with trace.span("工作線程"):
+                time.sleep(0.01)
+
+        with tracing.span("主線程"):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+
+    depths = {stage["name"]: stage["depth"] for stage in trace.stages()}
+    assert depths == {"主線程": 0, "工作線程": 0}
+    events = tracing.chrome_trace([trace])["traceEvents"]
+    assert len({event["tid"] for event in events}) == 2
+    print("✅ 每個線程單獨嵌套")
+
+
+def test_chrome_trace_file():
+    """追加到文件的事件是有效的 Chrome trace（JSON 數組格式）"""
+    print("\n📁 測試導出文件...")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "logs", "trace.json")
+        for run in range(3):
+            with tracing.trace(f"run-{run}", path=path):
+                with tracing.span("階段"):
+                    pass
+
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        assert text.startswith("[\n")
+        # Chrome 接受省略結尾的 ]；用 json 解析前補上
+        events = json.loads(text.rstrip().rstrip(",") + "]")
+        assert [event["name"] for event in events] == ["run-0", "階段", "run-1", "階段", "run-2", "階段"]
+        assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+        run, stage = events[0], events[1]
+        assert run["ts"] <= stage["ts"] and stage["ts"] + stage["dur"] <= run["ts"] + run["dur"] + 1
+        print(f"✅ {len(events)} 個事件")
+
+        # 文件無法寫入時記錄警告，不影響頁面運行
+        events = []
+        original = access_log.event
+        access_log.event = lambda level, message, **fields: events.append((level, fields))
+        try:
+            with tracing.trace("run", path=directory):
+                pass
+        finally:
+            access_log.event = original
+        assert [(level, fields["path"]) for level, fields in events] == [("WARNING", directory)]
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
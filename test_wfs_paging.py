@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+測試WFS分頁讀取
+使用本地的模擬WFS服務器，不需要訪問 portal.csdi.gov.hk
+"""
+
+import http.server
+import json
+import socketserver
+import threading
+import urllib.parse
+
+import wfs_paging
+
+TOTAL_FEATURES = 250
+
+
+class PagingHandler(http.server.BaseHTTPRequestHandler):
+    """按 startIndex/count 返回要素；/nopaging 忽略分頁參數，總是返回完整數據集"""
+
+    requests = []
+    lock = threading.Lock()
+
+    def do_GET(self):
+        parts = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(parts.query))
+        with self.lock:
+            self.requests.append(query)
+
+        features = [
+            {"type": "Feature", "properties": {"OBJECTID": i, "Name_TC": f"站點{i}"}}
+            for i in range(TOTAL_FEATURES)
+        ]
+        if parts.path != '/nopaging':
+            start = int(query.get('startIndex', 0))
+            features = features[start:start + int(query.get('count', TOTAL_FEATURES))]
+
+        body = json.dumps({"type": "FeatureCollection", "features": features}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server():
+    """啟動模擬服務器，返回 (server, base_url)"""
+    PagingHandler.requests = []
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), PagingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def object_id(feature):
+    return feature["properties"]["OBJECTID"]
+
+
+def test_page_url():
+    """替換已有的分頁參數，保留其他參數"""
+    print("🔗 測試分頁URL...")
+    url = wfs_paging.page_url("http://x/wfs?service=wfs&count=5&typenames=A", 200, 100)
+    query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query))
+    assert query == {'service': 'wfs', 'typenames': 'A', 'startIndex': '200', 'count': '100'}
+    print("✅ 分頁參數正確")
+
+
+def test_pages_in_order():
+    """並行請求各頁，按順序產出所有要素"""
+    print("\n📄 測試分頁讀取...")
+    server, base = start_stub_server()
+    try:
+        batches = list(wfs_paging.iter_feature_batches(
+            f"{base}/wfs?service=wfs", layer='paging-test', mapper=object_id,
+            count=100, max_features=1000, concurrency=3
+        ))
+        assert [len(batch) for batch in batches] == [100, 100, 50]
+        assert [i for batch in batches for i in batch] == list(range(TOTAL_FEATURES))
+        # 第一頁單獨請求；之後最多 concurrency 頁在途，最後一頁之後已發出的請求被丟棄
+        starts = [int(query['startIndex']) for query in PagingHandler.requests]
+        assert starts[0] == 0 and {0, 100, 200} <= set(starts) and len(starts) <= 5, starts
+        assert all(query['count'] == '100' for query in PagingHandler.requests)
+        print(f"✅ {len(batches)} 頁，{TOTAL_FEATURES} 個要素，共 {len(PagingHandler.requests)} 個請求")
+    finally:
+        server.shutdown()
+
+
+def test_max_features():
+    """達到 max_features 後停止"""
+    print("\n✂️ 測試要素上限...")
+    server, base = start_stub_server()
+    try:
+        records = wfs_paging.fetch_all(f"{base}/wfs", layer='paging-test', mapper=object_id,
+                                       count=40, max_features=90, concurrency=2)
+        assert records == list(range(90))
+        assert all(int(query['startIndex']) < 90 for query in PagingHandler.requests), PagingHandler.requests
+        print("✅ 只讀取了90個要素")
+    finally:
+        server.shutdown()
+
+
+def test_server_ignores_paging():
+    """服務器不支持分頁時不重複讀取"""
+    print("\n🔁 測試不支持分頁的服務器...")
+    server, base = start_stub_server()
+    try:
+        records = wfs_paging.fetch_all(f"{base}/nopaging", layer='paging-test', mapper=object_id,
+                                       count=100, max_features=1000, concurrency=2)
+        assert records == list(range(TOTAL_FEATURES))
+        assert len(PagingHandler.requests) == 1, PagingHandler.requests
+        print("✅ 沒有重複要素")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+測試WFS錄製和回放
+使用合成夾具和本地回放服務器，不需要訪問 portal.csdi.gov.hk
+"""
+
+import json
+import tempfile
+import urllib.parse
+
+import http_pool
+import layers
+import wfs_paging
+import wfs_replay
+from layers import LAYERS
+
+
+def synthesize(directory, n=30):
+    for layer in LAYERS.values():
+        wfs_replay.save_fixture(directory, layer, wfs_replay.synthetic_features(layer, n),
+                                headers={'Content-Type': 'application/json', 'Connection': 'close'},
+                                source_url="synthetic")
+
+
+def test_layer_fetch_through_upstream_override():
+    """設置 WFS_UPSTREAM 後數據層從回放服務器分頁讀取"""
+    print("📼 測試回放...")
+    with tempfile.TemporaryDirectory() as directory:
+        synthesize(directory, n=250)
+        server = wfs_replay.start_replay_server(directory)
+        original = layers.WFS_UPSTREAM
+        try:
+            layers.WFS_UPSTREAM = server.base_url
+            layer = LAYERS['fire_station']
+            assert layer.url.startswith(server.base_url + "/server/services/")
+            records = layer.fetch()
+            assert len(records) == 250
+            assert len({r["fsd_id"] for r in records}) == 250
+            assert all(r["name"].startswith("合成消防局") for r in records)
+            assert server.requests >= 3, "應該分頁請求"
+            print(f"✅ {len(records)} 個記錄，{server.requests} 個請求")
+        finally:
+            layers.WFS_UPSTREAM = original
+            server.shutdown()
+
+
+def test_scaling_keeps_ids_unique():
+    """放大後的副本有唯一的ID，且坐標在原坐標附近"""
+    print("\n🧪 測試合成放大...")
+    features = wfs_replay.synthetic_features(LAYERS['ambulance'], 20)
+    scaled = wfs_replay.scale_features(features, 10)
+    assert len(scaled) == 200
+    for key in ("OBJECTID", "FSDID", "Name_TC"):
+        assert len({f["properties"][key] for f in scaled}) == 200, key
+    assert len({wfs_paging.feature_id(f) for f in scaled}) == 200
+    for original, copy in zip(features, scaled[20:40]):
+        assert abs(original["properties"]["Latitude"] - copy["properties"]["Latitude"]) <= wfs_replay.SCALE_OFFSET_DEGREES
+    print("✅ 200 個唯一要素")
+
+
+def test_bbox_and_paging():
+    """回放服務器支持BBOX（緯度在前）和 startIndex/count"""
+    print("\n🗺️ 測試BBOX和分頁...")
+    with tempfile.TemporaryDirectory() as directory:
+        synthesize(directory, n=100)
+        server = wfs_replay.start_replay_server(directory)
+        try:
+            url = layers.upstream_url(LAYERS['ambulance'].source_url, server.base_url)
+            everything = http_pool.get(url).json()["features"]
+            assert len(everything) == 100
+
+            page = http_pool.get(wfs_paging.page_url(url, 90, 20)).json()["features"]
+            assert [f["id"] for f in page] == [f["id"] for f in everything[90:]]
+
+            bbox_url = url + "&" + urllib.parse.urlencode({"bbox": "22.2,113.9,22.36,114.11,urn:ogc:def:crs:EPSG::4326"})
+            inside = http_pool.get(bbox_url).json()["features"]
+            expected = [f for f in everything
+                        if 22.2 <= f["properties"]["Latitude"] <= 22.36
+                        and 113.9 <= f["properties"]["Longitude"] <= 114.11]
+            assert inside == expected and 0 < len(inside) < 100
+            print(f"✅ BBOX內 {len(inside)} 個要素")
+        finally:
+            server.shutdown()
+
+
+def test_injected_failures():
+    """注入的503和截斷響應按比例出現，重放的頭部不包含逐跳頭部"""
+    print("\n💥 測試故障注入...")
+    with tempfile.TemporaryDirectory() as directory:
+        synthesize(directory)
+        with open(wfs_replay.fixture_paths(directory, 'ambulance')[1], encoding='utf-8') as f:
+            assert json.load(f)['headers'] == {'Content-Type': 'application/json'}
+
+        url = LAYERS['ambulance'].source_url
+        server = wfs_replay.start_replay_server(directory, failure_rate=0.3, seed=1)
+        try:
+            statuses = [http_pool.get(layers.upstream_url(url, server.base_url)).status for _ in range(100)]
+            assert 15 <= statuses.count(503) <= 45, statuses.count(503)
+            assert set(statuses) == {200, 503}
+        finally:
+            server.shutdown()
+
+        server = wfs_replay.start_replay_server(directory, truncate_rate=1.0)
+        try:
+            try:
+                http_pool.get(layers.upstream_url(url, server.base_url)).json()
+                raise AssertionError("截斷的響應應該失敗")
+            except AssertionError:
+                raise
+            except Exception as e:
+                print(f"   截斷響應: {type(e).__name__}")
+        finally:
+            server.shutdown()
+        print("✅ 故障按設置注入")
+
+
+def test_record_pages():
+    """逐頁錄製：每頁的狀態和頭部都寫入元數據；服務器忽略分頁參數時遇到重複頁停止"""
+    print("\n📼 測試逐頁錄製...")
+    with tempfile.TemporaryDirectory() as source, tempfile.TemporaryDirectory() as target:
+        synthesize(source, n=250)
+        server = wfs_replay.start_replay_server(source)
+        original = layers.WFS_UPSTREAM
+        try:
+            layers.WFS_UPSTREAM = server.base_url
+            layer = LAYERS['fire_station']
+            assert wfs_replay.record_layer(layer, target, count=100) == 250
+            with open(wfs_replay.fixture_paths(target, layer.name)[1], encoding='utf-8') as f:
+                meta = json.load(f)
+            assert meta['features'] == 250 and meta['status'] == 200
+            assert [(p['start_index'], p['status'], p['features']) for p in meta['pages']] == \
+                [(0, 200, 100), (100, 200, 100), (200, 200, 50)]
+            assert all(p['headers']['Content-Type'] == 'application/json' for p in meta['pages'])
+            assert all('Content-Length' not in p['headers'] for p in meta['pages'])
+
+            # 忽略 startIndex/count、每次返回完整數據集的服務器
+            select = server.data.select
+            server.data.select = lambda query: select({k: v for k, v in query.items()
+                                                       if k not in ('startindex', 'count')})
+            before = server.requests
+            assert wfs_replay.record_layer(layer, target, count=250) == 250
+            assert server.requests - before == 2
+            with open(wfs_replay.fixture_paths(target, layer.name)[1], encoding='utf-8') as f:
+                assert [p['features'] for p in json.load(f)['pages']] == [250, 0]
+            print("✅ 重複頁不再錄製")
+        finally:
+            layers.WFS_UPSTREAM = original
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    import pytest
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 按地圖瓦片獲取WFS要素
+每個 z/x/y 瓦片發出一個帶 BBOX 過濾的 GetFeature 請求，結果先放在內存LRU，
+再寫入磁盤緩存；地圖移動時只需請求以前沒見過的瓦片（只需Python 3標準庫）
+"""
+
+import gzip
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import access_log
+import metrics
+import wfs_paging
+
+# 配置（見 .env.example）
+TILE_ZOOM = int(os.environ.get("TILE_ZOOM", "13"))
+TILE_CACHE_SIZE = int(os.environ.get("TILE_CACHE_SIZE", "256"))
+TILE_CACHE_DIR = os.environ.get("TILE_CACHE_DIR", os.path.join("data", "tiles"))
+TILE_TTL_SECONDS = float(os.environ.get("TILE_TTL_SECONDS", "3600"))
+TILE_CONCURRENCY = int(os.environ.get("TILE_CONCURRENCY", "4"))
+
+# Web墨卡托的緯度範圍
+MAX_LATITUDE = 85.05112878
+TILE_PIXELS = 256
+
+
+def lnglat_to_tile(lng, lat, z):
+    """經緯度所在的瓦片 (x, y)"""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    n = 2 ** z
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(z, x, y):
+    """瓦片的經緯度範圍 (min_lng, min_lat, max_lng, max_lat)"""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return (x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y))
+
+
+def tiles_for_bbox(bbox, z):
+    """覆蓋範圍 (min_lng, min_lat, max_lng, max_lat) 的所有瓦片"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    x0, y0 = lnglat_to_tile(min_lng, max_lat, z)
+    x1, y1 = lnglat_to_tile(max_lng, min_lat, z)
+    return [(z, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+
+def viewport_bbox(center, zoom, width, height):
+    """以 center=(lat, lng) 為中心、width×height 像素的地圖在 zoom 級別下的範圍"""
+    lat, lng = center
+    world = TILE_PIXELS * 2 ** zoom
+    cx = (lng + 180.0) / 360.0 * world
+    cy = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * world
+
+    def to_lnglat(px, py):
+        return (px / world * 360.0 - 180.0,
+                math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * py / world)))))
+
+    min_lng, max_lat = to_lnglat(cx - width / 2, cy - height / 2)
+    max_lng, min_lat = to_lnglat(cx + width / 2, cy + height / 2)
+    return (min_lng, min_lat, max_lng, max_lat)
+
+
+def bbox_url(url, bounds):
+    """在GetFeature URL上加入BBOX過濾
+
+    WFS 2.0 的 EPSG:4326 軸順序是緯度在前，所以用URN明確指定坐標系。
+    """
+    min_lng, min_lat, max_lng, max_lat = bounds
+    parts = urllib.parse.urlsplit(url)
+    query = [
+        (key, value) for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() != 'bbox'
+    ]
+    query.append(('bbox', f"{min_lat:.7f},{min_lng:.7f},{max_lat:.7f},{max_lng:.7f},urn:ogc:def:crs:EPSG::4326"))
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+
+class TileCache:
+    """瓦片緩存：內存LRU + 磁盤（gzip JSON），超過 ttl 秒的瓦片視為過期"""
+
+    def __init__(self, directory=TILE_CACHE_DIR, maxsize=TILE_CACHE_SIZE, ttl=TILE_TTL_SECONDS):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lru = OrderedDict()   # key -> (records, fetched_at)
+        self._lock = threading.Lock()
+        self.hits = {'memory': 0, 'disk': 0, 'miss': 0}
+
+    def _path(self, key):
+        layer, z, x, y = key
+        return os.path.join(self.directory, layer, str(z), str(x), f"{y}.json.gz")
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._lru[key] = entry
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+
+    def get(self, key):
+        """返回瓦片記錄；沒有緩存或已過期時返回None"""
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None and time.time() - entry[1] < self.ttl:
+                self._lru.move_to_end(key)
+                self.hits['memory'] += 1
+                metrics.CACHE_REQUESTS.inc(cache='tile', result='memory')
+                return entry[0]
+
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) < self.ttl:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    records = json.load(f)
+                self._remember(key, (records, os.path.getmtime(path)))
+                with self._lock:
+                    self.hits['disk'] += 1
+                metrics.CACHE_REQUESTS.inc(cache='tile', result='disk')
+                return records
+        except (OSError, ValueError):
+            # 沒有磁盤緩存，或文件損壞（重新獲取後覆蓋）
+            pass
+
+        with self._lock:
+            self.hits['miss'] += 1
+        metrics.CACHE_REQUESTS.inc(cache='tile', result='miss')
+        return None
+
+    def put(self, key, records):
+        """保存瓦片記錄（先寫臨時文件再替換，其他進程不會讀到寫了一半的文件）"""
+        self._remember(key, (records, time.time()))
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as f:
+                    json.dump(records, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            # 磁盤緩存只是加速，寫入失敗不影響結果
+            access_log.event('WARNING', f"⚠️ 無法寫入瓦片緩存 {path}: {e}", layer=key[0])
+
+
+# 進程內共享的瓦片緩存（Streamlit每次重新運行腳本時模塊不會重新導入）
+shared_cache = TileCache()
+
+
+class TileFetcher:
+    """按瓦片獲取一個WFS數據層
+
+    mapper 把要素轉換為記錄（必須可JSON序列化），key 從記錄中取出唯一標識，
+    用於合併時去掉落在瓦片邊界上、同時出現在兩個瓦片中的要素。
+    """
+
+    def __init__(self, layer, url, mapper, key, fields=None, zoom=TILE_ZOOM, cache=None):
+        self.layer = layer
+        self.url = url
+        self.mapper = mapper
+        self.key = key
+        self.fields = fields
+        self.zoom = zoom
+        self.cache = cache or shared_cache
+
+    def fetch_tile(self, z, x, y):
+        """獲取單個瓦片（先查緩存）"""
+        cache_key = (self.layer, z, x, y)
+        records = self.cache.get(cache_key)
+        if records is None:
+            url = bbox_url(self.url, tile_bounds(z, x, y))
+            # 瓦片之間已經並行，瓦片內按順序翻頁，避免為只有一頁的瓦片預先請求空頁
+            records = wfs_paging.fetch_all(url, self.layer, self.mapper, fields=self.fields, concurrency=1)
+            self.cache.put(cache_key, records)
+        return records
+
+    def records_in_bbox(self, bbox):
+        """合併覆蓋範圍內所有瓦片的記錄；沒有緩存的瓦片並行獲取"""
+        tiles = tiles_for_bbox(bbox, self.zoom)
+        with ThreadPoolExecutor(max_workers=TILE_CONCURRENCY, thread_name_prefix=f"tile-{self.layer}") as executor:
+            results = list(executor.map(lambda tile: self.fetch_tile(*tile), tiles))
+
+        merged = {}
+        for records in results:
+            for record in records:
+                merged.setdefault(self.key(record), record)
+        return list(merged.values())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - 輕量級追蹤
+trace() 為一次頁面運行建立追蹤，其中的 span() 或 @traced 記錄嵌套的階段耗時；
+沒有活動追蹤時 span() 幾乎沒有開銷。追蹤可以導出為 Chrome trace 格式
+（chrome://tracing 或 https://ui.perfetto.dev 打開），設置 TRACE_FILE 時每次運行自動追加
+（只需Python 3標準庫）
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import access_log
+
+# 設置後每個追蹤都追加到該文件（Chrome trace 的 JSON 數組格式，見 .env.example）
+TRACE_FILE = os.environ.get("TRACE_FILE", "")
+
+_current = contextvars.ContextVar("trace", default=None)
+_file_lock = threading.Lock()
+
+
+class Span:
+    """一個已完成或進行中的階段"""
+
+    __slots__ = ("name", "start", "end", "depth", "thread", "args")
+
+    def __init__(self, name, start, depth, thread, args):
+        self.name = name
+        self.start = start
+        self.end = None
+        self.depth = depth
+        self.thread = thread
+        self.args = args
+
+    @property
+    def seconds(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+class _SpanContext:
+    """span() 返回的上下文管理器；with 區塊內可以用 .set(key=value) 補充參數"""
+
+    __slots__ = ("_trace", "_name", "_args", "span")
+
+    def __init__(self, trace, name, args):
+        self._trace = trace
+        self._name = name
+        self._args = args
+        self.span = None
+
+    def set(self, **args):
+        if self.span is not None:
+            self.span.args.update(args)
+
+    def __enter__(self):
+        if self._trace is not None:
+            self.span = self._trace._open(self._name, self._args)
+        return self
+
+    def __exit__(self, *exc):
+        if self.span is not None:
+            self._trace._close(self.span)
+        return False
+
+
+class Trace:
+    """一次運行的所有階段（按開始時間排列）"""
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+        self.thread = threading.get_ident()
+        self.spans = []
+        self._stacks = {}     # 線程 -> 進行中的階段
+        self._lock = threading.Lock()
+
+    def _open(self, name, args):
+        thread = threading.get_ident()
+        with self._lock:
+            stack = self._stacks.setdefault(thread, [])
+            span = Span(name, time.perf_counter(), len(stack), thread, dict(args))
+            stack.append(span)
+            self.spans.append(span)
+        return span
+
+    def _close(self, span):
+        span.end = time.perf_counter()
+        with self._lock:
+            stack = self._stacks.get(span.thread, [])
+            if stack and stack[-1] is span:
+                stack.pop()
+
+    def span(self, name, **args):
+        return _SpanContext(self, name, args)
+
+    @property
+    def seconds(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def stages(self):
+        """[{name, depth, ms, args}]，進行中的階段計到現在"""
+        with self._lock:
+            spans = list(self.spans)
+        return [{"name": span.name, "depth": span.depth, "ms": span.seconds * 1000, "args": dict(span.args)}
+                for span in spans]
+
+    def chrome_events(self, pid=None):
+        """Chrome trace 的完整事件（ph="X"，時間單位微秒）"""
+        pid = os.getpid() if pid is None else pid
+        offset = self.wall_start * 1e6 - self.start * 1e6
+        with self._lock:
+            spans = list(self.spans)
+        events = [{"name": self.name, "cat": "run", "ph": "X", "pid": pid, "tid": self.thread,
+                   "ts": self.start * 1e6 + offset, "dur": self.seconds * 1e6, "args": {}}]
+        for span in spans:
+            events.append({"name": span.name, "cat": self.name, "ph": "X", "pid": pid, "tid": span.thread,
+                           "ts": span.start * 1e6 + offset, "dur": span.seconds * 1e6,
+                           "args": dict(span.args)})
+        return events
+
+
+@contextmanager
+def trace(name, path=None):
+    """為 with 區塊建立追蹤並設為當前追蹤；結束時如設置了 path（默認 TRACE_FILE）則追加到文件"""
+    item = Trace(name)
+    token = _current.set(item)
+    try:
+        yield item
+    finally:
+        item.end = time.perf_counter()
+        _current.reset(token)
+        path = TRACE_FILE if path is None else path
+        if path:
+            try:
+                append_chrome_trace(path, item)
+            except OSError as e:
+                access_log.event('WARNING', f"⚠️ 寫入追蹤文件失敗: {e}", path=path, error=str(e))
+
+
+def current():
+    """當前的追蹤，沒有時返回None"""
+    return _current.get()
+
+
+def span(name, **args):
+    """在當前追蹤中記錄一個階段（沒有活動追蹤時不記錄）"""
+    return _SpanContext(_current.get(), name, args)
+
+
+def traced(name=None):
+    """裝飾器：把函數調用記錄為一個階段"""
+
+    def decorate(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(label):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+def chrome_trace(traces, pid=None):
+    """多個追蹤合併為 Chrome trace JSON 對象"""
+    events = []
+    for item in traces:
+        events.extend(item.chrome_events(pid))
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def append_chrome_trace(path, item):
+    """把一個追蹤追加到 JSON 數組格式的文件（Chrome 允許省略結尾的 ]，文件可以一直追加）"""
+    lines = "".join(json.dumps(event, ensure_ascii=False, default=str) + ",\n" for event in item.chrome_events())
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with _file_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            if f.tell() == 0:
+                f.write("[\n")
+            f.write(lines)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - WFS分頁讀取
+用 startIndex/count 分頁並行請求 GetFeature，每頁從socket增量解析為記錄，
+不保留原始響應，按頁產出記錄批次，內存不隨數據層大小增長（只需Python 3標準庫）
+"""
+
+import math
+import os
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import geojson_stream
+import metrics
+import resilient_fetch
+
+# 每頁要素數和每個數據層的要素上限（見 .env.example）
+DEFAULT_COUNT = int(os.environ.get("DEFAULT_COUNT", "100"))
+MAX_FEATURES = int(os.environ.get("MAX_FEATURES", "1000"))
+
+# 每個數據層同時在途的頁數
+PAGE_CONCURRENCY = int(os.environ.get("WFS_PAGE_CONCURRENCY", "4"))
+
+
+def page_url(url, start_index, count):
+    """在GetFeature URL上設置分頁參數（替換已有的 startIndex/count）"""
+    parts = urllib.parse.urlsplit(url)
+    query = [
+        (key, value) for key, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in ('startindex', 'count', 'maxfeatures')
+    ]
+    query += [('startIndex', str(start_index)), ('count', str(count))]
+    return urllib.parse.urlunsplit(parts._replace(query=urllib.parse.urlencode(query)))
+
+
+def feature_id(feature):
+    """要素的唯一標識，用於檢測服務器忽略分頁參數時的重複頁"""
+    props = feature.get("properties") or {}
+    return feature.get("id") or props.get("OBJECTID") or props.get("FSDID")
+
+
+def fetch_page(url, layer, start_index, count, mapper=None, fields=None):
+    """獲取一頁並邊讀取邊轉換為記錄，返回 (記錄列表, 要素ID列表)"""
+
+    def consume(response):
+        reader = metrics.MeteredReader(response)
+        start = time.perf_counter()
+        records, ids = [], []
+        for feature in geojson_stream.iter_features(reader, fields):
+            ids.append(feature_id(feature))
+            records.append(mapper(feature) if mapper else feature)
+        metrics.UPSTREAM_BYTES.inc(reader.bytes, layer=layer)
+        metrics.PARSE_SECONDS.observe(time.perf_counter() - start - reader.seconds, layer=layer)
+        return records, ids
+
+    return resilient_fetch.fetch_stream(page_url(url, start_index, count), layer, consume)
+
+
+def iter_feature_batches(url, layer=None, mapper=None, count=DEFAULT_COUNT,
+                         max_features=MAX_FEATURES, concurrency=PAGE_CONCURRENCY, fields=None):
+    """按頁順序產出記錄批次
+
+    第一頁是滿頁時才並行請求後續頁，同時最多有 concurrency 頁在途；某一頁少於 count 個要素（最後一頁）、
+    達到 max_features，或服務器返回重複要素（不支持分頁）時停止。
+    mapper 把單個要素轉換為記錄，為None時產出原始要素；
+    fields 不為None時解析時只保留這些屬性字段。
+    """
+    max_pages = max(1, math.ceil(max_features / count))
+    remaining = max_features
+    seen = set()
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f"wfs-{layer}") as executor:
+        futures = {}
+        next_page = 0
+
+        def submit():
+            nonlocal next_page
+            futures[next_page] = executor.submit(
+                fetch_page, url, layer, next_page * count, count, mapper, fields
+            )
+            next_page += 1
+
+        # 先單獨請求第一頁：大多數數據層一頁就能讀完，不必預先請求空頁
+        submit()
+
+        page = 0
+        try:
+            while page in futures:
+                records, ids = futures.pop(page).result()
+                page += 1
+
+                # 服務器忽略分頁參數時，每頁都是完整數據集
+                fresh = [i for i, fid in enumerate(ids) if fid is None or fid not in seen]
+                seen.update(fid for fid in ids if fid is not None)
+                if len(fresh) != len(records):
+                    records = [records[i] for i in fresh]
+
+                last_page = len(ids) != count or not fresh
+                if len(records) >= remaining:
+                    records, last_page = records[:remaining], True
+                remaining -= len(records)
+
+                if not last_page:
+                    while len(futures) < concurrency and next_page < max_pages:
+                        submit()
+                if records:
+                    yield records
+                if last_page:
+                    break
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+
+def fetch_all(url, layer=None, mapper=None, **kwargs):
+    """讀取整個數據層，返回記錄列表"""
+    records = []
+    for batch in iter_feature_batches(url, layer, mapper, **kwargs):
+        records.extend(batch)
+    return records
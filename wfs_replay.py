@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+香港消防處服務儀表板 - WFS錄製和回放
+record 把上游響應（頭部和要素）保存到本地夾具目錄；serve 用本地模擬WFS服務器回放，
+支持 startIndex/count 分頁、BBOX過濾、注入延遲和故障，並可把要素按倍數合成放大；
+設置 WFS_UPSTREAM 後所有入口都從回放服務器讀取，不需要訪問 portal.csdi.gov.hk
+（只需Python 3標準庫）
+
+用法:
+    python wfs_replay.py record                       # 錄製所有已註冊的數據層
+    python wfs_replay.py synthesize --features 100    # 沒有網絡時生成合成夾具
+    python wfs_replay.py serve --port 8765 --scale 10 --latency 0.05 --failure-rate 0.02
+    WFS_UPSTREAM=http://127.0.0.1:8765 streamlit run app.py
+"""
+
+import argparse
+import http.server
+import json
+import os
+import random
+import socketserver
+import threading
+import time
+import urllib.parse
+from datetime import datetime
+
+import http_pool
+import wfs_paging
+from layers import LAYERS
+
+# 夾具目錄（見 .env.example）
+WFS_FIXTURE_DIR = os.environ.get("WFS_FIXTURE_DIR", os.path.join("fixtures", "wfs"))
+
+# 回放時不重放的逐跳頭部和與響應內容綁定的頭部
+_SKIPPED_HEADERS = {'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'date', 'server'}
+
+# 合成副本的坐標偏移範圍（度，約1公里）
+SCALE_OFFSET_DEGREES = 0.01
+
+
+def fixture_paths(directory, layer_name):
+    """數據層的 (要素文件, 元數據文件) 路徑"""
+    return (os.path.join(directory, f"{layer_name}.geojson"),
+            os.path.join(directory, f"{layer_name}.meta.json"))
+
+
+def _recorded_headers(headers):
+    return {k: v for k, v in (headers or {}).items() if k.lower() not in _SKIPPED_HEADERS}
+
+
+def save_fixture(directory, layer, features, status=200, headers=None, source_url=None, pages=None):
+    """保存數據層夾具
+
+    status/headers 為回放時使用的響應狀態和頭部；pages 為逐頁錄製的
+    [{'start_index', 'status', 'headers', 'features'}]（只作記錄，回放不使用）。
+    """
+    os.makedirs(directory, exist_ok=True)
+    features_path, meta_path = fixture_paths(directory, layer.name)
+    with open(features_path, 'w', encoding='utf-8') as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f, ensure_ascii=False)
+    meta = {
+        'layer': layer.name,
+        'typename': layer.typename,
+        'source_url': source_url or layer.source_url,
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'status': status,
+        'headers': _recorded_headers(headers),
+        'features': len(features),
+    }
+    if pages is not None:
+        meta['pages'] = [dict(page, headers=_recorded_headers(page.get('headers'))) for page in pages]
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return features_path
+
+
+def record_layer(layer, directory=WFS_FIXTURE_DIR, count=wfs_paging.DEFAULT_COUNT, max_features=100000):
+    """逐頁錄製一個數據層的上游響應，返回要素數
+
+    與 wfs_paging 相同，某一頁少於 count 個要素，或整頁都是已錄製的要素（服務器忽略分頁參數）時停止；
+    每一頁的狀態和頭部都記錄在元數據的 pages 中。
+    """
+    features, pages, seen = [], [], set()
+    start = 0
+    while start < max_features:
+        response = http_pool.get(wfs_paging.page_url(layer.url, start, count))
+        page_meta = {'start_index': start, 'status': response.status, 'headers': response.headers}
+        pages.append(page_meta)
+        if response.status != 200:
+            raise RuntimeError(f"{layer.label}: HTTP {response.status}（第 {len(pages)} 頁）")
+        page = response.json().get("features", [])
+        ids = [wfs_paging.feature_id(feature) for feature in page]
+        fresh = [feature for feature, fid in zip(page, ids) if fid is None or fid not in seen]
+        seen.update(fid for fid in ids if fid is not None)
+        page_meta['features'] = len(fresh)
+        features.extend(fresh)
+        start += count
+        if len(page) < count or not fresh:
+            break
+    first = pages[0]
+    save_fixture(directory, layer, features, first['status'], first['headers'], layer.url, pages)
+    return len(features)
+
+
+def synthetic_features(layer, n, seed=0):
+    """與消防處站點數據層結構相同的合成要素（沒有網絡時用於測試）"""
+    rng = random.Random(f"{layer.name}-{seed}")
+    districts = ["中西區", "灣仔區", "東區", "南區", "油尖旺區", "深水埗區", "九龍城區", "黃大仙區",
+                 "觀塘區", "葵青區", "荃灣區", "屯門區", "元朗區", "北區", "大埔區", "沙田區", "西貢區", "離島區"]
+    prefix = layer.typename[:1] or "X"
+    features = []
+    for i in range(n):
+        lat = round(22.20 + rng.random() * 0.32, 6)
+        lng = round(113.90 + rng.random() * 0.42, 6)
+        district = districts[i % len(districts)]
+        features.append({
+            "type": "Feature",
+            "id": f"{layer.typename}.{i + 1}",
+            "geometry": {"type": "Point", "coordinates": [lng, lat]},
+            "properties": {
+                "OBJECTID": i + 1,
+                "FSDID": f"{prefix}{i + 1:03d}",
+                "Name_TC": f"合成{layer.label}{i + 1}",
+                "Name_ENG": f"Synthetic {layer.name} {i + 1}",
+                "Address_TC": f"香港{district}測試道{i + 1}號",
+                "Address_ENG": f"{i + 1} Test Road",
+                "District_TC": district,
+                "District_ENG": district,
+                "Telephone": f"2{rng.randrange(10 ** 7):07d}",
+                "Latitude": lat,
+                "Longitude": lng,
+            },
+        })
+    return features
+
+
+def scale_features(features, factor, seed=0):
+    """把要素合成放大 factor 倍：副本在原坐標附近隨機偏移，ID和名稱加上副本編號"""
+    if factor <= 1:
+        return list(features)
+    rng = random.Random(seed)
+    stride = 1 + max((f.get("properties", {}).get("OBJECTID") or 0 for f in features), default=0)
+    scaled = list(features)
+    for copy in range(1, factor):
+        for feature in features:
+            props = dict(feature.get("properties") or {})
+            dlat = rng.uniform(-SCALE_OFFSET_DEGREES, SCALE_OFFSET_DEGREES)
+            dlng = rng.uniform(-SCALE_OFFSET_DEGREES, SCALE_OFFSET_DEGREES)
+            if isinstance(props.get("Latitude"), (int, float)) and isinstance(props.get("Longitude"), (int, float)):
+                props["Latitude"] = round(props["Latitude"] + dlat, 6)
+                props["Longitude"] = round(props["Longitude"] + dlng, 6)
+            if isinstance(props.get("OBJECTID"), int):
+                props["OBJECTID"] += copy * stride
+            for key in ("FSDID", "Name_TC", "Name_ENG"):
+                if props.get(key):
+                    props[key] = f"{props[key]}-{copy}"
+            clone = dict(feature, properties=props)
+            if feature.get("id") is not None:
+                clone["id"] = f"{feature['id']}-{copy}"
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "Point":
+                lng, lat = geometry["coordinates"][:2]
+                clone["geometry"] = {"type": "Point", "coordinates": [round(lng + dlng, 6), round(lat + dlat, 6)]}
+            scaled.append(clone)
+    return scaled
+
+
+def feature_lnglat(feature):
+    """要素的經緯度（優先用點幾何，否則用屬性）"""
+    geometry = feature.get("geometry") or {}
+    if geometry.get("type") == "Point":
+        return geometry["coordinates"][0], geometry["coordinates"][1]
+    props = feature.get("properties") or {}
+    return props.get("Longitude"), props.get("Latitude")
+
+
+class ReplayData:
+    """回放服務器的數據：typename -> (要素列表, 元數據)"""
+
+    def __init__(self, directory=WFS_FIXTURE_DIR, scale=1, seed=0):
+        self.layers = {}
+        for name, layer in LAYERS.items():
+            features_path, meta_path = fixture_paths(directory, name)
+            if not os.path.exists(features_path):
+                continue
+            with open(features_path, encoding='utf-8') as f:
+                features = json.load(f).get("features", [])
+            meta = {}
+            if os.path.exists(meta_path):
+                with open(meta_path, encoding='utf-8') as f:
+                    meta = json.load(f)
+            typename = meta.get('typename') or layer.typename
+            self.layers[typename.lower()] = (scale_features(features, scale, seed), meta)
+
+    def select(self, query):
+        """按GetFeature參數選出要素；找不到數據層時返回None"""
+        entry = self.layers.get((query.get('typenames') or query.get('typename') or '').lower())
+        if entry is None:
+            return None, None
+        features, meta = entry
+        if 'bbox' in query:
+            # 與 tile_cache.bbox_url 一致：緯度,經度,緯度,經度[,坐標系]
+            min_lat, min_lng, max_lat, max_lng = map(float, query['bbox'].split(',')[:4])
+            features = [
+                f for f in features
+                for lng, lat in [feature_lnglat(f)]
+                if lat is not None and lng is not None
+                and min_lat <= lat <= max_lat and min_lng <= lng <= max_lng
+            ]
+        start = int(query.get('startindex', 0))
+        if 'count' in query or 'maxfeatures' in query:
+            features = features[start:start + int(query.get('count') or query.get('maxfeatures'))]
+        else:
+            features = features[start:]
+        return features, meta
+
+
+class ReplayHandler(http.server.BaseHTTPRequestHandler):
+    """回放GetFeature請求；延遲和故障按服務器的設置注入"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            roll = server.rng.random()
+            truncate_roll = server.rng.random()
+            delay = server.latency + server.rng.uniform(0, server.latency_jitter)
+
+        if delay > 0:
+            time.sleep(delay)
+        if roll < server.failure_rate:
+            with server.lock:
+                server.failures += 1
+            return self.send_error(503, "Injected failure")
+
+        query = {key.lower(): value for key, value in
+                 urllib.parse.parse_qsl(urllib.parse.urlsplit(self.path).query)}
+        features, meta = server.data.select(query)
+        if features is None:
+            return self.send_error(404, "Unknown typenames")
+
+        body = json.dumps({"type": "FeatureCollection", "features": features},
+                          ensure_ascii=False).encode('utf-8')
+        self.send_response(meta.get('status', 200))
+        headers = dict(meta.get('headers') or {})
+        headers.setdefault('Content-Type', 'application/json; charset=utf-8')
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if truncate_roll < server.truncate_rate:
+            # 只發送一半內容後斷開連接
+            with server.lock:
+                server.failures += 1
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """本地模擬WFS服務器"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, data, latency=0.0, latency_jitter=0.0,
+                 failure_rate=0.0, truncate_rate=0.0, seed=0):
+        super().__init__(address, ReplayHandler)
+        self.data = data
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.truncate_rate = truncate_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_replay_server(directory=WFS_FIXTURE_DIR, port=0, host="127.0.0.1", scale=1, **options):
+    """在後台線程啟動回放服務器，返回 ReplayServer（用 .base_url 作為 WFS_UPSTREAM）"""
+    server = ReplayServer((host, port), ReplayData(directory, scale, options.get('seed', 0)), **options)
+    threading.Thread(target=server.serve_forever, daemon=True, name="wfs-replay").start()
+    return server
+
+
+def main():
+    """主函數"""
+    parser = argparse.ArgumentParser(description="WFS響應錄製和回放")
+    parser.add_argument("--dir", default=WFS_FIXTURE_DIR, help="夾具目錄")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="錄製上游響應")
+    record.add_argument("--layers", nargs="+", choices=sorted(LAYERS), default=list(LAYERS))
+
+    synthesize = commands.add_parser("synthesize", help="生成合成夾具（不需要網絡）")
+    synthesize.add_argument("--layers", nargs="+", choices=sorted(LAYERS), default=list(LAYERS))
+    synthesize.add_argument("--features", type=int, default=100, help="每個數據層的要素數")
+
+    serve = commands.add_parser("serve", help="啟動回放服務器")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--scale", type=int, default=1, help="要素放大倍數，例如 10 或 1000")
+    serve.add_argument("--latency", type=float, default=0.0, help="每個請求的固定延遲（秒）")
+    serve.add_argument("--latency-jitter", type=float, default=0.0, help="額外的隨機延遲上限（秒）")
+    serve.add_argument("--failure-rate", type=float, default=0.0, help="返回503的比例")
+    serve.add_argument("--truncate-rate", type=float, default=0.0, help="發送一半內容後斷開的比例")
+    serve.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        for name in args.layers:
+            layer = LAYERS[name]
+            print(f"📼 錄製{layer.label}: {layer.url}")
+            print(f"   ✅ {record_layer(layer, args.dir)} 個要素")
+        return
+
+    if args.command == "synthesize":
+        for name in args.layers:
+            layer = LAYERS[name]
+            path = save_fixture(args.dir, layer, synthetic_features(layer, args.features), source_url="synthetic")
+            print(f"🧪 {layer.label}: {args.features} 個合成要素 -> {path}")
+        return
+
+    data = ReplayData(args.dir, args.scale, args.seed)
+    if not data.layers:
+        print(f"❌ {args.dir} 中沒有夾具，請先運行 record 或 synthesize")
+        exit(1)
+    server = ReplayServer((args.host, args.port), data, latency=args.latency,
+                          latency_jitter=args.latency_jitter, failure_rate=args.failure_rate,
+                          truncate_rate=args.truncate_rate, seed=args.seed)
+    print("=" * 50)
+    print("  WFS回放服務器")
+    print("=" * 50)
+    for typename, (features, meta) in data.layers.items():
+        print(f"  {meta.get('layer', typename)}: {len(features):,} 個要素（錄製於 {meta.get('recorded_at', '未知')}）")
+    print(f"🌐 {server.base_url}")
+    print(f"   WFS_UPSTREAM={server.base_url} streamlit run app.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n🛑 已停止（共 {server.requests} 個請求，注入 {server.failures} 次故障）")
+
+
+if __name__ == "__main__":
+    main()